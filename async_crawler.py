@@ -0,0 +1,302 @@
+import asyncio
+import logging
+import random
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from functools import partial
+from urllib.parse import urljoin, urlparse
+import requests
+from metrics import metrics
+from http_extract import build_page_url, create_session, extract_listings_from_html, extract_product_from_html, parse_pagination
+
+logger = logging.getLogger(__name__)
+
+# Statuses that mean "try again later" rather than "this page is broken"
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+LINK_TAG_PATTERN = re.compile(r'<link\b[^>]*>', re.I)
+REL_NEXT_PATTERN = re.compile(r'\brel=["\']next["\']', re.I)
+HREF_PATTERN = re.compile(r'\bhref=["\']([^"\']+)["\']', re.I)
+
+def find_next_page_url(page_html, page_url):
+    """Return the absolute URL of the page's rel="next" link, or None on the last page"""
+    for tag in LINK_TAG_PATTERN.findall(page_html):
+        if REL_NEXT_PATTERN.search(tag):
+            href = HREF_PATTERN.search(tag)
+            if href:
+                return urljoin(page_url, href.group(1).replace("&amp;", "&"))
+    return None
+
+def retry_after_seconds(response):
+    """Parse a Retry-After header given in seconds or as an HTTP date"""
+    value = response.headers.get("Retry-After") if response is not None else None
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+class TokenBucket:
+    """Token bucket that allows `rate` requests per second with bursts of up to `capacity`"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class HostLimiter:
+    """Caps in-flight requests and request rate for a single host.
+
+    A 429 response pauses every request to the host, not just the one that
+    was throttled, until the back-off has passed.
+    """
+
+    def __init__(self, max_concurrency, requests_per_second, burst=None):
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.bucket = TokenBucket(requests_per_second, burst)
+        self.paused_until = 0.0
+
+    def pause(self, seconds):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    async def __aenter__(self):
+        await self.semaphore.acquire()
+        try:
+            delay = self.paused_until - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await self.bucket.acquire()
+        except BaseException:
+            self.semaphore.release()
+            raise
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.semaphore.release()
+
+class AsyncCrawler:
+    """Concurrent, rate-limited crawl of listing and product pages without a browser.
+
+    Requests go through the pooled keep-alive session from http_extract on a
+    thread executor, while asyncio schedules them: each host gets at most
+    max_concurrency_per_host requests in flight and requests_per_second from a
+    token bucket. 429 and 5xx responses are retried with exponential back-off,
+    honouring Retry-After. With an archive (html_archive.HtmlArchive), the
+    HTML of every page fetched is saved to it.
+    """
+
+    def __init__(self, max_concurrency_per_host=4, requests_per_second=2.0, burst=None, max_retries=4,
+                 backoff_base=1.0, backoff_max=60.0, timeout=15, session=None, max_threads=32, archive=None):
+        self.max_concurrency_per_host = max_concurrency_per_host
+        self.requests_per_second = requests_per_second
+        self.burst = burst
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.session = session or create_session(pool_size=max_concurrency_per_host)
+        self.max_threads = max_threads
+        self.archive = archive
+        self.stats = {"requests": 0, "retries": 0, "failures": 0, "missed_pages": 0, "statuses": {}}
+        self._limiters = {}
+        self._limiters_loop = None
+        self._executor = None
+
+    def _limiter(self, url):
+        loop = asyncio.get_running_loop()
+        if self._limiters_loop is not loop:
+            # Semaphores and locks belong to the event loop they are used on, so every asyncio.run gets new ones
+            self._limiters = {}
+            self._limiters_loop = loop
+        host = urlparse(url).netloc
+        if host not in self._limiters:
+            self._limiters[host] = HostLimiter(self.max_concurrency_per_host, self.requests_per_second, self.burst)
+        return self._limiters[host]
+
+    def _backoff(self, attempt, response):
+        delay = retry_after_seconds(response)
+        if delay is None:
+            delay = self.backoff_base * (2 ** attempt) * (1 + random.random() * 0.25)
+        return min(delay, self.backoff_max)
+
+    async def _run(self, func, *args, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, partial(func, *args, **kwargs))
+
+    async def fetch(self, url, page_type="page"):
+        """Fetch a page's HTML, retrying throttled and failed requests; returns None when it gives up"""
+        limiter = self._limiter(url)
+        for attempt in range(self.max_retries + 1):
+            response = None
+            async with limiter:
+                self.stats["requests"] += 1
+                started = time.perf_counter()
+                try:
+                    response = await self._run(self.session.get, url, timeout=self.timeout)
+                except requests.RequestException as e:
+                    logger.warning(f"Request to {url} failed: {str(e)}")
+                metrics.observe("scraper_http_fetch_seconds", time.perf_counter() - started, page_type=page_type)
+
+            if response is not None:
+                self.stats["statuses"][response.status_code] = self.stats["statuses"].get(response.status_code, 0) + 1
+                metrics.incr("scraper_http_responses_total", status=response.status_code)
+                if response.ok:
+                    return response.text
+                if response.status_code not in RETRY_STATUSES:
+                    logger.warning(f"Giving up on {url}: HTTP {response.status_code}")
+                    break
+
+            if attempt < self.max_retries:
+                delay = self._backoff(attempt, response)
+                if response is not None and response.status_code == 429:
+                    limiter.pause(delay)
+                self.stats["retries"] += 1
+                await asyncio.sleep(delay)
+
+        self.stats["failures"] += 1
+        return None
+
+    async def _archive(self, page_html, url, page_type, **context):
+        if self.archive is not None:
+            await self._run(self.archive.put, page_html, url, page_type, source="http", **context)
+
+    async def crawl_product(self, listing):
+        """Fetch and extract one product page, returning None if it could not be used"""
+        started = time.perf_counter()
+        page_html = await self.fetch(listing["url"], page_type="product")
+        if page_html is None:
+            metrics.incr("scraper_products_total", method="async", result="error", reason="fetch_failed")
+            return None
+        await self._archive(page_html, listing["url"], "product", listing=listing)
+        product_data = await self._run(extract_product_from_html, page_html, listing["url"], listing["product_id"], listing)
+        metrics.observe("scraper_product_scrape_seconds", time.perf_counter() - started, method="async")
+        if product_data is None:
+            metrics.incr("scraper_products_total", method="async", result="skipped", reason="missing_fields")
+        else:
+            metrics.incr("scraper_products_total", method="async", result="scraped", reason="ok")
+        return product_data
+
+    async def crawl_listing_page(self, page_url, page=None):
+        """Fetch and extract one listing page, returning None if it could not be fetched"""
+        page_html = await self.fetch(page_url, page_type="listing")
+        if page_html is None:
+            return None
+        await self._archive(page_html, page_url, "listing", page=page)
+        return await self._run(extract_listings_from_html, page_html)
+
+    async def crawl_category(self, category_url, max_pages=None, skip_product=None, on_listing=None, on_product=None):
+        """Crawl a category's listing pages and all their product pages concurrently.
+
+        The last page is read from the first page's embedded search state, and
+        the remaining listing pages are then fetched concurrently by URL. Pages
+        without that state are followed one at a time through rel="next".
+        Product fetches for a page start as soon as its listings are known, so
+        they overlap with fetching the following listing pages. Returns the
+        listings, the product records in listing order, and the listings whose
+        product pages could not be extracted. Listings for which skip_product
+        returns True are kept but their product pages are not fetched. Listing
+        pages that could not be fetched are counted in stats["missed_pages"].
+        on_listing and on_product are called on the executor with each listing
+        and product record as soon as it is extracted; while one blocks, only
+        the page or product it was called for waits.
+        """
+        self._executor = ThreadPoolExecutor(max_workers=self.max_threads, thread_name_prefix="async-crawler")
+        try:
+            listings = []
+            page_tasks = []
+            product_tasks = []
+
+            async def hand_over_product(listing):
+                product_data = await self.crawl_product(listing)
+                if product_data and on_product is not None:
+                    await self._run(on_product, product_data)
+                return product_data
+
+            async def add_page(page_listings, page):
+                logger.info(f"Found {len(page_listings)} products on page {page}")
+                metrics.incr("scraper_listing_pages_total", source="async")
+                for listing in page_listings:
+                    listings.append(listing)
+                    if on_listing is not None:
+                        await self._run(on_listing, listing)
+                    if skip_product is None or not skip_product(listing):
+                        product_tasks.append((listing, asyncio.create_task(hand_over_product(listing))))
+
+            logger.info("Fetching page 1")
+            page_url = category_url
+            page_html = await self.fetch(page_url, page_type="listing")
+            pagination = None
+            if page_html is None:
+                self.stats["missed_pages"] += 1
+            else:
+                await self._archive(page_html, page_url, "listing", page=1)
+                await add_page(await self._run(extract_listings_from_html, page_html), 1)
+                pagination = await self._run(parse_pagination, page_html)
+
+            if pagination:
+                last_page = pagination["last_page"] if max_pages is None else min(pagination["last_page"], max_pages)
+                if last_page > 1:
+                    logger.info(f"{pagination['total_results']} results - fetching pages 2 to {last_page} concurrently")
+                page_tasks = [
+                    (page, asyncio.create_task(self.crawl_listing_page(build_page_url(category_url, page), page)))
+                    for page in range(2, last_page + 1)
+                ]
+                for page, task in page_tasks:
+                    page_listings = await task
+                    if page_listings is None:
+                        logger.warning(f"Could not fetch page {page}")
+                        self.stats["missed_pages"] += 1
+                        continue
+                    await add_page(page_listings, page)
+            elif page_html is not None:
+                current_page = 2
+                page_url = find_next_page_url(page_html, page_url)
+                while page_url and (max_pages is None or current_page <= max_pages):
+                    logger.info(f"Fetching page {current_page}")
+                    page_html = await self.fetch(page_url, page_type="listing")
+                    if page_html is None:
+                        self.stats["missed_pages"] += 1
+                        break
+                    await self._archive(page_html, page_url, "listing", page=current_page)
+                    await add_page(await self._run(extract_listings_from_html, page_html), current_page)
+                    page_url = find_next_page_url(page_html, page_url)
+                    current_page += 1
+
+            results = await asyncio.gather(*(task for _, task in product_tasks))
+            products = [product for product in results if product]
+            failed = [listing for (listing, _), product in zip(product_tasks, results) if not product]
+            return listings, products, failed
+        except BaseException:
+            # A callback that raised (e.g. to cancel the crawl) stops the listing and product pages still in flight
+            tasks = [task for _, task in page_tasks + product_tasks]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        finally:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+def run_crawl(category_url, max_pages=None, **crawler_options):
+    """Run a category crawl with an AsyncCrawler from synchronous code"""
+    crawler = AsyncCrawler(**crawler_options)
+    return asyncio.run(crawler.crawl_category(category_url, max_pages))
@@ -0,0 +1,147 @@
+import argparse
+import logging
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from async_crawler import AsyncCrawler
+from delta import DEFAULT_DELTA_INDEX_PATH, DeltaIndex
+from driver_pool import DriverPool, SessionStats
+from html_archive import HtmlArchive
+from image_downloader import DEFAULT_IMAGE_PATH, ImageDownloader, ImageStore
+from selector_registry import DEFAULT_SELECTOR_STATS_PATH, SelectorRegistry
+from metrics import configure_logging, metrics
+from selenium_base import FAILURE_POLICIES, browsers_needed, crawl_result, export_metrics, scrape_1stdibs
+
+logger = logging.getLogger(__name__)
+
+# What a batch does when one of its categories fails: "continue" runs the
+# rest, "fail" cancels the categories that have not started yet
+BATCH_ERROR_POLICIES = ("continue", "fail")
+
+def parse_target(target, max_pages=None):
+    """Split a "category@pages" target into the category (number, name or URL) and its page limit"""
+    category, _, pages = target.rpartition("@")
+    if category and pages.isdigit():
+        return category, int(pages)
+    return target, max_pages
+
+def run_batch(targets, parallel=2, max_pages=None, num_workers=1, engine="selenium", browser_profile="lean",
+              requests_per_second=2.0, on_error="continue", selector_stats_path=DEFAULT_SELECTOR_STATS_PATH,
+              metrics_path=None, metrics_port=None, archive_path=None, image_dir=None, delta_path=None, prelaunch=None,
+              **scrape_options):
+    """Crawl several categories or URLs in one run without prompting, returning one result per target.
+
+    targets are category numbers, names or URLs, each optionally suffixed
+    with "@pages" to override max_pages. Up to `parallel` categories are
+    crawled at once and share one DriverPool, one SelectorRegistry and one
+    SessionStats, so a browser freed by one category is reused by the next.
+    The pool starts prelaunch browsers up front, by default as many as the
+    first `parallel` selenium crawls hold (none for the async engine).
+    With engine="async" each crawl gets its own AsyncCrawler and the
+    requests_per_second budget is split between the parallel crawls.
+    Metrics cover the whole batch: they are served on metrics_port while it
+    runs and written to metrics_path once every category has finished.
+    With archive_path, every category saves its pages' HTML to one shared
+    html_archive.HtmlArchive. With image_dir, product images are downloaded
+    into it by one shared image_downloader.ImageDownloader. With delta_path,
+    every category writes its new, changed and removed products against one
+    shared delta.DeltaIndex there.
+    Remaining keyword arguments are passed to scrape_1stdibs.
+    """
+    if on_error not in BATCH_ERROR_POLICIES:
+        raise ValueError(f"on_error must be one of {', '.join(BATCH_ERROR_POLICIES)}")
+    jobs = [parse_target(target, max_pages) for target in targets]
+    if prelaunch is None:
+        prelaunch = min(parallel, len(jobs)) * browsers_needed(num_workers) if engine == "selenium" else 0
+    driver_pool = DriverPool(parallel * browsers_needed(num_workers), browser_profile, prelaunch=prelaunch)
+    registry = SelectorRegistry(selector_stats_path)
+    session_stats = scrape_options.pop("session_stats", None) or SessionStats()
+    stopping = threading.Event()
+    metrics_server = metrics.serve(metrics_port) if metrics_port else None
+    archive = HtmlArchive(archive_path) if archive_path else None
+    image_downloader = ImageDownloader(ImageStore(image_dir)) if image_dir else None
+    delta_index = DeltaIndex(delta_path) if delta_path else None
+
+    def run_job(category, pages):
+        if stopping.is_set():
+            result = crawl_result(category, None)
+            result["status"] = "cancelled"
+            return result
+        crawler = None
+        if engine == "async":
+            crawler = AsyncCrawler(requests_per_second=requests_per_second / min(parallel, len(jobs)))
+        try:
+            result = scrape_1stdibs(category_option=category, max_pages=pages, num_workers=num_workers, engine=engine,
+                                    crawler=crawler, browser_profile=browser_profile, driver_pool=driver_pool,
+                                    session_stats=session_stats, selector_registry=registry, archive=archive,
+                                    image_downloader=image_downloader, delta_index=delta_index, **scrape_options)
+        except Exception as e:
+            logger.error(f"Could not crawl {category}: {str(e)}")
+            result = crawl_result(category, None)
+            result.update(status="failed", error=str(e))
+        if result["status"] == "failed" and on_error == "fail":
+            stopping.set()
+        return result
+
+    try:
+        with ThreadPoolExecutor(max_workers=parallel) as executor:
+            results = list(executor.map(lambda job: run_job(*job), jobs))
+    finally:
+        driver_pool.close()
+        registry.save()
+        if archive is not None:
+            archive.close()
+        if image_downloader is not None:
+            image_downloader.close()
+        if delta_index is not None:
+            delta_index.close()
+        export_metrics(metrics_path, metrics_server)
+    logger.info(session_stats.summary())
+    return results
+
+def print_summary(results):
+    """Print one line per crawl with its status and record counts"""
+    print(f"{'Category':<30} {'Status':<10} {'Listings':>9} {'Products':>9}")
+    for result in results:
+        print(f"{result['category']:<30} {result['status']:<10} {result['listings']:>9} {result['products']:>9}")
+        if result["error"]:
+            print(f"  {result['error']}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Crawl several 1stdibs categories or URLs without prompts")
+    parser.add_argument("targets", nargs="+", help='category number, name or URL, optionally with "@pages", e.g. lighting@5')
+    parser.add_argument("--max-pages", type=int, help="page limit for targets without their own")
+    parser.add_argument("--workers", type=int, default=1, help="product page workers per category")
+    parser.add_argument("--parallel", type=int, default=2, help="categories crawled at once")
+    parser.add_argument("--engine", choices=("selenium", "async"), default="selenium")
+    parser.add_argument("--profile", default="lean", help="browser profile (full, lean or lean-no-images)")
+    parser.add_argument("--prelaunch", type=int, help="browsers started before the first crawl (default: enough for the first wave)")
+    parser.add_argument("--requests-per-second", type=float, default=2.0, help="async engine rate limit per host, split across categories")
+    parser.add_argument("--on-empty-page", choices=FAILURE_POLICIES, default="stop")
+    parser.add_argument("--on-pagination-error", choices=FAILURE_POLICIES, default="stop")
+    parser.add_argument("--on-error", choices=BATCH_ERROR_POLICIES, default="continue",
+                        help="whether a failed category cancels the ones not yet started")
+    parser.add_argument("--interactive", action="store_true", help='allow prompts for the "ask" policies')
+    parser.add_argument("--log-level", default="INFO", choices=("DEBUG", "INFO", "WARNING", "ERROR"))
+    parser.add_argument("--log-file", help="write the log here instead of stderr")
+    parser.add_argument("--metrics-path", help="write metrics here at the end (.json for JSON, else Prometheus text)")
+    parser.add_argument("--metrics-port", type=int, help="serve Prometheus metrics on this port during the batch")
+    parser.add_argument("--archive", help="save the HTML of every page to this archive directory, for reextract.py")
+    parser.add_argument("--images", nargs="?", const=DEFAULT_IMAGE_PATH, metavar="DIR",
+                        help=f"download product images (into {DEFAULT_IMAGE_PATH} unless DIR is given)")
+    parser.add_argument("--delta", nargs="?", const=DEFAULT_DELTA_INDEX_PATH, metavar="INDEX",
+                        help=f"also write new, changed and removed products to a _deltas_ file, compared in {DEFAULT_DELTA_INDEX_PATH} unless INDEX is given")
+    args = parser.parse_args(argv)
+    configure_logging(args.log_level, args.log_file)
+
+    results = run_batch(args.targets, parallel=args.parallel, max_pages=args.max_pages, num_workers=args.workers,
+                        engine=args.engine, browser_profile=args.profile, requests_per_second=args.requests_per_second,
+                        on_error=args.on_error, on_empty_page=args.on_empty_page,
+                        on_pagination_error=args.on_pagination_error, interactive=args.interactive,
+                        metrics_path=args.metrics_path, metrics_port=args.metrics_port, archive_path=args.archive,
+                        image_dir=args.images, delta_path=args.delta, prelaunch=args.prelaunch)
+    print_summary(results)
+    return 1 if any(result["status"] in ("failed", "cancelled") for result in results) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,480 @@
+import argparse
+import html
+import json
+import multiprocessing
+import os
+import platform
+import re
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+import async_crawler
+import http_extract
+import selenium_base
+from async_crawler import AsyncCrawler
+from driver_pool import create_driver
+from http_extract import format_price
+from metrics import configure_logging
+from wait_policy import WaitPolicy
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+SAVED_PAGE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'page_source.html')
+
+# Links in the saved page point here; they are rewritten to the fixture server
+SAVED_PAGE_ORIGIN = 'https://www.1stdibs.com'
+
+FIXTURE_CATEGORY_PATH = '/furniture/benchmark-lighting/'
+SAVED_CATEGORY_PATH = '/furniture/lighting/'
+
+# Scenarios that run without Chrome, used when none are named
+DEFAULT_SCENARIOS = ("async", "async-saved")
+
+# Metrics compared against a baseline, and whether higher or lower is better
+REGRESSION_METRICS = {
+    "pages_per_sec": "higher",
+    "products_per_sec": "higher",
+    "peak_rss_mb": "lower"
+}
+
+TILE_TEMPLATE = """
+<div data-tn="item-tile-wrapper">
+    <a data-tn="item-tile-title-anchor" href="{url}"><h2>{name}</h2></a>
+    <img data-tn="product-image" src="{image_url}" alt="">
+    <div data-tn="price">{price}</div>
+    <a data-tn="quick-view-creator-link" href="#">{creator}</a>
+</div>"""
+
+PRODUCT_TEMPLATE = """<!DOCTYPE html>
+<html><head><title>{name}</title>
+<script type="application/ld+json">{json_ld}</script>
+</head><body>
+<h1>{name}</h1>
+<img data-tn="listing-page-hero-image" src="{image_url}" alt="">
+<div data-tn="listing-page-description">{description}</div>
+<div data-tn="listing-page-details"><dl>{specs}</dl></div>
+</body></html>"""
+
+def fixture_listing(base_url, page, position):
+    """Return the listing a synthetic listing page shows at a position"""
+    product_id = f"f_bench{page:03d}{position:03d}"
+    return {
+        "name": f"Benchmark Brass Lamp {page}-{position}",
+        "url": f"{base_url}{FIXTURE_CATEGORY_PATH}benchmark-brass-lamp-{page}-{position}/id-{product_id}/",
+        "image_url": f"{base_url}/images/{product_id}.jpg?width=768",
+        "price": format_price(1000 + position * 25, "USD"),
+        "creator": f"Studio {position % 7}",
+        "product_id": product_id
+    }
+
+def listing_page_html(base_url, page, pages, products_per_page):
+    """Build a listing page with product tiles, JSON-LD, search state and a rel="next" link"""
+    listings = [fixture_listing(base_url, page, position) for position in range(products_per_page)]
+    json_ld = {
+        "@context": "https://schema.org",
+        "@type": "ItemList",
+        "itemListElement": [
+            {
+                "@type": "Product",
+                "name": listing["name"],
+                "url": listing["url"],
+                "image": listing["image_url"],
+                "brand": {"@type": "Brand", "name": listing["creator"]},
+                "offers": {"@type": "Offer", "price": 1000 + position * 25, "priceCurrency": "USD"}
+            }
+            for position, listing in enumerate(listings)
+        ]
+    }
+    server_vars = {
+        "relay": {"variables": {"first": products_per_page, "page": page}},
+        "dbl": {"relayData": {"client:root:itemSearch": {
+            "__typename": "ItemSearchQueryConnection",
+            "totalResults": pages * products_per_page,
+            "displayMaxNumberOfPages": 50
+        }}}
+    }
+    tiles = "".join(TILE_TEMPLATE.format(**{key: html.escape(value) for key, value in listing.items()}) for listing in listings)
+    next_link = f'<link rel="next" href="{FIXTURE_CATEGORY_PATH}?page={page + 1}">' if page < pages else ''
+    return (f'<!DOCTYPE html>\n<html><head><title>Benchmark Lighting - Page {page}</title>{next_link}'
+            f'<script type="application/ld+json">{json.dumps(json_ld)}</script>'
+            f'<script id="serverVars_data" type="application/json">{json.dumps(server_vars)}</script>'
+            f'</head><body><div data-tn="search-results">{tiles}</div></body></html>')
+
+def product_page_html(base_url, path, product_id):
+    """Build a product page with JSON-LD and the description, details and hero image elements"""
+    name = f"Benchmark Product {product_id}"
+    image_url = f"{base_url}/images/{product_id}.jpg?width=240"
+    description = f"A synthetic product page for {product_id}, served by the benchmark fixture server."
+    specs = {"Materials": "Brass, Glass", "Period": "1970-1979", "Place of Origin": "Italy", "Condition": "Good"}
+    json_ld = {
+        "@context": "https://schema.org",
+        "@type": "Product",
+        "name": name,
+        "url": base_url + path,
+        "description": description,
+        "image": [image_url],
+        "brand": {"@type": "Brand", "name": "Studio Benchmark"},
+        "material": specs["Materials"],
+        "offers": {"@type": "Offer", "price": 1250, "priceCurrency": "USD"},
+        "additionalProperty": [{"@type": "PropertyValue", "name": label, "value": value} for label, value in specs.items()]
+    }
+    return PRODUCT_TEMPLATE.format(
+        name=html.escape(name),
+        json_ld=json.dumps(json_ld),
+        image_url=html.escape(image_url),
+        description=html.escape(description),
+        specs="".join(f"<dt>{html.escape(label)}</dt><dd>{html.escape(value)}</dd>" for label, value in specs.items())
+    )
+
+class FixtureSite:
+    """Local HTTP server for synthetic listing and product pages and the saved listing page.
+
+    The synthetic category has `pages` listing pages of `products_per_page`
+    products and matches the selectors and embedded JSON the scraper reads.
+    The saved category serves page_source.html for every page number, with
+    its links pointed at this server. Any /id-<product_id>/ path is a product
+    page. latency_ms is added to every response to stand in for the network.
+    Requests served are counted by kind in `counts`.
+    """
+
+    def __init__(self, pages=5, products_per_page=20, latency_ms=0, saved_page_path=SAVED_PAGE_PATH):
+        self.pages = pages
+        self.products_per_page = products_per_page
+        self.latency_ms = latency_ms
+        self.saved_page_path = saved_page_path
+        self.counts = {"listing": 0, "saved": 0, "product": 0, "missing": 0}
+        self.base_url = None
+        self._saved_page = None
+        self._server = None
+        self._lock = threading.Lock()
+
+    @property
+    def category_url(self):
+        return self.base_url + FIXTURE_CATEGORY_PATH
+
+    @property
+    def saved_category_url(self):
+        return self.base_url + SAVED_CATEGORY_PATH
+
+    def saved_page(self):
+        if self._saved_page is None:
+            with open(self.saved_page_path, encoding='utf-8') as f:
+                self._saved_page = f.read().replace(SAVED_PAGE_ORIGIN, self.base_url).encode('utf-8')
+        return self._saved_page
+
+    def respond(self, path):
+        """Return the (status, kind, body) for a request path"""
+        parts = urlsplit(path)
+        page = int(parse_qs(parts.query).get("page", ["1"])[0])
+        product_match = re.search(r'/id-([^/]+)/?$', parts.path)
+        if product_match:
+            return 200, "product", product_page_html(self.base_url, parts.path, product_match.group(1)).encode('utf-8')
+        if parts.path == FIXTURE_CATEGORY_PATH and 1 <= page <= self.pages:
+            return 200, "listing", listing_page_html(self.base_url, page, self.pages, self.products_per_page).encode('utf-8')
+        if parts.path == SAVED_CATEGORY_PATH:
+            return 200, "saved", self.saved_page()
+        return 404, "missing", b"Not found"
+
+    def start(self):
+        site = self
+
+        class FixtureHandler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if site.latency_ms:
+                    time.sleep(site.latency_ms / 1000)
+                status, kind, body = site.respond(self.path)
+                with site._lock:
+                    site.counts[kind] += 1
+                self.send_response(status)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), FixtureHandler)
+        self._server.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self._server.server_port}"
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.counts)
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+def percentile(samples, fraction):
+    """Nearest-rank percentile of a list of numbers"""
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+def page_kind(url):
+    return "product" if "/id-" in url else "listing"
+
+class StageTimer:
+    """Latency samples per pipeline stage, collected by wrapping the scraper's fetch, parse and render functions.
+
+    install() swaps timed wrappers into the modules for the rest of the
+    process, which is why each scenario runs in its own process.
+    """
+
+    def __init__(self):
+        self.samples = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds):
+        with self._lock:
+            self.samples.setdefault(stage, []).append(seconds)
+
+    def timed(self, func, stage):
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.add(stage(*args) if callable(stage) else stage, time.perf_counter() - start)
+        return wrapper
+
+    def timed_async(self, func, stage):
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                self.add(stage(*args) if callable(stage) else stage, time.perf_counter() - start)
+        return wrapper
+
+    def install(self):
+        AsyncCrawler.fetch = self.timed_async(AsyncCrawler.fetch, lambda crawler, url: f"{page_kind(url)}_fetch")
+        http_extract.fetch_html = self.timed(http_extract.fetch_html, lambda session, url, *args: f"{page_kind(url)}_fetch")
+        for module in (async_crawler, http_extract):
+            module.extract_listings_from_html = self.timed(module.extract_listings_from_html, "listing_parse")
+            module.extract_product_from_html = self.timed(module.extract_product_from_html, "product_parse")
+        selenium_base.harvest_listing_page = self.timed(selenium_base.harvest_listing_page, "listing_render")
+        selenium_base.scrape_product_details = self.timed(selenium_base.scrape_product_details, "product_render")
+
+    def summary(self):
+        """Return the sample count and p50/p95 latency in milliseconds of each stage"""
+        with self._lock:
+            return {
+                stage: {
+                    "count": len(samples),
+                    "p50_ms": round(percentile(samples, 0.50) * 1000, 2),
+                    "p95_ms": round(percentile(samples, 0.95) * 1000, 2)
+                }
+                for stage, samples in sorted(self.samples.items())
+            }
+
+def crawl(category_url, options, **scrape_options):
+    """Run scrape_1stdibs without politeness delays against a fixture category"""
+    crawler = None
+    if scrape_options.get("engine") == "async":
+        crawler = AsyncCrawler(max_concurrency_per_host=options["concurrency"], requests_per_second=options["requests_per_second"],
+                               burst=options["concurrency"])
+    result = selenium_base.scrape_1stdibs(category_url, max_pages=options["max_pages"], num_workers=options["workers"],
+                                          wait_policy=WaitPolicy(politeness_delay=0), crawler=crawler, index_path=None,
+                                          store_path='products.sqlite', selector_stats_path=None,
+                                          browser_profile="lean-no-images", **scrape_options)
+    if result["status"] == "failed":
+        raise RuntimeError(result["error"])
+    return {"listings": result["listings"], "products": result["products"]}
+
+def product_details(urls, options):
+    """Render fixture product pages one after another on a single browser with scrape_product_details"""
+    driver = create_driver("lean-no-images")
+    wait_policy = WaitPolicy(politeness_delay=0)
+    products = 0
+    try:
+        for position in range(options["products"]):
+            listing = fixture_listing(urls["base"], 1, position)
+            if selenium_base.scrape_product_details(driver, listing["url"], listing["product_id"], listing, wait_policy):
+                products += 1
+    finally:
+        driver.quit()
+    return {"listings": 0, "products": products}
+
+SCENARIOS = {
+    "async": lambda urls, options: crawl(urls["category"], options, engine="async"),
+    "async-saved": lambda urls, options: crawl(urls["saved"], dict(options, max_pages=options["saved_pages"]), engine="async"),
+    "selenium": lambda urls, options: crawl(urls["category"], options, engine="selenium", fast_path=False),
+    "selenium-fast": lambda urls, options: crawl(urls["category"], options, engine="selenium", fast_path=True),
+    "product-details": product_details
+}
+
+def peak_rss_mb():
+    """Peak resident memory of this process in MB, or None where it cannot be read"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def run_scenario(name, urls, options, verbose=False):
+    """Run one scenario in this process and return its timings; meant to run in a fresh process"""
+    timer = StageTimer()
+    timer.install()
+    configure_logging("INFO" if verbose else "WARNING")
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        start = time.perf_counter()
+        counts = SCENARIOS[name](urls, options)
+        elapsed = time.perf_counter() - start
+    return dict(counts, elapsed_s=round(elapsed, 3), peak_rss_mb=peak_rss_mb(), stages=timer.summary())
+
+def measure(site, name, options, verbose=False):
+    """Run a scenario in a separate process and add page rates from the requests the fixture server saw"""
+    urls = {"base": site.base_url, "category": site.category_url, "saved": site.saved_category_url}
+    before = site.snapshot()
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+        run = executor.submit(run_scenario, name, urls, options, verbose).result()
+    after = site.snapshot()
+    run["listing_pages"] = after["listing"] + after["saved"] - before["listing"] - before["saved"]
+    run["product_pages"] = after["product"] - before["product"]
+    run["pages_per_sec"] = round((run["listing_pages"] + run["product_pages"]) / run["elapsed_s"], 2)
+    run["products_per_sec"] = round(run["products"] / run["elapsed_s"], 2)
+    return run
+
+def run_benchmark(scenarios=DEFAULT_SCENARIOS, pages=5, products_per_page=20, latency_ms=20, repeat=3, workers=4,
+                  concurrency=8, requests_per_second=200.0, saved_pages=2, verbose=False):
+    """Run each scenario `repeat` times against a fixture server and keep the median run by elapsed time.
+
+    A scenario that cannot run (e.g. the Selenium ones without Chrome) is
+    reported with its error instead of metrics.
+    """
+    options = {
+        "max_pages": pages,
+        "workers": workers,
+        "concurrency": concurrency,
+        "requests_per_second": requests_per_second,
+        "saved_pages": saved_pages,
+        "products": products_per_page
+    }
+    site = FixtureSite(pages, products_per_page, latency_ms).start()
+    results = {
+        "machine": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "settings": dict(options, latency_ms=latency_ms, products_per_page=products_per_page, repeat=repeat),
+        "scenarios": {}
+    }
+    try:
+        for name in scenarios:
+            print(f"Running {name}...")
+            try:
+                runs = sorted((measure(site, name, options, verbose) for _ in range(repeat)), key=lambda run: run["elapsed_s"])
+            except Exception as e:
+                print(f"  {name} could not run: {str(e).splitlines()[0] if str(e) else type(e).__name__}")
+                results["scenarios"][name] = {"error": str(e)}
+                continue
+            results["scenarios"][name] = runs[len(runs) // 2]
+    finally:
+        site.stop()
+    return results
+
+def format_results(results):
+    """Summarise throughput, memory and per-stage latency of each scenario"""
+    lines = []
+    for name, run in results["scenarios"].items():
+        if "error" in run:
+            lines.append(f"{name}: not run ({run['error'].splitlines()[0] if run['error'] else 'error'})")
+            continue
+        lines.append(f"{name}: {run['listing_pages']} listing + {run['product_pages']} product pages, "
+                     f"{run['products']} products in {run['elapsed_s']:.2f}s")
+        lines.append(f"  {run['pages_per_sec']:.1f} pages/s, {run['products_per_sec']:.1f} products/s, "
+                     f"peak memory {run['peak_rss_mb']} MB")
+        for stage, timing in run["stages"].items():
+            lines.append(f"  {stage}: p50 {timing['p50_ms']:.1f} ms, p95 {timing['p95_ms']:.1f} ms ({timing['count']} samples)")
+    return "\n".join(lines)
+
+def compare_results(baseline, current, tolerance=0.10):
+    """Compare two benchmark results, returning (scenario, metric, baseline, current, change, regressed) rows.
+
+    Throughput that drops, or memory or p95 stage latency that grows, by
+    more than tolerance (a fraction) counts as a regression.
+    """
+    rows = []
+    for name, run in current["scenarios"].items():
+        base = baseline["scenarios"].get(name)
+        if not base or "error" in base or "error" in run:
+            continue
+        metrics = [(metric, base.get(metric), run.get(metric), better) for metric, better in REGRESSION_METRICS.items()]
+        for stage, timing in run["stages"].items():
+            if stage in base["stages"]:
+                metrics.append((f"{stage}.p95_ms", base["stages"][stage]["p95_ms"], timing["p95_ms"], "lower"))
+        for metric, before, after, better in metrics:
+            if not before or after is None:
+                continue
+            change = (after - before) / before
+            regressed = change < -tolerance if better == "higher" else change > tolerance
+            rows.append((name, metric, before, after, change, regressed))
+    return rows
+
+def format_comparison(rows):
+    lines = [f"{'Scenario':<16} {'Metric':<26} {'Baseline':>10} {'Current':>10} {'Change':>8}"]
+    for name, metric, before, after, change, regressed in rows:
+        lines.append(f"{name:<16} {metric:<26} {before:>10} {after:>10} {change:>+7.1%}{'  REGRESSION' if regressed else ''}")
+    return "\n".join(lines)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the scraper offline against a local fixture server")
+    parser.add_argument("scenarios", nargs="*", help=f"scenarios to run: {', '.join(SCENARIOS)} (default: {', '.join(DEFAULT_SCENARIOS)})")
+    parser.add_argument("--pages", type=int, default=5, help="synthetic listing pages")
+    parser.add_argument("--products", type=int, default=20, help="products per synthetic listing page")
+    parser.add_argument("--latency-ms", type=float, default=20, help="delay added to every response")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per scenario; the median is reported")
+    parser.add_argument("--workers", type=int, default=4, help="Chrome product page workers")
+    parser.add_argument("--concurrency", type=int, default=8, help="async engine requests in flight")
+    parser.add_argument("--saved-pages", type=int, default=2, help="pages of the saved listing page to crawl")
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="compare against results saved earlier with --save")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed regression as a fraction (default 0.10)")
+    parser.add_argument("--serve", action="store_true", help="only run the fixture server, until interrupted")
+    parser.add_argument("--verbose", action="store_true", help="show the scraper's info-level log, not just warnings")
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario: {', '.join(unknown)}")
+
+    if args.serve:
+        site = FixtureSite(args.pages, args.products, args.latency_ms).start()
+        print(f"Synthetic category: {site.category_url}")
+        print(f"Saved listing page: {site.saved_category_url}")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            site.stop()
+        return 0
+
+    results = run_benchmark(args.scenarios or DEFAULT_SCENARIOS, args.pages, args.products, args.latency_ms, args.repeat,
+                            args.workers, args.concurrency, saved_pages=args.saved_pages, verbose=args.verbose)
+    print(format_results(results))
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results saved to {args.save}")
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get("settings") != results["settings"]:
+            print("Warning: the baseline was run with different settings, so the numbers may not be comparable.")
+        rows = compare_results(baseline, results, args.tolerance)
+        print(format_comparison(rows))
+        if any(row[5] for row in rows):
+            print("Performance regressed beyond the tolerance.")
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,223 @@
+import json
+import logging
+import sys
+import threading
+from selenium.webdriver.chrome.options import Options
+from http_extract import USER_AGENT
+
+logger = logging.getLogger(__name__)
+
+# URL patterns blocked over CDP, by category. Patterns use Network.setBlockedURLs
+# wildcard syntax. The tracker hosts are the third-party scripts loaded by
+# every listing and product page.
+BLOCKLIST = {
+    "trackers": [
+        "*.criteo.com/*",
+        "*.doubleclick.net/*",
+        "*googletagmanager.com/*",
+        "*google-analytics.com/*",
+        "*googletagservices.com/*",
+        "*googleadservices.com/*",
+        "*googlesyndication.com/*",
+        "*adtrafficquality.google/*",
+        "*.taboola.com/*",
+        "*.pinterest.com/*",
+        "*.pinimg.com/*",
+        "*.facebook.com/*",
+        "*.facebook.net/*",
+        "*bat.bing.com/*",
+        "*.redditstatic.com/*",
+        "*.paypal.com/*",
+        "*.adsrvr.org/*",
+        "*.creativecdn.com/*",
+        "*.hotjar.com/*",
+        "*.appsflyer.com/*",
+        "*analytics.yahoo.com/*",
+        "*.yimg.com/*",
+        "*.igodigital.com/*",
+        "*.adnxs.com/*",
+        "*.pepperjam.com/*",
+        "*quickkoala.io/*"
+    ],
+    "fonts": [
+        "*use.typekit.net/*",
+        "*.woff",
+        "*.woff2",
+        "*.ttf",
+        "*.otf"
+    ],
+    "media": [
+        "*.mp4",
+        "*.webm",
+        "*.m3u8",
+        "*.mp3"
+    ],
+    # Tile and hero image URLs are read from attributes, so the files
+    # themselves are not needed
+    "images": [
+        "*.jpg*",
+        "*.jpeg*",
+        "*.png*",
+        "*.gif*",
+        "*.webp*",
+        "*.svg*"
+    ]
+}
+
+class BrowserProfile:
+    """Chrome launch settings and the URL patterns blocked in each browser.
+
+    block lists BLOCKLIST categories to block and extra_blocked_urls adds
+    patterns of its own. With network_stats, Chrome's performance log is
+    enabled so a NetworkMeter can count the requests and bytes of each page.
+    """
+
+    def __init__(self, headless=False, block=(), extra_blocked_urls=(), window_size="1920,1080", network_stats=False):
+        self.headless = headless
+        self.block = tuple(block)
+        self.extra_blocked_urls = tuple(extra_blocked_urls)
+        self.window_size = window_size
+        self.network_stats = network_stats
+
+    def blocked_urls(self):
+        """Return every URL pattern blocked by this profile"""
+        patterns = []
+        for category in self.block:
+            if category not in BLOCKLIST:
+                raise ValueError(f"Unknown blocklist category: {category}")
+            patterns.extend(BLOCKLIST[category])
+        patterns.extend(self.extra_blocked_urls)
+        return patterns
+
+    def chrome_options(self):
+        """Build the Chrome options for this profile"""
+        chrome_options = Options()
+
+        # Add a user agent to mimic a regular browser
+        chrome_options.add_argument(f'user-agent={USER_AGENT}')
+
+        # Add additional arguments to enhance stability and avoid detection
+        chrome_options.add_argument('--disable-blink-features=AutomationControlled')
+        chrome_options.add_argument('--disable-extensions')
+        chrome_options.add_argument('--no-sandbox')
+        chrome_options.add_argument('--disable-infobars')
+        chrome_options.add_argument('--disable-dev-shm-usage')
+        chrome_options.add_argument('--disable-browser-side-navigation')
+        chrome_options.add_argument('--disable-gpu')
+        chrome_options.add_argument(f'--window-size={self.window_size}')
+        chrome_options.add_experimental_option('excludeSwitches', ['enable-automation'])
+        chrome_options.add_experimental_option('useAutomationExtension', False)
+
+        if self.headless:
+            chrome_options.add_argument('--headless=new')
+        if self.network_stats:
+            chrome_options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
+        return chrome_options
+
+    def apply(self, driver):
+        """Install the URL blocklist in a freshly started driver"""
+        patterns = self.blocked_urls()
+        if patterns:
+            driver.execute_cdp_cmd('Network.enable', {})
+            driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': patterns})
+
+BROWSER_PROFILES = {
+    # The original profile: a full browser window that loads everything
+    "full": BrowserProfile(),
+    "lean": BrowserProfile(headless=True, block=("trackers", "fonts", "media"), network_stats=True),
+    "lean-no-images": BrowserProfile(headless=True, block=("trackers", "fonts", "media", "images"), network_stats=True)
+}
+
+def resolve_profile(profile):
+    """Return a BrowserProfile given one or the name of a predefined profile"""
+    if profile is None:
+        return BROWSER_PROFILES["full"]
+    if isinstance(profile, str):
+        if profile not in BROWSER_PROFILES:
+            raise ValueError(f"Unknown browser profile: {profile}")
+        return BROWSER_PROFILES[profile]
+    return profile
+
+def read_network_log(driver):
+    """Drain Chrome's performance log and count the requests, bytes and blocked requests it recorded"""
+    stats = {"requests": 0, "bytes": 0, "blocked": 0}
+    for entry in driver.get_log('performance'):
+        message = json.loads(entry["message"])["message"]
+        method = message.get("method")
+        params = message.get("params", {})
+        if method == "Network.requestWillBeSent":
+            stats["requests"] += 1
+        elif method == "Network.loadingFinished":
+            stats["bytes"] += int(params.get("encodedDataLength", 0))
+        elif method == "Network.loadingFailed" and params.get("blockedReason"):
+            stats["blocked"] += 1
+    return stats
+
+class NetworkMeter:
+    """Totals of network traffic per page type, read from each driver's performance log"""
+
+    def __init__(self):
+        self.totals = {}
+        self._lock = threading.Lock()
+
+    def measure(self, driver, page_type):
+        """Count the traffic since the last measurement of this driver as one page of page_type"""
+        try:
+            stats = read_network_log(driver)
+        except Exception as e:
+            logger.warning(f"Could not read the network log: {str(e)}")
+            return None
+        with self._lock:
+            totals = self.totals.setdefault(page_type, {"pages": 0, "requests": 0, "bytes": 0, "blocked": 0})
+            totals["pages"] += 1
+            for key, value in stats.items():
+                totals[key] += value
+        return stats
+
+    def summary(self):
+        """Summarise requests and bytes per page, and requests blocked per page, for each page type"""
+        lines = ["Network traffic per page:"]
+        with self._lock:
+            for page_type, totals in sorted(self.totals.items()):
+                pages = totals["pages"]
+                lines.append(
+                    f"  {page_type}: {totals['requests'] / pages:.1f} requests, "
+                    f"{totals['bytes'] / pages / 1024:.1f} KB, {totals['blocked'] / pages:.1f} blocked requests "
+                    f"({pages} pages)"
+                )
+        return "\n".join(lines)
+
+def compare_profiles(url, driver_factory, profiles=("full", "lean"), wait_policy=None, tile_selectors=None):
+    """Load url once with each profile and report the requests and bytes each one used.
+
+    driver_factory(profile) must return a started driver for a BrowserProfile.
+    Network stats are enabled for every profile compared.
+    """
+    results = {}
+    for name in profiles:
+        profile = resolve_profile(name)
+        measured = BrowserProfile(profile.headless, profile.block, profile.extra_blocked_urls, profile.window_size,
+                                  network_stats=True)
+        driver = driver_factory(measured)
+        try:
+            driver.get(url)
+            if wait_policy is not None:
+                wait_policy.wait_for_tiles(driver, tile_selectors)
+                wait_policy.wait_for_network_idle(driver)
+            results[name] = read_network_log(driver)
+        finally:
+            driver.quit()
+
+    baseline = results[profiles[0]]
+    for name, stats in results.items():
+        print(f"{name}: {stats['requests']} requests, {stats['bytes'] / 1024:.1f} KB, {stats['blocked']} blocked")
+        if name != profiles[0]:
+            print(f"  saves {baseline['requests'] - stats['requests']} requests and "
+                  f"{(baseline['bytes'] - stats['bytes']) / 1024:.1f} KB per page compared with {profiles[0]}")
+    return results
+
+if __name__ == "__main__":
+    # Compare page weight across profiles, e.g. python browser_profile.py https://www.1stdibs.com/furniture/lighting/
+    from selenium_base import PRODUCT_TILE_SELECTORS, create_driver
+    from wait_policy import WaitPolicy
+    compare_profiles(sys.argv[1], create_driver, tuple(sys.argv[2:]) or ("full", "lean"), WaitPolicy(), PRODUCT_TILE_SELECTORS)
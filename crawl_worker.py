@@ -0,0 +1,335 @@
+import argparse
+import logging
+import os
+import re
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import partial
+import requests
+from async_crawler import find_next_page_url
+from batch import parse_target
+from browser_profile import resolve_profile
+from driver_pool import DriverSession, create_driver
+from http_extract import build_page_url, create_session, extract_listings_from_html, fetch_html, fetch_product_details, parse_pagination
+from metrics import configure_logging, metrics
+from output_writer import JsonlWriter
+from record_store import open_record_store
+from selector_registry import DEFAULT_SELECTOR_STATS_PATH, SelectorRegistry
+from selenium_base import (CrawlError, load_page, product_sink, read_rendered_listing_page, resolve_category,
+                           scrape_product_details)
+from wait_policy import WaitPolicy
+from work_queue import DEFAULT_LEASE_SECONDS, DEFAULT_QUEUE_PATH, ITEM_STATUSES, SqliteWorkQueue
+
+logger = logging.getLogger(__name__)
+
+# Items a worker leases at a time; their leases are kept alive until each is handled
+WORKER_LEASE_BATCH = 4
+
+# Seconds an idle worker waits before asking again while other workers still hold leases
+WORKER_POLL_SECONDS = 5
+
+def default_worker_id():
+    """Name a worker after its host and process, so its output files and leases can be told apart"""
+    return re.sub(r'[^A-Za-z0-9_.-]+', '-', f"{socket.gethostname()}-{os.getpid()}")
+
+def seed_crawl(work_queue, category_option=None, max_pages=None, crawl_id=None):
+    """Queue a category's first listing page for the workers, returning the crawl id.
+
+    Item keys start with the crawl id, so seeding the same crawl again adds
+    nothing while a new crawl id crawls every page again.
+    """
+    category_url, category_name = resolve_category(category_option)
+    crawl_id = crawl_id or datetime.now().strftime("%Y%m%d_%H%M%S")
+    payload = {"crawl_id": crawl_id, "category_url": category_url, "category_name": category_name, "page": 1,
+               "max_pages": max_pages}
+    if work_queue.put("listing", f"{crawl_id}:listing:{category_url}:1", payload):
+        logger.info(f"Queued {category_url} for crawl {crawl_id}")
+    return crawl_id
+
+class LeaseKeeper:
+    """Extends a worker's leases from a background thread while it works through them"""
+
+    def __init__(self, work_queue, worker_id, lease_seconds=DEFAULT_LEASE_SECONDS):
+        self.work_queue = work_queue
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds
+        self._item_ids = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True, name=f"lease-keeper-{worker_id}")
+        self._thread.start()
+
+    def hold(self, item_ids):
+        with self._lock:
+            self._item_ids.update(item_ids)
+
+    def release(self, item_id):
+        with self._lock:
+            self._item_ids.discard(item_id)
+
+    def _run(self):
+        # Heartbeat three times per lease, so one slow or failed beat does not lose it
+        while not self._stop.wait(self.lease_seconds / 3):
+            with self._lock:
+                item_ids = list(self._item_ids)
+            if not item_ids:
+                continue
+            try:
+                held = self.work_queue.heartbeat(item_ids, self.worker_id, self.lease_seconds)
+            except Exception as e:
+                logger.warning(f"Heartbeat failed: {str(e)}")
+                continue
+            if held < len(item_ids):
+                logger.warning(f"{len(item_ids) - held} leases expired before their heartbeat and may be handled twice")
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+
+class CrawlWorker:
+    """Takes listing and product pages from a shared work queue and runs the usual extraction on them.
+
+    A listing page is read from its embedded JSON over HTTP, or rendered in
+    Chrome when that finds nothing. It queues a product item for each of its
+    listings and, from page 1's result count or each page's rel="next" link,
+    the category's other listing pages. Product pages go through the HTTP
+    fast path and then Chrome, as in scrape_1stdibs. The browser is only
+    started once a page needs it.
+
+    Records are appended to this worker's own files,
+    1stdibs_<category>_listings_<crawl id>_<worker id>.jsonl and _detailed_,
+    and saved to the record store. An item is acked once its records are on
+    disk, so a worker that dies loses nothing: its leases expire and another
+    worker takes the items over. A page that fails is retried up to the
+    queue's max_attempts.
+    """
+
+    def __init__(self, work_queue, worker_id=None, lease_seconds=DEFAULT_LEASE_SECONDS, fast_path=True, browser_profile="lean",
+                 wait_policy=None, registry=None, record_store=None, fsync_policy="page", output_dir='scraped_data'):
+        self.work_queue = work_queue
+        self.worker_id = worker_id or default_worker_id()
+        self.lease_seconds = lease_seconds
+        self.http_session = create_session() if fast_path else None
+        self.profile = resolve_profile(browser_profile)
+        self.wait_policy = wait_policy or WaitPolicy()
+        self.registry = registry or SelectorRegistry(path=None)
+        self.own_record_store = record_store is None
+        self.record_store = record_store or open_record_store()
+        self.fsync_policy = fsync_policy
+        self.output_dir = output_dir
+        self.session = None
+        self.counts = {"listing": 0, "product": 0, "failed": 0}
+        self._outputs = {}
+
+    def browser(self):
+        if self.session is None:
+            self.session = DriverSession(partial(create_driver, self.profile))
+        return self.session
+
+    def outputs(self, payload):
+        """Return the listings writer, detailed writer and on_product callback for an item's category and crawl"""
+        output_key = (payload["category_name"], payload["crawl_id"])
+        if output_key not in self._outputs:
+            os.makedirs(self.output_dir, exist_ok=True)
+            prefix = os.path.join(self.output_dir, f"1stdibs_{payload['category_name']}")
+            suffix = f"{payload['crawl_id']}_{self.worker_id}.jsonl"
+            listings_writer = JsonlWriter(f"{prefix}_listings_{suffix}", self.fsync_policy)
+            detailed_writer = JsonlWriter(f"{prefix}_detailed_{suffix}", self.fsync_policy)
+            self._outputs[output_key] = (listings_writer, detailed_writer, product_sink(self.record_store, detailed_writer))
+        return self._outputs[output_key]
+
+    def read_listing_page(self, url):
+        """Return a listing page's listings and HTML, over HTTP when its embedded JSON has them, otherwise from Chrome"""
+        if self.http_session is not None:
+            try:
+                self.wait_policy.pause()
+                with metrics.timer("scraper_http_fetch_seconds", page_type="listing"):
+                    page_html = fetch_html(self.http_session, url)
+                listings = extract_listings_from_html(page_html)
+                if listings:
+                    metrics.incr("scraper_listing_pages_total", source="http")
+                    return listings, page_html
+            except requests.RequestException as e:
+                logger.warning(f"HTTP fetch failed for {url}: {str(e)}")
+
+        def render(driver):
+            self.wait_policy.pause()
+            load_page(driver, url, "listing")
+            return read_rendered_listing_page(driver, self.wait_policy, "js", self.registry), driver.page_source
+        rendered = self.browser().run(render)
+        if rendered is None or rendered[0] is None:
+            raise CrawlError(f"No product listings found on {url}")
+        metrics.incr("scraper_listing_pages_total", source="browser")
+        return rendered
+
+    def process_listing(self, payload):
+        url = build_page_url(payload["category_url"], payload["page"])
+        listings, page_html = self.read_listing_page(url)
+        logger.info(f"Found {len(listings)} products on page {payload['page']} of {payload['category_name']}")
+
+        crawl_id, max_pages = payload["crawl_id"], payload["max_pages"]
+        next_pages = []
+        pagination = parse_pagination(page_html) if payload["page"] == 1 else None
+        if pagination:
+            # The result count gives every page at once, so later pages need not look for a next link
+            last_page = pagination["last_page"] if max_pages is None else min(pagination["last_page"], max_pages)
+            next_pages = range(2, last_page + 1)
+        elif not payload.get("paginated") and find_next_page_url(page_html, url):
+            if max_pages is None or payload["page"] < max_pages:
+                next_pages = [payload["page"] + 1]
+        items = [("listing", f"{crawl_id}:listing:{payload['category_url']}:{page}",
+                  dict(payload, page=page, paginated=bool(pagination) or payload.get("paginated", False)))
+                 for page in next_pages]
+        items += [("product", f"{crawl_id}:product:{listing['product_id']}",
+                   {"crawl_id": crawl_id, "category_name": payload["category_name"], "listing": listing})
+                  for listing in listings]
+        self.work_queue.put_many(items)
+
+        listings_writer = self.outputs(payload)[0]
+        for listing in listings:
+            listings_writer.write(listing)
+        listings_writer.sync()
+
+    def process_product(self, payload):
+        listing = payload["listing"]
+        product = None
+        if self.http_session is not None:
+            self.wait_policy.pause()
+            product = fetch_product_details(self.http_session, listing)
+        if product is None:
+            product = self.browser().run(scrape_product_details, listing["url"], listing["product_id"], listing,
+                                         self.wait_policy, self.registry)
+        if not product:
+            raise CrawlError(f"Could not extract {listing['url']}")
+        _, detailed_writer, on_product = self.outputs(payload)
+        on_product(product)
+        detailed_writer.sync()
+
+    def run(self, idle_timeout=None, max_items=None):
+        """Handle items until the queue is drained, or until nothing could be leased for idle_timeout seconds.
+
+        Returns the number of listing and product pages handled and of items
+        that failed.
+        """
+        handlers = {"listing": self.process_listing, "product": self.process_product}
+        keeper = LeaseKeeper(self.work_queue, self.worker_id, self.lease_seconds)
+        idle_since = None
+        handled = 0
+        try:
+            while max_items is None or handled < max_items:
+                limit = WORKER_LEASE_BATCH if max_items is None else min(WORKER_LEASE_BATCH, max_items - handled)
+                items = self.work_queue.lease(self.worker_id, limit, self.lease_seconds)
+                if not items:
+                    if self.work_queue.is_drained():
+                        break
+                    # Other workers hold the remaining items; theirs may expire or queue more
+                    idle_since = idle_since or time.monotonic()
+                    if idle_timeout is not None and time.monotonic() - idle_since >= idle_timeout:
+                        break
+                    time.sleep(WORKER_POLL_SECONDS)
+                    continue
+                idle_since = None
+                keeper.hold(item["id"] for item in items)
+                for item in items:
+                    try:
+                        handlers[item["kind"]](item["payload"])
+                        self.work_queue.ack(item["id"], self.worker_id)
+                        self.counts[item["kind"]] += 1
+                    except Exception as e:
+                        logger.warning(f"{item['kind'].capitalize()} item {item['key']} failed on attempt {item['attempts']}: {str(e)}")
+                        self.work_queue.fail(item["id"], self.worker_id, str(e))
+                        self.counts["failed"] += 1
+                    finally:
+                        keeper.release(item["id"])
+                    handled += 1
+        finally:
+            keeper.close()
+        return dict(self.counts)
+
+    def close(self):
+        for listings_writer, detailed_writer, _ in self._outputs.values():
+            listings_writer.close()
+            detailed_writer.close()
+        if self.session is not None:
+            self.session.close()
+        if self.http_session is not None:
+            self.http_session.close()
+        if self.own_record_store:
+            self.record_store.close()
+
+def run_workers(work_queue, num_workers=1, idle_timeout=None, selector_stats_path=DEFAULT_SELECTOR_STATS_PATH, **worker_options):
+    """Run num_workers CrawlWorkers on threads of this process until the queue is drained, returning their counts"""
+    registry = SelectorRegistry(selector_stats_path)
+    record_store = open_record_store()
+    base_id = worker_options.pop("worker_id", None) or default_worker_id()
+
+    def work(number):
+        worker = CrawlWorker(work_queue, f"{base_id}-{number}" if num_workers > 1 else base_id, registry=registry,
+                             record_store=record_store, **worker_options)
+        try:
+            return worker.run(idle_timeout)
+        finally:
+            worker.close()
+
+    try:
+        with ThreadPoolExecutor(max_workers=num_workers, thread_name_prefix="crawl-worker") as executor:
+            return list(executor.map(work, range(1, num_workers + 1)))
+    finally:
+        registry.save()
+        record_store.close()
+
+def print_counts(work_queue):
+    for kind, counts in sorted(work_queue.counts().items()):
+        print(f"{kind:<10} " + "  ".join(f"{status} {counts[status]}" for status in ITEM_STATUSES))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Crawl categories with any number of workers sharing a work queue")
+    parser.add_argument("--queue", default=DEFAULT_QUEUE_PATH, help="SQLite work queue, on storage every worker can reach")
+    parser.add_argument("--journal-mode", default="WAL", help="use DELETE when workers on several machines share the queue file")
+    parser.add_argument("--log-level", default="INFO", choices=("DEBUG", "INFO", "WARNING", "ERROR"))
+    commands = parser.add_subparsers(dest="command", required=True)
+    seed = commands.add_parser("seed", help="queue categories for the workers")
+    seed.add_argument("targets", nargs="+", help='category number, name or URL, optionally with "@pages", e.g. lighting@5')
+    seed.add_argument("--max-pages", type=int, help="page limit for targets without their own")
+    seed.add_argument("--crawl-id", help="crawl to add the targets to (default: a new one named after the time)")
+    work = commands.add_parser("work", help="take items from the queue until it is drained")
+    work.add_argument("--workers", type=int, default=1, help="workers in this process, each with its own browser when needed")
+    work.add_argument("--worker-id", help="name for this process's workers (default: host name and process id)")
+    work.add_argument("--lease-seconds", type=int, default=DEFAULT_LEASE_SECONDS)
+    work.add_argument("--idle-timeout", type=float, help="stop after this many seconds with nothing to lease")
+    work.add_argument("--profile", default="lean", help="browser profile (full, lean or lean-no-images)")
+    work.add_argument("--no-fast-path", action="store_true", help="render every page in Chrome")
+    work.add_argument("--metrics-path", help="write metrics here at the end (.json for JSON, else Prometheus text)")
+    commands.add_parser("status", help="count the queue's items by kind and status")
+    commands.add_parser("retry-failed", help="queue failed items again")
+    args = parser.parse_args(argv)
+    configure_logging(args.log_level)
+
+    work_queue = SqliteWorkQueue(args.queue, journal_mode=args.journal_mode)
+    try:
+        if args.command == "seed":
+            crawl_id = args.crawl_id or datetime.now().strftime("%Y%m%d_%H%M%S")
+            for target in args.targets:
+                category, pages = parse_target(target, args.max_pages)
+                seed_crawl(work_queue, category, pages, crawl_id)
+            print(f"Seeded crawl {crawl_id} in {args.queue}")
+        elif args.command == "work":
+            results = run_workers(work_queue, args.workers, args.idle_timeout, worker_id=args.worker_id,
+                                  lease_seconds=args.lease_seconds, fast_path=not args.no_fast_path, browser_profile=args.profile)
+            for counts in results:
+                print(f"{counts['listing']} listing pages, {counts['product']} product pages, {counts['failed']} failures")
+            if args.metrics_path:
+                metrics.write(args.metrics_path)
+        elif args.command == "retry-failed":
+            print(f"{work_queue.retry_failed()} failed items queued again")
+        print_counts(work_queue)
+    finally:
+        work_queue.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
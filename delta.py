@@ -0,0 +1,261 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+from http_extract import parse_price
+from image_downloader import read_records
+from metrics import configure_logging
+from output_writer import JsonlWriter
+from product_records import spec_key, upscale_image_url
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DELTA_INDEX_PATH = 'scraped_data/delta_index.sqlite'
+
+# Fields that describe how a record was scraped or stored locally rather than the product
+VOLATILE_FIELDS = ("raw_data", "image_path", "image_sha256", "image_files")
+
+# Run timestamp embedded in output file names, e.g. 1stdibs_lighting_detailed_20250322_192705.json
+SNAPSHOT_TIME_PATTERN = re.compile(r'_(\d{8}_\d{6})')
+
+CHANGE_TYPES = ("new", "changed", "removed")
+
+def normalise_text(text):
+    """Collapse runs of whitespace and strip the ends"""
+    return " ".join(text.split())
+
+def normalise_value(value):
+    if isinstance(value, str):
+        return normalise_text(value)
+    if isinstance(value, dict):
+        return {key: normalise_value(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [normalise_value(item) for item in value]
+    return value
+
+def normalise_record(product):
+    """Return the parts of a product record that describe the product, in a form that only changes when it does.
+
+    Whitespace is collapsed, the price becomes an amount and currency, the
+    image URL is set to the hero width whatever size the page offered, and
+    specification labels are turned into keys the way the scraper does.
+    """
+    record = {key: normalise_value(value) for key, value in product.items() if key not in VOLATILE_FIELDS}
+    if record.get("image_url"):
+        record["image_url"] = upscale_image_url(record["image_url"])
+    if isinstance(record.get("specifications"), dict):
+        record["specifications"] = {spec_key(label): value for label, value in record["specifications"].items()}
+    amount, currency, _, _ = parse_price(record.get("price"))
+    if amount is not None:
+        record["price"] = {"amount": amount, "currency": currency}
+    return record
+
+def record_hash(record):
+    """Hash a normalised product record"""
+    return hashlib.sha256(json.dumps(record, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+def changed_fields(old, new):
+    """Map each field whose normalised value differs to its old and new value"""
+    return {
+        field: {"old": old.get(field), "new": new.get(field)}
+        for field in sorted(set(old) | set(new)) if old.get(field) != new.get(field)
+    }
+
+def in_other_currency(old_price, new_price):
+    """Check whether two normalised prices are in different known currencies, so their amounts cannot be compared"""
+    if not (isinstance(old_price, dict) and isinstance(new_price, dict)):
+        return False
+    return None not in (old_price["currency"], new_price["currency"]) and old_price["currency"] != new_price["currency"]
+
+def isoformat(timestamp):
+    return datetime.fromtimestamp(timestamp).isoformat(timespec="seconds")
+
+class DeltaIndex:
+    """The last snapshot of each crawl and every product's price history, backed by SQLite.
+
+    snapshot holds, per crawl key (the category URL) and product_id, the hash
+    and normalised content of the record last seen, so a run can tell which
+    products are new, changed or gone without reading an earlier output file.
+    price_history gets a row only when a product's price differs from its
+    last row in that currency, so a product whose price never moves costs
+    one row per currency it was seen in.
+    """
+
+    def __init__(self, path=DEFAULT_DELTA_INDEX_PATH):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS snapshot (
+                    crawl_key TEXT NOT NULL,
+                    product_id TEXT NOT NULL,
+                    content_hash TEXT NOT NULL,
+                    record TEXT NOT NULL,
+                    first_seen REAL NOT NULL,
+                    last_seen REAL NOT NULL,
+                    PRIMARY KEY (crawl_key, product_id)
+                )
+            """)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS price_history (
+                    product_id TEXT NOT NULL,
+                    observed_at REAL NOT NULL,
+                    amount REAL,
+                    currency TEXT
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS price_history_product ON price_history (product_id, observed_at)")
+
+    def _record_price(self, product_id, price, observed_at):
+        """Append a price history row if the price differs from the product's last one; returns True if it did.
+
+        A price in another currency than the last one is compared with the
+        last price in its own currency, and its first row is not a change.
+        """
+        amount, currency = (price["amount"], price["currency"]) if isinstance(price, dict) else (None, None)
+        query = "SELECT amount, currency FROM price_history WHERE product_id = ?{} ORDER BY observed_at DESC LIMIT 1"
+        last = self._conn.execute(query.format(""), (product_id,)).fetchone()
+        if last is not None and in_other_currency({"amount": last[0], "currency": last[1]}, price):
+            last = self._conn.execute(query.format(" AND currency = ?"), (product_id, currency)).fetchone()
+        if (last is None and amount is None) or last == (amount, currency):
+            return False
+        self._conn.execute("INSERT INTO price_history (product_id, observed_at, amount, currency) VALUES (?, ?, ?, ?)",
+                           (product_id, observed_at, amount, currency))
+        return last is not None
+
+    def apply_run(self, crawl_key, products, writer, present_ids=None, observed_at=None):
+        """Compare a run's products with the crawl's snapshot, writing a delta for each new, changed or removed one.
+
+        present_ids are the product_ids the listing pages of a crawl that
+        covered the whole category showed, products skipped as fresh
+        included. Snapshot products missing from them are written as removed;
+        pass None after a partial crawl so nothing is. The snapshot and price
+        history are updated in the same transaction. Returns the number of
+        products per change type, plus unchanged and price_changes.
+        """
+        observed_at = observed_at or time.time()
+        counts = dict.fromkeys(CHANGE_TYPES + ("unchanged", "price_changes"), 0)
+        seen = set()
+        with self._lock, self._conn:
+            for product in products:
+                product_id = product.get("product_id")
+                if not product_id:
+                    continue
+                seen.add(product_id)
+                record = normalise_record(product)
+                new_hash = record_hash(record)
+                row = self._conn.execute("SELECT content_hash, record FROM snapshot WHERE crawl_key = ? AND product_id = ?",
+                                         (crawl_key, product_id)).fetchone()
+                if self._record_price(product_id, record.get("price"), observed_at):
+                    counts["price_changes"] += 1
+                if row is not None and row[0] == new_hash:
+                    counts["unchanged"] += 1
+                    self._conn.execute("UPDATE snapshot SET last_seen = ? WHERE crawl_key = ? AND product_id = ?",
+                                       (observed_at, crawl_key, product_id))
+                    continue
+
+                fields = None
+                if row is not None:
+                    old_record = json.loads(row[1])
+                    fields = changed_fields(old_record, record)
+                    if in_other_currency(old_record.get("price"), record.get("price")):
+                        # The same price shown in another currency, e.g. by a crawl on another path, is not a change
+                        del fields["price"]
+                if fields == {}:
+                    counts["unchanged"] += 1
+                else:
+                    delta = {"change": "new" if row is None else "changed", "product_id": product_id,
+                             "url": product.get("url"), "observed_at": isoformat(observed_at)}
+                    if fields is not None:
+                        delta["fields"] = fields
+                    delta["product"] = {key: value for key, value in product.items() if key != "raw_data"}
+                    writer.write(delta)
+                    counts[delta["change"]] += 1
+                self._conn.execute(
+                    "INSERT INTO snapshot (crawl_key, product_id, content_hash, record, first_seen, last_seen) VALUES (?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT (crawl_key, product_id) DO UPDATE SET content_hash = excluded.content_hash, "
+                    "record = excluded.record, last_seen = excluded.last_seen",
+                    (crawl_key, product_id, new_hash, json.dumps(record, ensure_ascii=False), observed_at, observed_at)
+                )
+
+            if present_ids is not None:
+                # Products that were listed but not scraped again are still there
+                self._conn.executemany("UPDATE snapshot SET last_seen = ? WHERE crawl_key = ? AND product_id = ?",
+                                       [(observed_at, crawl_key, product_id) for product_id in set(present_ids) - seen])
+                rows = self._conn.execute("SELECT product_id, record, last_seen FROM snapshot WHERE crawl_key = ?",
+                                          (crawl_key,)).fetchall()
+                removed = [row for row in rows if row[0] not in seen and row[0] not in present_ids]
+                for product_id, record, last_seen in removed:
+                    writer.write({"change": "removed", "product_id": product_id, "url": json.loads(record).get("url"),
+                                  "observed_at": isoformat(observed_at), "last_seen": isoformat(last_seen)})
+                self._conn.executemany("DELETE FROM snapshot WHERE crawl_key = ? AND product_id = ?",
+                                       [(crawl_key, row[0]) for row in removed])
+                counts["removed"] = len(removed)
+        return counts
+
+    def price_history(self, product_id):
+        """Return a product's recorded prices, oldest first"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT observed_at, amount, currency FROM price_history WHERE product_id = ? ORDER BY observed_at", (product_id,)
+            ).fetchall()
+        return [{"observed_at": isoformat(observed_at), "amount": amount, "currency": currency}
+                for observed_at, amount, currency in rows]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+def write_deltas(delta_index, crawl_key, products, deltas_path, present_ids=None, observed_at=None):
+    """Write a run's deltas to a JSON Lines file and return the counts from DeltaIndex.apply_run"""
+    writer = JsonlWriter(deltas_path, fsync_policy="never", mode="w")
+    try:
+        counts = delta_index.apply_run(crawl_key, products, writer, present_ids, observed_at)
+    finally:
+        writer.close()
+    logger.info(f"{counts['new']} new, {counts['changed']} changed and {counts['removed']} removed products "
+                f"({counts['price_changes']} price changes) written to {deltas_path}")
+    return counts
+
+def snapshot_time(path):
+    """Return when a snapshot file was written, from the timestamp in its name or else its modification time"""
+    match = SNAPSHOT_TIME_PATTERN.search(os.path.basename(path))
+    if match:
+        return datetime.strptime(match.group(1), "%Y%m%d_%H%M%S").timestamp()
+    return os.path.getmtime(path)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare detailed product snapshots with the delta index, oldest first")
+    parser.add_argument("crawl_key", help="category URL the snapshots were crawled from")
+    parser.add_argument("snapshots", nargs="+", help="detailed products files (.jsonl or _complete.json), oldest first")
+    parser.add_argument("--index", default=DEFAULT_DELTA_INDEX_PATH)
+    parser.add_argument("--partial", action="store_true", help="the snapshots do not cover the whole category; report no removals")
+    args = parser.parse_args(argv)
+    configure_logging()
+
+    delta_index = DeltaIndex(args.index)
+    try:
+        for path in args.snapshots:
+            products = read_records(path)
+            deltas_path = re.sub(r'(_complete)?\.jsonl?$', '', path) + "_deltas.jsonl"
+            present_ids = None if args.partial else {product.get("product_id") for product in products}
+            counts = write_deltas(delta_index, args.crawl_key, products, deltas_path, present_ids, snapshot_time(path))
+            print(f"{path}: {counts['new']} new, {counts['changed']} changed, {counts['removed']} removed, "
+                  f"{counts['unchanged']} unchanged -> {deltas_path}")
+    finally:
+        delta_index.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
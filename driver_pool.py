@@ -0,0 +1,387 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from selenium import webdriver
+from selenium.common.exceptions import (InvalidSessionIdException, NoSuchWindowException, SessionNotCreatedException,
+                                        WebDriverException)
+from selenium.webdriver.chrome.service import Service
+from urllib3.exceptions import MaxRetryError
+from webdriver_manager.chrome import ChromeDriverManager
+from browser_profile import resolve_profile
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Where the resolved chromedriver path is remembered between runs
+DRIVER_PATH_CACHE = os.path.expanduser('~/.cache/1stdibs-scraper/chromedriver_path')
+
+# WebDriver error messages that mean the browser or its session is gone
+SESSION_ERROR_MESSAGES = ("invalid session id", "session deleted", "chrome not reachable", "disconnected",
+                          "target crashed", "no such window")
+
+# Check a browser's memory every this many pages; reading /proc is not free
+RSS_CHECK_INTERVAL = 10
+
+# Seconds DriverPool.acquire waits for a browser to be released before giving up
+POOL_ACQUIRE_TIMEOUT = 300
+
+_driver_path = None
+_driver_path_lock = threading.Lock()
+
+def resolve_driver_path(refresh=False):
+    """Return the chromedriver binary path without a network lookup when it is already known.
+
+    CHROMEDRIVER_PATH pins the binary explicitly. Otherwise the path found
+    on an earlier run is read from DRIVER_PATH_CACHE, as long as the binary
+    is still there. Only when neither exists, or with refresh, does
+    webdriver_manager resolve (and download) a driver, pinned to
+    CHROMEDRIVER_VERSION if that is set. The result is kept for the life of
+    the process.
+    """
+    global _driver_path
+    with _driver_path_lock:
+        if _driver_path and not refresh:
+            return _driver_path
+
+        path = os.environ.get("CHROMEDRIVER_PATH")
+        if not path and not refresh and os.path.exists(DRIVER_PATH_CACHE):
+            with open(DRIVER_PATH_CACHE, encoding='utf-8') as f:
+                cached = f.read().strip()
+            if os.path.isfile(cached):
+                path = cached
+            else:
+                logger.info(f"Cached chromedriver {cached} is gone")
+        if not path:
+            logger.info("Resolving chromedriver with webdriver_manager...")
+            path = ChromeDriverManager(driver_version=os.environ.get("CHROMEDRIVER_VERSION")).install()
+            os.makedirs(os.path.dirname(DRIVER_PATH_CACHE), exist_ok=True)
+            with open(DRIVER_PATH_CACHE, 'w', encoding='utf-8') as f:
+                f.write(path)
+        _driver_path = path
+        return path
+
+def create_driver(profile=None):
+    """Create a Chrome WebDriver configured for stability and to avoid detection.
+
+    profile is a BrowserProfile or the name of one ("full", "lean" or
+    "lean-no-images"); it sets headless mode and the blocked URL patterns.
+    If Chrome refuses the cached chromedriver, e.g. after a Chrome update,
+    the driver is resolved again once and the launch retried.
+    """
+    profile = resolve_profile(profile)
+
+    # Initialize the Chrome WebDriver
+    try:
+        driver = webdriver.Chrome(service=Service(resolve_driver_path()), options=profile.chrome_options())
+    except SessionNotCreatedException as e:
+        if os.environ.get("CHROMEDRIVER_PATH"):
+            raise
+        logger.warning(f"Chrome rejected chromedriver ({str(e).splitlines()[0]}) - resolving it again")
+        driver = webdriver.Chrome(service=Service(resolve_driver_path(refresh=True)), options=profile.chrome_options())
+    driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
+    profile.apply(driver)
+    return driver
+
+def is_healthy(driver):
+    """Check that a driver's browser still answers commands"""
+    try:
+        return driver.execute_script("return 1") == 1
+    except Exception:
+        return False
+
+def quit_driver(driver):
+    try:
+        driver.quit()
+    except Exception:
+        pass
+
+def is_session_error(error):
+    """Check whether an exception means the browser session has died rather than a page misbehaving"""
+    if isinstance(error, (InvalidSessionIdException, NoSuchWindowException, MaxRetryError, ConnectionError)):
+        return True
+    return isinstance(error, WebDriverException) and any(message in str(error).lower() for message in SESSION_ERROR_MESSAGES)
+
+def process_tree_rss(pid):
+    """Total resident memory in bytes of a process and all its descendants, read from /proc"""
+    children = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat', encoding='utf-8') as f:
+                parent = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, ValueError, IndexError):
+            continue
+        children.setdefault(parent, []).append(int(entry))
+
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f'/proc/{current}/statm', encoding='utf-8') as f:
+                total += int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        except (OSError, ValueError, IndexError):
+            pass
+        pending.extend(children.get(current, []))
+    return total
+
+def driver_rss_bytes(driver):
+    """Resident memory of chromedriver and the Chrome processes it started, or None where /proc is unavailable"""
+    try:
+        pid = driver.service.process.pid
+    except AttributeError:
+        return None
+    if not os.path.isdir('/proc'):
+        return None
+    return process_tree_rss(pid)
+
+class SessionStats:
+    """Counters for browser recycles, crash restarts and product URLs retried or given up on"""
+
+    FIELDS = ("recycles", "restarts", "retried_urls", "failed_urls")
+
+    def __init__(self):
+        self.counts = dict.fromkeys(self.FIELDS, 0)
+        self._lock = threading.Lock()
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            self.counts[name] += amount
+
+    def __getitem__(self, name):
+        return self.counts[name]
+
+    def summary(self):
+        return (f"Browser sessions: {self.counts['recycles']} recycled, {self.counts['restarts']} restarted after a crash, "
+                f"{self.counts['retried_urls']} URLs retried, {self.counts['failed_urls']} URLs given up")
+
+class DriverSession:
+    """A browser that is replaced when it wears out or dies.
+
+    The driver is recycled once it has loaded max_pages pages or its process
+    tree uses more than max_rss_mb of resident memory. run() relaunches the
+    browser when its session dies and retries the page on the new one.
+    factory starts a driver and dispose gets rid of a worn-out or dead one,
+    so a DriverPool can supply both (pool.acquire and pool.discard).
+    """
+
+    def __init__(self, factory=create_driver, dispose=quit_driver, max_pages=None, max_rss_mb=None, stats=None):
+        self.factory = factory
+        self.dispose = dispose
+        self.max_pages = max_pages
+        self.max_rss_mb = max_rss_mb
+        self.stats = stats or SessionStats()
+        self.driver = factory()
+        self.pages = 0
+        self.dead = False
+
+    def _replace(self):
+        if self.driver is not None:
+            self.dispose(self.driver)
+        # Until a replacement starts there is no browser, so a factory error leaves the session waiting for a restart
+        self.driver = None
+        self.dead = True
+        self.driver = self.factory()
+        self.pages = 0
+        self.dead = False
+
+    def due_for_recycle(self):
+        """Return why the browser should be recycled, or None"""
+        if self.max_pages and self.pages >= self.max_pages:
+            return f"{self.pages} pages"
+        if self.max_rss_mb and self.pages and self.pages % RSS_CHECK_INTERVAL == 0:
+            rss = driver_rss_bytes(self.driver)
+            if rss and rss > self.max_rss_mb * 1024 * 1024:
+                return f"reaching {rss / 1024 / 1024:.0f} MB resident memory"
+        return None
+
+    def recycle_if_due(self):
+        """Swap in a fresh browser if this one is worn out, returning True if it was replaced"""
+        reason = self.due_for_recycle()
+        if reason is None:
+            return False
+        logger.info(f"Recycling browser after {reason}")
+        self._replace()
+        self.stats.incr("recycles")
+        metrics.incr("scraper_browser_events_total", event="recycle")
+        return True
+
+    def restart(self):
+        """Replace a browser whose session has died"""
+        logger.warning("Relaunching browser after its session died")
+        self._replace()
+        self.stats.incr("restarts")
+        metrics.incr("scraper_browser_events_total", event="restart")
+
+    def page_done(self):
+        self.pages += 1
+
+    def run(self, func, *args, retries=2):
+        """Call func(driver, *args) as one page load, retrying on a relaunched browser if the session dies.
+
+        Returns None once the retries are used up, leaving the dead browser to
+        be relaunched by the next run() rather than straight away.
+        """
+        for attempt in range(retries + 1):
+            # A browser that died on the last attempt is only relaunched once there is a page for it
+            if self.dead:
+                self.restart()
+            self.recycle_if_due()
+            try:
+                result = func(self.driver, *args)
+                self.page_done()
+                return result
+            except Exception as e:
+                if not is_session_error(e):
+                    raise
+                logger.warning(f"Browser session died: {str(e).splitlines()[0] if str(e) else type(e).__name__}")
+                self.dead = True
+                if attempt < retries:
+                    self.stats.incr("retried_urls")
+        self.stats.incr("failed_urls")
+        return None
+
+    def close(self, release=None):
+        """Quit the browser, or hand it to release (e.g. DriverPool.release) for reuse"""
+        if self.driver is not None:
+            (release or self.dispose)(self.driver)
+            self.driver = None
+
+class PoolExhausted(Exception):
+    """No pooled browser was released in time while every slot was in use"""
+    pass
+
+class DriverPool:
+    """Pool of started Chrome drivers that are handed out and returned between jobs.
+
+    Up to `size` browsers are launched, `prelaunch` of them up front. A
+    driver is health-checked when it is acquired and replaced if its browser
+    has died, so callers always get a working driver. Return drivers with
+    release(), or use `with pool.driver() as driver:`.
+    """
+
+    def __init__(self, size=1, profile=None, driver_factory=create_driver, prelaunch=0):
+        self.size = size
+        self.profile = resolve_profile(profile)
+        self.driver_factory = driver_factory
+        self.launched = 0
+        self.replaced = 0
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._closed = False
+        self.warm(prelaunch)
+
+    def warm(self, count):
+        """Launch browsers in parallel until count of them are idle or the pool is full"""
+        with self._lock:
+            count = min(count - self._idle.qsize(), self.size - self.launched)
+            if count <= 0:
+                return
+            # Reserve the slots now so a concurrent acquire cannot overfill the pool
+            self.launched += count
+        with ThreadPoolExecutor(max_workers=count) as executor:
+            futures = [executor.submit(self.driver_factory, self.profile) for _ in range(count)]
+        for future in futures:
+            try:
+                self._idle.put(future.result())
+            except Exception as e:
+                logger.warning(f"Could not prelaunch a browser: {str(e)}")
+                with self._lock:
+                    self.launched -= 1
+
+    def _launch(self):
+        with self._lock:
+            self.launched += 1
+        try:
+            return self.driver_factory(self.profile)
+        except Exception:
+            with self._lock:
+                self.launched -= 1
+            raise
+
+    def acquire(self, timeout=POOL_ACQUIRE_TIMEOUT):
+        """Hand out a healthy driver, launching one if the pool has room, else waiting for a release.
+
+        Raises PoolExhausted if no driver is released within timeout seconds
+        (None waits forever).
+        """
+        while True:
+            try:
+                driver = self._idle.get_nowait()
+            except queue.Empty:
+                with self._lock:
+                    has_room = self.launched < self.size
+                if has_room:
+                    driver = self._launch()
+                else:
+                    try:
+                        driver = self._idle.get(timeout=timeout)
+                    except queue.Empty:
+                        raise PoolExhausted(f"All {self.size} pooled browsers stayed in use for {timeout}s") from None
+
+            if is_healthy(driver):
+                return driver
+            logger.warning("Pooled browser is not responding - replacing it")
+            self.discard(driver)
+            metrics.incr("scraper_browser_events_total", event="pool_replace")
+            with self._lock:
+                self.replaced += 1
+
+    def release(self, driver):
+        """Return a driver to the pool for the next job"""
+        if self._closed:
+            self.discard(driver)
+        else:
+            self._idle.put(driver)
+
+    def discard(self, driver):
+        """Quit a driver that should not be reused and free its slot"""
+        quit_driver(driver)
+        with self._lock:
+            self.launched -= 1
+
+    @contextmanager
+    def driver(self):
+        driver = self.acquire()
+        try:
+            yield driver
+        finally:
+            self.release(driver)
+
+    def close(self):
+        """Quit every idle browser; drivers still checked out are quit when released"""
+        self._closed = True
+        while True:
+            try:
+                self.discard(self._idle.get_nowait())
+            except queue.Empty:
+                break
+
+_shared_pools = {}
+_shared_pools_lock = threading.Lock()
+
+def shared_pool(profile="full", size=1, prelaunch=0):
+    """Return the process-wide pool for a profile name, so repeated jobs reuse its browsers.
+
+    prelaunch browsers are started up front (or topped up) so the first job
+    does not wait for Chrome to start.
+    """
+    with _shared_pools_lock:
+        if profile not in _shared_pools:
+            _shared_pools[profile] = DriverPool(size, profile)
+        pool = _shared_pools[profile]
+        pool.size = max(pool.size, size)
+    pool.warm(prelaunch)
+    return pool
+
+@atexit.register
+def close_shared_pools():
+    with _shared_pools_lock:
+        for pool in _shared_pools.values():
+            pool.close()
+        _shared_pools.clear()
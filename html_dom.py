@@ -0,0 +1,544 @@
+import bisect
+import re
+from html.parser import HTMLParser
+from urllib.parse import urljoin
+from selenium.common.exceptions import InvalidSelectorException, NoSuchElementException
+from selenium.webdriver.common.by import By
+
+try:
+    import lxml.etree
+    from cssselect import HTMLTranslator, SelectorError
+except ImportError:
+    lxml = None
+
+# Elements that never have children or an end tag
+VOID_ELEMENTS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "param", "source", "track", "wbr"}
+
+# Elements whose contents are never part of an element's visible text
+INVISIBLE_ELEMENTS = {"script", "style", "noscript", "template", "head", "title"}
+
+# Inline styles that stop an element rendering, so a browser reports no text for it
+HIDDEN_STYLE_PATTERN = re.compile(r'(?:^|;)\s*(?:display\s*:\s*none|visibility\s*:\s*hidden)\b', re.IGNORECASE)
+
+# data-tn values of the quick view panel in each listing tile. The site's stylesheets hide it until its
+# button is clicked, and a saved page does not carry the stylesheets, so it is named here instead
+STYLESHEET_HIDDEN_PATTERN = re.compile(r'^quick-view-(?!button$)')
+
+# Elements that start a new line in an element's visible text, as in a rendered page
+BLOCK_ELEMENTS = {
+    "address", "article", "aside", "blockquote", "dd", "details", "div", "dl", "dt", "fieldset", "figcaption", "figure",
+    "footer", "form", "h1", "h2", "h3", "h4", "h5", "h6", "header", "hr", "li", "main", "nav", "ol", "p", "pre",
+    "section", "summary", "table", "tbody", "thead", "tfoot", "tr", "ul"
+}
+
+# Attributes that get_attribute resolves to absolute URLs, as a browser's DOM properties do
+URL_ATTRIBUTES = {"href", "src"}
+
+# Raw text blocks skipped when searching the page for an element's start tag
+RAW_TEXT_PATTERN = re.compile(r'<(script|style|template)\b.*?</\1\s*>', re.IGNORECASE | re.DOTALL)
+
+COMPOUND_PART_PATTERN = re.compile(
+    r"""(?P<tag>^[a-zA-Z][\w-]*|^\*)"""
+    r"""|\#(?P<id>[\w-]+)"""
+    r"""|\.(?P<cls>[\w-]+)"""
+    r"""|\[\s*(?P<attr>[\w:-]+)\s*(?:(?P<op>[~|^$*]?=)\s*(?:"(?P<dq>[^"]*)"|'(?P<sq>[^']*)'|(?P<bare>[^\]\s]+)))?\s*\]"""
+    r"""|:(?P<pseudo>first-child|last-child)"""
+)
+
+# Characters fed to the parser at a time while reading one element's subtree
+PARSE_CHUNK = 16384
+
+class Compound:
+    """One simple selector sequence, e.g. div.price[data-tn='x']:first-child"""
+
+    def __init__(self, text):
+        self.tag = None
+        self.id = None
+        self.classes = []
+        self.attrs = []
+        self.pseudos = []
+        position = 0
+        while position < len(text):
+            match = COMPOUND_PART_PATTERN.match(text, position)
+            if not match or match.end() == position:
+                raise InvalidSelectorException(f"Unsupported selector: {text}")
+            if match.group("tag"):
+                self.tag = None if match.group("tag") == "*" else match.group("tag").lower()
+            elif match.group("id"):
+                self.id = match.group("id")
+            elif match.group("cls"):
+                self.classes.append(match.group("cls"))
+            elif match.group("attr"):
+                value = next((group for group in match.group("dq", "sq", "bare") if group is not None), None)
+                self.attrs.append((match.group("attr").lower(), match.group("op"), value))
+            else:
+                self.pseudos.append(match.group("pseudo"))
+            position = match.end()
+
+    def matches(self, node):
+        if self.tag and node.tag != self.tag:
+            return False
+        if self.id and node.attrs.get("id") != self.id:
+            return False
+        if self.classes:
+            classes = node.attrs.get("class", "").split()
+            if any(name not in classes for name in self.classes):
+                return False
+        for name, op, value in self.attrs:
+            actual = node.attrs.get(name)
+            if actual is None or not attribute_matches(actual, op, value):
+                return False
+        for pseudo in self.pseudos:
+            siblings = node.parent.elements() if node.parent is not None else [node]
+            if node is not (siblings[0] if pseudo == "first-child" else siblings[-1]):
+                return False
+        return True
+
+    def start_tag_pattern(self):
+        """A regex that finds candidate start tags for this compound in raw HTML, or None if it cannot be anchored"""
+        if self.pseudos:
+            return None
+        tag = re.escape(self.tag) if self.tag else r'[a-zA-Z][\w-]*'
+        literal = self.id or (self.classes[0] if self.classes else None)
+        if literal is None:
+            literal = next((value for _, op, value in self.attrs if op and value), None)
+        if literal is None and self.attrs:
+            literal = self.attrs[0][0]
+        if literal is None:
+            return re.compile(rf'<{tag}[\s/>]', re.IGNORECASE)
+        return re.compile(rf'<{tag}\s[^>]*?{re.escape(literal)}', re.IGNORECASE)
+
+def attribute_matches(actual, op, value):
+    if op is None:
+        return True
+    if op == "=":
+        return actual == value
+    if op == "~=":
+        return value in actual.split()
+    if op == "|=":
+        return actual == value or actual.startswith(value + "-")
+    if op == "^=":
+        return bool(value) and actual.startswith(value)
+    if op == "$=":
+        return bool(value) and actual.endswith(value)
+    return bool(value) and value in actual
+
+def parse_selector(selector):
+    """Split a CSS selector list into chains of (combinator, Compound), with " " or ">" before each compound"""
+    chains = []
+    for part in selector.split(","):
+        tokens = re.findall(r'>|[^\s>]+', part.strip())
+        if not tokens:
+            raise InvalidSelectorException(f"Empty selector in: {selector}")
+        chain = []
+        combinator = " "
+        for token in tokens:
+            if token == ">":
+                combinator = ">"
+                continue
+            chain.append((combinator, Compound(token)))
+            combinator = " "
+        chains.append(chain)
+    return chains
+
+def chain_matches(node, chain, scope):
+    """Check a node against a selector chain, looking at ancestors no further up than scope"""
+    if not chain[-1][1].matches(node):
+        return False
+    position = len(chain) - 1
+    current = node
+    while position > 0:
+        combinator = chain[position][0]
+        compound = chain[position - 1][1]
+        if combinator == ">":
+            current = current.parent if current is not scope else None
+            if current is None or not compound.matches(current):
+                return False
+        else:
+            while True:
+                current = current.parent if current is not scope else None
+                if current is None:
+                    return False
+                if compound.matches(current):
+                    break
+        position -= 1
+    return True
+
+def is_hidden(node):
+    """Check whether an element is hidden itself, as far as saved HTML can tell without computing styles"""
+    return hidden_element(node.tag, node.attrs)
+
+def hidden_element(tag, attrs):
+    return (tag in INVISIBLE_ELEMENTS or "hidden" in attrs
+            or bool(HIDDEN_STYLE_PATTERN.search(attrs.get("style") or ""))
+            or bool(STYLESHEET_HIDDEN_PATTERN.match(attrs.get("data-tn") or "")))
+
+def collect_text(node, lines, current):
+    for child in node.children:
+        if isinstance(child, str):
+            current.append(child)
+            continue
+        if is_hidden(child):
+            continue
+        if child.tag == "br":
+            lines.append("".join(current))
+            current.clear()
+            continue
+        block = child.tag in BLOCK_ELEMENTS
+        if block:
+            lines.append("".join(current))
+            current.clear()
+        elif child.tag in ("td", "th"):
+            current.append(" ")
+        collect_text(child, lines, current)
+        if block:
+            lines.append("".join(current))
+            current.clear()
+
+def join_text_lines(lines):
+    """Collapse whitespace within each line of collected text and drop the empty ones, as WebElement.text does"""
+    collapsed = (re.sub(r'\s+', ' ', line.replace('\xa0', ' ')).strip() for line in lines)
+    return "\n".join(line for line in collapsed if line)
+
+class Node:
+    """An element parsed from saved HTML that answers the WebElement calls the scraper makes.
+
+    find_elements, find_element, text and get_attribute behave like their
+    Selenium counterparts for the CSS selectors the scraper uses, so code
+    written against a live page can read a saved one.
+    """
+
+    def __init__(self, tag, attrs, parent=None, base_url=None):
+        self.tag = tag
+        self.attrs = attrs
+        self.parent = parent
+        self.base_url = base_url
+        self.children = []
+
+    def elements(self):
+        return [child for child in self.children if not isinstance(child, str)]
+
+    def iter_descendants(self):
+        for child in self.children:
+            if not isinstance(child, str):
+                yield child
+                yield from child.iter_descendants()
+
+    def select(self, selector, scope=None, include_self=False):
+        """Return the descendants matching a CSS selector in document order"""
+        chains = parse_selector(selector)
+        scope = scope or self.root()
+        nodes = [self] if include_self else []
+        nodes.extend(self.iter_descendants())
+        return [node for node in nodes if any(chain_matches(node, chain, scope) for chain in chains)]
+
+    def root(self):
+        node = self
+        while node.parent is not None:
+            node = node.parent
+        return node
+
+    def find_elements(self, by, value):
+        if by != By.CSS_SELECTOR:
+            raise InvalidSelectorException(f"Only CSS selectors are supported on saved pages, not {by}")
+        return self.select(value)
+
+    def find_element(self, by, value):
+        elements = self.find_elements(by, value)
+        if not elements:
+            raise NoSuchElementException(f"No element matches {value}")
+        return elements[0]
+
+    @property
+    def text(self):
+        """Visible text with whitespace collapsed and one line per block, like WebElement.text.
+
+        An element inside a hidden one has no text, as in a browser.
+        """
+        if not self.is_displayed():
+            return ""
+        lines = []
+        current = []
+        collect_text(self, lines, current)
+        lines.append("".join(current))
+        return join_text_lines(lines)
+
+    def get_attribute(self, name):
+        value = self.attrs.get(name.lower())
+        if value is not None and name.lower() in URL_ATTRIBUTES and self.base_url:
+            return urljoin(self.base_url, value)
+        return value
+
+    def is_displayed(self):
+        node = self
+        while node is not None:
+            if is_hidden(node):
+                return False
+            node = node.parent
+        return True
+
+    def is_enabled(self):
+        return "disabled" not in self.attrs
+
+class ElementClosed(Exception):
+    """Raised by SubtreeParser to stop parsing once its element is complete"""
+
+class SubtreeParser(HTMLParser):
+    """Builds the Node tree of one element and stops, at the tag that closes it, by raising ElementClosed"""
+
+    def __init__(self, base_url=None):
+        super().__init__(convert_charrefs=True)
+        self.base_url = base_url
+        self.root = None
+        self.stack = []
+
+    def handle_starttag(self, tag, attrs):
+        node = Node(tag, {name: value or "" for name, value in attrs}, self.stack[-1] if self.stack else None, self.base_url)
+        if self.stack:
+            self.stack[-1].children.append(node)
+        else:
+            self.root = node
+        if tag not in VOID_ELEMENTS:
+            self.stack.append(node)
+        elif not self.stack:
+            raise ElementClosed()
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_ELEMENTS and self.stack and self.stack[-1].tag == tag:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if tag in VOID_ELEMENTS:
+            return
+        for depth in range(len(self.stack) - 1, -1, -1):
+            if self.stack[depth].tag == tag:
+                del self.stack[depth:]
+                if not self.stack:
+                    raise ElementClosed()
+                return
+
+    def handle_data(self, data):
+        if self.stack:
+            self.stack[-1].children.append(data)
+
+def parse_element(page_html, start, base_url=None):
+    """Parse the element whose start tag begins at start, returning its Node and the offset just past it"""
+    parser = SubtreeParser(base_url)
+    position = start
+    try:
+        while position < len(page_html):
+            chunk = page_html[position:position + PARSE_CHUNK]
+            parser.feed(chunk)
+            position += len(chunk)
+        parser.close()
+        return parser.root, len(page_html)
+    except ElementClosed:
+        pass
+    # getpos() points at the closing tag as a line and column counted from start
+    line, column = parser.getpos()
+    line_start = start
+    for _ in range(line - 1):
+        line_start = page_html.index("\n", line_start) + 1
+    tag_end = page_html.find(">", line_start + column)
+    return parser.root, len(page_html) if tag_end < 0 else tag_end + 1
+
+class HtmlPage:
+    """A saved page that answers driver.find_elements for CSS selectors without building a full DOM.
+
+    For each selector the raw HTML is searched for start tags that could
+    match its first compound, outside <script> and <style> blocks, and only
+    those elements are parsed. Most of a product or listing page is inline
+    JSON and markup the scraper never reads, so this is many times faster
+    than parsing the whole page. Selectors that cannot be anchored on a
+    start tag fall back to parsing the whole document once.
+    """
+
+    def __init__(self, page_html, url=None):
+        self.page_html = page_html
+        self.current_url = url
+        self._raw_text = None
+        self._document = None
+
+    @property
+    def page_source(self):
+        return self.page_html
+
+    def _in_raw_text(self, offset):
+        if self._raw_text is None:
+            spans = [match.span() for match in RAW_TEXT_PATTERN.finditer(self.page_html)]
+            self._raw_text = ([start for start, _ in spans], [end for _, end in spans])
+        starts, ends = self._raw_text
+        index = bisect.bisect_right(starts, offset) - 1
+        return index >= 0 and offset < ends[index] and offset != starts[index]
+
+    def document(self):
+        """Parse the whole page into a Node tree, once"""
+        if self._document is None:
+            self._document = Node("#document", {}, base_url=self.current_url)
+            parser = SubtreeParser(self.current_url)
+            parser.stack.append(self._document)
+            parser.root = self._document
+            try:
+                parser.feed(self.page_html)
+                parser.close()
+            except ElementClosed:
+                pass
+        return self._document
+
+    def select_chain(self, chain):
+        pattern = chain[0][1].start_tag_pattern()
+        if pattern is None or chain[0][0] != " ":
+            return None
+        results = []
+        covered_until = -1
+        for match in pattern.finditer(self.page_html):
+            if match.start() < covered_until or self._in_raw_text(match.start()):
+                continue
+            node, end = parse_element(self.page_html, match.start(), self.current_url)
+            if node is None or not chain[0][1].matches(node):
+                continue
+            covered_until = end
+            candidates = [node] + list(node.iter_descendants())
+            results.extend(candidate for candidate in candidates if chain_matches(candidate, chain, node))
+        return results
+
+    def find_elements(self, by, value):
+        if by != By.CSS_SELECTOR:
+            raise InvalidSelectorException(f"Only CSS selectors are supported on saved pages, not {by}")
+        chains = parse_selector(value)
+        if len(chains) == 1:
+            results = self.select_chain(chains[0])
+            if results is not None:
+                return results
+        return self.document().select(value)
+
+    def find_element(self, by, value):
+        elements = self.find_elements(by, value)
+        if not elements:
+            raise NoSuchElementException(f"No element matches {value}")
+        return elements[0]
+
+def compiled_selector(selector, prefix):
+    """Translate a CSS selector into a compiled XPath that searches with the given axis, once per selector"""
+    key = (selector, prefix)
+    if key not in _compiled_selectors:
+        try:
+            _compiled_selectors[key] = lxml.etree.XPath(HTMLTranslator().css_to_xpath(selector, prefix=prefix))
+        except SelectorError:
+            raise InvalidSelectorException(f"Unsupported selector: {selector}")
+    return _compiled_selectors[key]
+
+_compiled_selectors = {}
+
+def collect_lxml_text(element, lines, current):
+    if element.text:
+        current.append(element.text)
+    for child in element:
+        # Comments and processing instructions have no text of their own, but what follows them does
+        if isinstance(child.tag, str) and not hidden_element(child.tag, child.attrib):
+            if child.tag == "br":
+                lines.append("".join(current))
+                current.clear()
+            else:
+                block = child.tag in BLOCK_ELEMENTS
+                if block:
+                    lines.append("".join(current))
+                    current.clear()
+                elif child.tag in ("td", "th"):
+                    current.append(" ")
+                collect_lxml_text(child, lines, current)
+                if block:
+                    lines.append("".join(current))
+                    current.clear()
+        if child.tail:
+            current.append(child.tail)
+
+class LxmlNode:
+    """A Node backed by an lxml element, answering the same WebElement calls"""
+
+    def __init__(self, element, base_url=None):
+        self.element = element
+        self.base_url = base_url
+
+    @property
+    def tag(self):
+        return self.element.tag
+
+    @property
+    def attrs(self):
+        return self.element.attrib
+
+    def find_elements(self, by, value):
+        if by != By.CSS_SELECTOR:
+            raise InvalidSelectorException(f"Only CSS selectors are supported on saved pages, not {by}")
+        return [LxmlNode(element, self.base_url) for element in compiled_selector(value, "descendant::")(self.element)]
+
+    def find_element(self, by, value):
+        elements = self.find_elements(by, value)
+        if not elements:
+            raise NoSuchElementException(f"No element matches {value}")
+        return elements[0]
+
+    @property
+    def text(self):
+        """Visible text with whitespace collapsed and one line per block, like Node.text"""
+        if not self.is_displayed():
+            return ""
+        lines = []
+        current = []
+        collect_lxml_text(self.element, lines, current)
+        lines.append("".join(current))
+        return join_text_lines(lines)
+
+    def get_attribute(self, name):
+        value = self.element.get(name.lower())
+        if value is not None and name.lower() in URL_ATTRIBUTES and self.base_url:
+            return urljoin(self.base_url, value)
+        return value
+
+    def is_displayed(self):
+        element = self.element
+        while element is not None:
+            if hidden_element(element.tag, element.attrib):
+                return False
+            element = element.getparent()
+        return True
+
+    def is_enabled(self):
+        return "disabled" not in self.element.attrib
+
+class LxmlPage:
+    """A saved page parsed by lxml, answering driver.find_elements like HtmlPage but many times faster.
+
+    The whole page is parsed up front in C, and CSS selectors are compiled
+    to XPath once per process.
+    """
+
+    def __init__(self, page_html, url=None):
+        self.page_html = page_html
+        self.current_url = url
+        # Bytes, because lxml refuses a str that declares its own encoding; the inline state blob needs huge_tree
+        parser = lxml.etree.HTMLParser(encoding="utf-8", huge_tree=True)
+        self.root = lxml.etree.fromstring(page_html.encode("utf-8"), parser)
+
+    @property
+    def page_source(self):
+        return self.page_html
+
+    def find_elements(self, by, value):
+        if by != By.CSS_SELECTOR:
+            raise InvalidSelectorException(f"Only CSS selectors are supported on saved pages, not {by}")
+        return [LxmlNode(element, self.current_url) for element in compiled_selector(value, "descendant-or-self::")(self.root)]
+
+    def find_element(self, by, value):
+        elements = self.find_elements(by, value)
+        if not elements:
+            raise NoSuchElementException(f"No element matches {value}")
+        return elements[0]
+
+def parse_page(page_html, url=None):
+    """Wrap saved HTML in a page the scraper's selector code can read: LxmlPage when lxml is installed, else HtmlPage"""
+    if lxml is None:
+        return HtmlPage(page_html, url)
+    return LxmlPage(page_html, url)
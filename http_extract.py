@@ -0,0 +1,391 @@
+import html
+import json
+import logging
+import math
+import re
+import sys
+import time
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+import requests
+from requests.adapters import HTTPAdapter
+from metrics import metrics
+from product_records import (extract_product_id, is_valid_listing, spec_key, upscale_image_url, new_product_record,
+                             set_product_field, has_required_product_fields)
+
+logger = logging.getLogger(__name__)
+
+# Same user agent as the Selenium browser profile
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/90.0.4430.212 Safari/537.36'
+
+DEFAULT_HEADERS = {
+    "User-Agent": USER_AGENT,
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+    "Accept-Language": "en-US,en;q=0.9"
+}
+
+JSON_LD_PATTERN = re.compile(r'<script[^>]*type=["\']application/ld\+json["\'][^>]*>(.*?)</script>', re.S | re.I)
+SERVER_VARS_PATTERN = re.compile(r'<script[^>]*id=["\']serverVars_data["\'][^>]*>(.*?)</script>', re.S)
+SERVER_VARS_ASSIGNMENT_PATTERN = re.compile(r'window\.__SERVER_VARS__\s*=\s*(\{.*?\})\s*;?\s*</script>', re.S)
+
+CURRENCY_SYMBOLS = {
+    "USD": "$",
+    "CAD": "CA$",
+    "AUD": "A$",
+    "EUR": "€",
+    "GBP": "£"
+}
+
+# Displayed currency symbols, longest first so CA$ is not read as A$ or $
+PRICE_SYMBOLS = sorted(((symbol, currency) for currency, symbol in CURRENCY_SYMBOLS.items()), key=lambda pair: -len(pair[0]))
+
+PRICE_NUMBER_PATTERN = re.compile(r'\d(?:[\d.,]*\d)?')
+CURRENCY_CODE_PATTERN = re.compile(r'\b([A-Z]{3})\b')
+SALE_PATTERN = re.compile(r'\bsale\b', re.IGNORECASE)
+PRICE_UNIT_PATTERN = re.compile(r'/\s*([A-Za-z]+)')
+
+# Listing tiles in a listing page's markup, and the product link and displayed price inside each
+TILE_START_PATTERN = re.compile(r'<[a-z][^>]*\bdata-tn=["\']item-tile-wrapper["\']', re.I)
+TILE_PRODUCT_PATTERN = re.compile(r'\bhref=["\'][^"\']*/id-([^/"\']+)/?["\']')
+TILE_PRICE_PATTERN = re.compile(r'<([a-z][\w-]*)[^>]*\bdata-tn=["\']price["\'][^>]*>', re.I)
+TAG_PATTERN = re.compile(r'<(/?)([a-zA-Z][\w-]*)[^>]*?(/?)>')
+
+# Elements that never have an end tag
+VOID_ELEMENTS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "param", "source", "track", "wbr"}
+
+# JSON-LD product properties reported as specifications
+JSON_LD_SPEC_PROPERTIES = ["material", "color", "width", "height", "depth", "weight", "productionDate", "countryOfOrigin"]
+
+def build_page_url(category_url, page):
+    """Return the URL of a listing page by setting the category URL's page query parameter"""
+    parts = urlsplit(category_url)
+    query = [(key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True) if key != "page"]
+    if page > 1:
+        query.append(("page", str(page)))
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+def create_session(pool_size=10):
+    """Create an HTTP session that keeps connections to the site alive and reuses them"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update(DEFAULT_HEADERS)
+    return session
+
+def fetch_html(session, url, timeout=15):
+    """Fetch a page over HTTP and return its HTML"""
+    response = session.get(url, timeout=timeout)
+    metrics.incr("scraper_http_responses_total", status=response.status_code)
+    response.raise_for_status()
+    return response.text
+
+def parse_json_ld(page_html):
+    """Return every JSON-LD object embedded in the page, flattening top-level arrays"""
+    blocks = []
+    for match in JSON_LD_PATTERN.finditer(page_html):
+        try:
+            data = json.loads(match.group(1))
+        except ValueError:
+            continue
+        blocks.extend(data if isinstance(data, list) else [data])
+    return blocks
+
+def parse_server_vars(page_html):
+    """Return the window.__SERVER_VARS__ state blob embedded in the page, or None"""
+    match = SERVER_VARS_PATTERN.search(page_html) or SERVER_VARS_ASSIGNMENT_PATTERN.search(page_html)
+    if not match:
+        return None
+    try:
+        return json.loads(match.group(1))
+    except ValueError:
+        return None
+
+def iter_json_ld_products(node):
+    """Yield every schema.org Product found anywhere in parsed JSON-LD"""
+    if isinstance(node, list):
+        for item in node:
+            yield from iter_json_ld_products(item)
+    elif isinstance(node, dict):
+        node_type = node.get("@type")
+        if node_type == "Product" or (isinstance(node_type, list) and "Product" in node_type):
+            yield node
+        for value in node.values():
+            if isinstance(value, (list, dict)):
+                yield from iter_json_ld_products(value)
+
+def relay_store(server_vars):
+    """Return the normalised Relay record store from the server vars"""
+    return ((server_vars or {}).get("dbl") or {}).get("relayData") or {}
+
+def relay_items(server_vars):
+    """Map product IDs to their Relay Item records"""
+    return {
+        record["serviceId"]: record
+        for record in relay_store(server_vars).values()
+        if isinstance(record, dict) and record.get("__typename") == "Item" and record.get("serviceId")
+    }
+
+def relay_creator_names(server_vars, item):
+    """Resolve the display names of an Item's creators"""
+    store = relay_store(server_vars)
+    names = []
+    for ref in (item.get("creators") or {}).get("__refs", []):
+        creator_ref = (store.get(ref) or {}).get("creator") or {}
+        creator = store.get(creator_ref.get("__ref")) or {}
+        if creator.get("displayName"):
+            names.append(creator["displayName"])
+    return names
+
+def relay_photo_url(server_vars, item):
+    """Return the tile-sized URL of an Item's first photo, or None"""
+    store = relay_store(server_vars)
+    for key, photos in item.items():
+        if key.startswith("photos(") and isinstance(photos, dict) and photos.get("__refs"):
+            return (store.get(photos["__refs"][0]) or {}).get("smallPath")
+    return None
+
+def element_text(page_html, start, end):
+    """Return the text of the element whose start tag ends at start, with whitespace collapsed like element.text"""
+    tag_name = None
+    depth = 0
+    for tag in TAG_PATTERN.finditer(page_html, start, end):
+        if tag.group(1):
+            depth -= 1
+            if depth < 0:
+                inner = TAG_PATTERN.sub(" ", page_html[start:tag.start()])
+                return " ".join(html.unescape(inner).split())
+        elif not tag.group(3) and tag.group(2).lower() not in VOID_ELEMENTS:
+            depth += 1
+    return ""
+
+def tile_prices(page_html):
+    """Map product IDs to the price text shown on their listing tiles, e.g. "CA$1,059 / item".
+
+    The Relay store holds each price converted into every currency the site
+    supports but not which one the visitor is shown, so the tiles are read.
+    """
+    starts = [match.start() for match in TILE_START_PATTERN.finditer(page_html)]
+    prices = {}
+    for start, end in zip(starts, starts[1:] + [len(page_html)]):
+        product = TILE_PRODUCT_PATTERN.search(page_html, start, end)
+        price = TILE_PRICE_PATTERN.search(page_html, start, end)
+        if product and price and product.group(1) not in prices:
+            prices[product.group(1)] = element_text(page_html, price.end(), end)
+    return prices
+
+def parse_pagination(page_html, server_vars=None):
+    """Read the page size, result count and last page number from a listing page's embedded state.
+
+    The last page is capped at the number of pages the site will display.
+    Returns None when the page has no search results state.
+    """
+    server_vars = server_vars or parse_server_vars(page_html)
+    search = next((record for record in relay_store(server_vars).values()
+                   if isinstance(record, dict) and "displayMaxNumberOfPages" in record), None)
+    page_size = (((server_vars or {}).get("relay") or {}).get("variables") or {}).get("first")
+    if not search or not page_size or search.get("totalResults") is None:
+        return None
+    last_page = max(1, math.ceil(search["totalResults"] / page_size))
+    if search.get("displayMaxNumberOfPages"):
+        last_page = min(last_page, search["displayMaxNumberOfPages"])
+    return {"page_size": page_size, "total_results": search["totalResults"], "last_page": last_page}
+
+def format_price(amount, currency):
+    """Format a numeric price the way the site displays it, e.g. CA$1,059"""
+    if amount is None or amount == "":
+        return ""
+    try:
+        amount = float(amount)
+    except (TypeError, ValueError):
+        return str(amount)
+    text = f"{amount:,.0f}" if amount.is_integer() else f"{amount:,.2f}"
+    symbol = CURRENCY_SYMBOLS.get(currency, f"{currency} " if currency else "")
+    return f"{symbol}{text}"
+
+def parse_amount(number):
+    """Convert a displayed number such as "1,059", "1.200,50" or "72,001.31" into a float.
+
+    The last "." or "," is the decimal separator when both are used, or when
+    the only one used appears once and is not followed by exactly three digits.
+    """
+    separators = [char for char in number if char in ".,"]
+    if not separators:
+        return float(number)
+    last = separators[-1]
+    if len(set(separators)) == 1 and (len(separators) > 1 or len(number) - number.rindex(last) == 4):
+        # Only thousands separators, as in 1,059 or 1.000.000
+        return float(number.replace(last, ""))
+    whole, _, fraction = number.rpartition(last)
+    return float(whole.replace(".", "").replace(",", "") + "." + fraction)
+
+def parse_price(price):
+    """Split a displayed price such as "CA$5,888 Sale Price / item" into (amount, currency, on_sale, unit).
+
+    The amount is None if the price has no number. The currency comes from a
+    symbol, or else a three-letter code; the unit is what follows a "/".
+    """
+    if isinstance(price, (int, float)):
+        return float(price), None, False, None
+    text = " ".join((price or "").split())
+    match = PRICE_NUMBER_PATTERN.search(text)
+    if not match:
+        return None, None, False, None
+    amount = parse_amount(match.group())
+    currency = next((currency for symbol, currency in PRICE_SYMBOLS if symbol in text), None)
+    if currency is None:
+        code = CURRENCY_CODE_PATTERN.search(text)
+        currency = code.group(1) if code else None
+    unit = PRICE_UNIT_PATTERN.search(text)
+    return amount, currency, bool(SALE_PATTERN.search(text)), unit.group(1).lower() if unit else None
+
+def json_ld_offer(product):
+    """Return the first offer of a JSON-LD product"""
+    offers = product.get("offers") or {}
+    if isinstance(offers, list):
+        offers = offers[0] if offers else {}
+    return offers
+
+def json_ld_image(product):
+    """Return the first image URL of a JSON-LD product"""
+    image = product.get("image")
+    if isinstance(image, list):
+        image = image[0] if image else None
+    if isinstance(image, dict):
+        image = image.get("contentUrl") or image.get("url")
+    return image or ""
+
+def json_ld_brand(product):
+    """Return the brand or manufacturer name of a JSON-LD product"""
+    for key in ("brand", "manufacturer", "creator"):
+        value = product.get(key)
+        if isinstance(value, list):
+            value = value[0] if value else None
+        if isinstance(value, dict):
+            value = value.get("name")
+        if value:
+            return value
+    return ""
+
+def json_ld_specifications(product):
+    """Collect specifications from JSON-LD properties and additionalProperty pairs"""
+    specs = {}
+    for prop in JSON_LD_SPEC_PROPERTIES:
+        value = product.get(prop)
+        if isinstance(value, dict):
+            value = " ".join(str(part) for part in (value.get("value"), value.get("unitText") or value.get("unitCode")) if part)
+        elif isinstance(value, list):
+            value = ", ".join(str(part) for part in value)
+        if value:
+            specs[spec_key(re.sub(r'(?<!^)(?=[A-Z])', ' ', prop))] = str(value)
+
+    additional = product.get("additionalProperty") or []
+    for prop in additional if isinstance(additional, list) else [additional]:
+        if isinstance(prop, dict) and prop.get("name") and prop.get("value") not in (None, ""):
+            specs[spec_key(prop["name"])] = str(prop["value"])
+    return specs
+
+def extract_listings_from_html(page_html):
+    """Build the same listing dicts as harvest_listing_page for every product on a listing page.
+
+    Names and URLs come from the JSON-LD, images from the Relay store and
+    prices from the tiles, since the JSON-LD offer is always in US dollars.
+    A listing without a tile price is dropped rather than given that offer.
+    The creator is left empty, as the tile shows it only in its hidden quick view.
+    """
+    prices = tile_prices(page_html)
+    server_vars = parse_server_vars(page_html)
+    items = relay_items(server_vars)
+    listings = []
+    for product in iter_json_ld_products(parse_json_ld(page_html)):
+        url = product.get("url") or ""
+        product_id = extract_product_id(url) if url else None
+        item = items.get(product_id)
+        listing_data = {
+            "name": (product.get("name") or "").strip(),
+            "url": url,
+            "image_url": (relay_photo_url(server_vars, item) if item else None) or json_ld_image(product),
+            "price": prices.get(product_id, ""),
+            "creator": "",
+            "product_id": product_id
+        }
+        if is_valid_listing(listing_data):
+            listings.append(listing_data)
+    return listings
+
+def extract_product_from_html(page_html, product_url, product_id, base_data):
+    """Build the same product record as scrape_product_details from a product page's embedded JSON.
+
+    Returns None when the page has no usable JSON-LD product or the record is
+    missing required fields.
+    """
+    products = list(iter_json_ld_products(parse_json_ld(page_html)))
+    if not products:
+        return None
+    product = next((p for p in products if extract_product_id(p.get("url") or "") == product_id), products[0])
+
+    product_data = new_product_record(product_id, product_url, base_data, extraction_method="json-ld")
+    product_data["raw_data"]["jsonLd"] = product
+
+    if not product_data["name"]:
+        set_product_field(product_data, "name", (product.get("name") or "").strip())
+    if not product_data["price"]:
+        offer = json_ld_offer(product)
+        set_product_field(product_data, "price", format_price(offer.get("price"), offer.get("priceCurrency")))
+    if product.get("description"):
+        set_product_field(product_data, "description", product["description"])
+
+    specs = json_ld_specifications(product)
+    creator = base_data.get("creator") or json_ld_brand(product)
+    if not creator:
+        server_vars = parse_server_vars(page_html)
+        item = relay_items(server_vars).get(product_id)
+        if item:
+            creator = ", ".join(relay_creator_names(server_vars, item))
+    if creator:
+        specs["creator"] = creator
+    set_product_field(product_data, "specifications", specs)
+
+    image_url = json_ld_image(product)
+    if image_url:
+        set_product_field(product_data, "image_url", upscale_image_url(image_url))
+
+    if not has_required_product_fields(product_data):
+        return None
+    return product_data
+
+def fetch_listing_page(session, url, timeout=15, archive=None, page=None):
+    """Fetch a listing page over HTTP and return its listings, saving its HTML to archive when one is given"""
+    with metrics.timer("scraper_http_fetch_seconds", page_type="listing"):
+        page_html = fetch_html(session, url, timeout)
+    if archive is not None:
+        archive.put(page_html, url, "listing", source="http", page=page)
+    return extract_listings_from_html(page_html)
+
+def fetch_product_details(session, listing, timeout=15, archive=None):
+    """Fetch a product page over HTTP and build its record, or return None so Selenium can take over.
+
+    The fetched HTML is saved to archive when one is given.
+    """
+    started = time.perf_counter()
+    try:
+        with metrics.timer("scraper_http_fetch_seconds", page_type="product"):
+            page_html = fetch_html(session, listing["url"], timeout)
+    except requests.RequestException as e:
+        logger.warning(f"HTTP fetch failed for {listing['url']}: {str(e)}")
+        metrics.incr("scraper_products_total", method="http", result="fallback", reason="fetch_failed")
+        return None
+    if archive is not None:
+        archive.put(page_html, listing["url"], "product", source="http", listing=listing)
+    product_data = extract_product_from_html(page_html, listing["url"], listing["product_id"], listing)
+    metrics.observe("scraper_product_scrape_seconds", time.perf_counter() - started, method="http")
+    if product_data is None:
+        metrics.incr("scraper_products_total", method="http", result="fallback", reason="missing_fields")
+    else:
+        metrics.incr("scraper_products_total", method="http", result="scraped", reason="ok")
+    return product_data
+
+if __name__ == "__main__":
+    # Parse a saved page, e.g. python http_extract.py page_source.html
+    with open(sys.argv[1], encoding="utf-8") as f:
+        saved_html = f.read()
+    print(json.dumps(extract_listings_from_html(saved_html), ensure_ascii=False, indent=4))
@@ -0,0 +1,292 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from http_extract import create_session
+from metrics import configure_logging, metrics
+from output_writer import JsonlWriter, iter_jsonl
+from product_records import HERO_IMAGE_WIDTH, image_url_with_width
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_IMAGE_PATH = 'scraped_data/images'
+
+# Concurrent image downloads, each on a pooled keep-alive connection
+IMAGE_DOWNLOAD_THREADS = 8
+
+# Locks shared out among image URLs by hash, so the same URL is never downloaded twice at once
+# without keeping a lock for every image of a long crawl
+URL_LOCK_STRIPES = 64
+
+# Bytes read from the response and written to the partial file at a time
+DOWNLOAD_CHUNK_SIZE = 65536
+
+# Content-Range of a partial response ("bytes 100-199/500") or of a 416 ("bytes */500")
+CONTENT_RANGE_PATTERN = re.compile(r'bytes\s+(?:(\d+)-\d+|\*)/(\d+)')
+
+# File extensions for the image types the CDN serves
+CONTENT_TYPE_EXTENSIONS = {
+    "image/jpeg": ".jpg",
+    "image/png": ".png",
+    "image/webp": ".webp",
+    "image/gif": ".gif",
+    "image/avif": ".avif"
+}
+
+class ImageStore:
+    """Downloaded images on disk, stored once per content hash.
+
+    A finished image lives at <sha[:2]>/<sha[2:4]>/<sha><ext> under root, so
+    the same picture reached through different URLs or sizes is kept once.
+    Downloads in progress are written to partial/<hash of the URL>.part,
+    next to a .json file with the response's validator and content type,
+    and resumed with a Range and If-Range request after an interruption.
+    manifest.jsonl maps each downloaded URL to its file, so a URL is never
+    fetched twice.
+    """
+
+    def __init__(self, root=DEFAULT_IMAGE_PATH):
+        self.root = root
+        os.makedirs(os.path.join(root, "partial"), exist_ok=True)
+        self.manifest_path = os.path.join(root, "manifest.jsonl")
+        self.downloaded = {}
+        if os.path.exists(self.manifest_path):
+            for entry in iter_jsonl(self.manifest_path):
+                self.downloaded[entry["url"]] = entry
+        self._manifest = JsonlWriter(self.manifest_path, fsync_policy="never")
+        self._lock = threading.Lock()
+
+    def partial_path(self, url):
+        return os.path.join(self.root, "partial", hashlib.sha256(url.encode('utf-8')).hexdigest() + ".part")
+
+    def partial_info_path(self, url):
+        return self.partial_path(url)[:-len(".part")] + ".json"
+
+    def partial_info(self, url):
+        """Return the validator and content type saved when a partial download started, or None"""
+        try:
+            with open(self.partial_info_path(url), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def start_partial(self, url, response):
+        """Record the validator and content type of a response whose body is about to be written from the start"""
+        etag = response.headers.get("ETag")
+        # If-Range only accepts a strong ETag, or else a date
+        validator = etag if etag and not etag.startswith("W/") else response.headers.get("Last-Modified")
+        with open(self.partial_info_path(url), 'w', encoding='utf-8') as f:
+            json.dump({"validator": validator, "content_type": response.headers.get("Content-Type")}, f)
+
+    def discard_partial(self, url):
+        for path in (self.partial_path(url), self.partial_info_path(url)):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def image_path(self, digest, extension):
+        return os.path.join(self.root, digest[:2], digest[2:4], digest + extension)
+
+    def lookup(self, url):
+        """Return the manifest entry of an already downloaded URL whose file still exists, or None"""
+        with self._lock:
+            entry = self.downloaded.get(url)
+        if entry and os.path.exists(entry["path"]):
+            return entry
+        return None
+
+    def commit(self, url, partial_path, digest, extension):
+        """Move a finished download into place, or drop it if the same content is already stored"""
+        path = self.image_path(digest, extension)
+        if os.path.exists(path):
+            os.remove(partial_path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(partial_path, path)
+        if os.path.exists(self.partial_info_path(url)):
+            os.remove(self.partial_info_path(url))
+        entry = {"url": url, "path": path, "sha256": digest, "bytes": os.path.getsize(path)}
+        with self._lock:
+            self.downloaded[url] = entry
+            self._manifest.write(entry)
+        return entry
+
+    def close(self):
+        self._manifest.close()
+
+def file_sha256(path, hasher=None):
+    """Hash a file's contents, continuing from hasher when one is given"""
+    hasher = hasher or hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b""):
+            hasher.update(chunk)
+    return hasher
+
+def content_range(response):
+    """Return the first byte (None for a 416) and total size given by a response's Content-Range, or None"""
+    match = CONTENT_RANGE_PATTERN.match(response.headers.get("Content-Range") or "")
+    if not match:
+        return None
+    return (int(match.group(1)) if match.group(1) is not None else None), int(match.group(2))
+
+def image_extension(url, content_type):
+    extension = CONTENT_TYPE_EXTENSIONS.get((content_type or "").split(";")[0].strip().lower())
+    if extension:
+        return extension
+    path_extension = os.path.splitext(url.split("?")[0])[1].lower()
+    return path_extension if path_extension in CONTENT_TYPE_EXTENSIONS.values() else ".img"
+
+class ImageDownloader:
+    """Downloads product hero images concurrently over a pooled session into an ImageStore.
+
+    Each product's image_url is requested at every width in widths (the
+    width query parameter is set properly, whatever the URL had). The first
+    width is the hero image: its local path and content hash are set on the
+    product as image_path and image_sha256, and every width downloaded is
+    listed in image_files.
+    """
+
+    def __init__(self, store=None, session=None, num_threads=IMAGE_DOWNLOAD_THREADS, widths=(HERO_IMAGE_WIDTH,),
+                 timeout=30, wait_policy=None):
+        self.store = store or ImageStore()
+        self.session = session or create_session(pool_size=num_threads)
+        self.widths = tuple(widths)
+        self.timeout = timeout
+        self.wait_policy = wait_policy
+        self._executor = ThreadPoolExecutor(max_workers=num_threads, thread_name_prefix="image-download")
+        self._url_locks = [threading.Lock() for _ in range(URL_LOCK_STRIPES)]
+
+    def _url_lock(self, url):
+        # Two products can share an image; only one thread may write its partial file
+        return self._url_locks[hash(url) % len(self._url_locks)]
+
+    def download(self, url):
+        """Download one image, resuming a partial download, and return its store entry, or None if it failed"""
+        with self._url_lock(url):
+            return self._download(url)
+
+    def _download(self, url):
+        entry = self.store.lookup(url)
+        if entry is not None:
+            metrics.incr("scraper_images_total", result="cached")
+            return entry
+
+        partial_path = self.store.partial_path(url)
+        info = self.store.partial_info(url) or {}
+        offset = os.path.getsize(partial_path) if os.path.exists(partial_path) else 0
+        if not info.get("validator"):
+            # Without a validator the server cannot tell us the image changed, so the rest could not be trusted
+            offset = 0
+        try:
+            with metrics.timer("scraper_image_download_seconds"):
+                result = self._fetch(url, partial_path, offset, info)
+                if result is None:
+                    # The partial file did not fit the image the server has now; fetch it whole
+                    self.store.discard_partial(url)
+                    offset = 0
+                    result = self._fetch(url, partial_path, offset, {})
+        except (requests.RequestException, OSError) as e:
+            logger.warning(f"Image download failed for {url}: {str(e)}")
+            metrics.incr("scraper_images_total", result="error")
+            return None
+        hasher, content_type = result
+        metrics.incr("scraper_images_total", result="resumed" if offset else "downloaded")
+        return self.store.commit(url, partial_path, hasher.hexdigest(), image_extension(url, content_type))
+
+    def _fetch(self, url, partial_path, offset, info):
+        """Request an image, or the rest of it after offset bytes, into the partial file.
+
+        Returns the content hasher and content type, or None when the partial
+        file cannot be completed: a 416 whose size is not the partial file's,
+        or a 206 for some other range.
+        """
+        headers = {"Range": f"bytes={offset}-", "If-Range": info["validator"]} if offset else {}
+        if self.wait_policy is not None:
+            self.wait_policy.pause()
+        with self.session.get(url, headers=headers, timeout=self.timeout, stream=True) as response:
+            if offset and response.status_code == 416:
+                # Nothing left to send, which only means done if the server's size is the partial file's
+                if content_range(response) != (None, offset):
+                    return None
+                return file_sha256(partial_path), info.get("content_type")
+            response.raise_for_status()
+            resumed = bool(offset) and response.status_code == 206
+            if resumed and (content_range(response) or (None, None))[0] != offset:
+                return None
+            if not resumed:
+                self.store.start_partial(url, response)
+            hasher = file_sha256(partial_path) if resumed else hashlib.sha256()
+            with open(partial_path, 'ab' if resumed else 'wb') as f:
+                for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                    f.write(chunk)
+                    hasher.update(chunk)
+            return hasher, info.get("content_type") if resumed else response.headers.get("Content-Type")
+
+    def download_product(self, product):
+        """Download a product's image at every width and record the files on the product; returns the product"""
+        if not product.get("image_url"):
+            return product
+        files = []
+        for width in self.widths:
+            url = image_url_with_width(product["image_url"], width)
+            entry = self.download(url)
+            if entry is not None:
+                files.append(dict(entry, width=width))
+        if files:
+            product["image_files"] = files
+        if files and files[0]["width"] == self.widths[0]:
+            product["image_path"] = files[0]["path"]
+            product["image_sha256"] = files[0]["sha256"]
+        return product
+
+    def submit(self, product):
+        """Queue a product's images for download and return the future"""
+        return self._executor.submit(self.download_product, product)
+
+    def download_products(self, products):
+        """Download the images of several products concurrently, returning them in order once all are done"""
+        return [future.result() for future in [self.submit(product) for product in products]]
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self.store.close()
+
+def read_records(path):
+    """Read product records from a JSON Lines file or a JSON array file"""
+    if path.endswith(".jsonl"):
+        return list(iter_jsonl(path))
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Download the hero images of scraped products")
+    parser.add_argument("records", help="detailed products file (.jsonl or _complete.json)")
+    parser.add_argument("--output", help="write the records with image_path and image_sha256 here (JSON Lines)")
+    parser.add_argument("--image-dir", default=DEFAULT_IMAGE_PATH)
+    parser.add_argument("--threads", type=int, default=IMAGE_DOWNLOAD_THREADS)
+    parser.add_argument("--widths", default=str(HERO_IMAGE_WIDTH), help="comma separated widths, hero first, e.g. 1200,240")
+    args = parser.parse_args(argv)
+    configure_logging()
+
+    downloader = ImageDownloader(ImageStore(args.image_dir), num_threads=args.threads,
+                                 widths=[int(width) for width in args.widths.split(",")])
+    try:
+        products = downloader.download_products(read_records(args.records))
+    finally:
+        downloader.close()
+    if args.output:
+        writer = JsonlWriter(args.output, fsync_policy="never")
+        for product in products:
+            writer.write(product)
+        writer.close()
+    saved = sum(1 for product in products if product.get("image_path"))
+    print(f"{saved} of {len(products)} product images stored in {args.image_dir}")
+    return 0 if saved == sum(1 for product in products if product.get("image_url")) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,232 @@
+import bisect
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Histogram bucket upper bounds in seconds, from an in-browser script to a slow page load
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Descriptions shown as # HELP lines in the Prometheus export
+METRIC_HELP = {
+    "scraper_page_load_seconds": "Time for driver.get to load a page, by page type",
+    "scraper_tile_extraction_seconds": "Time to read every tile of a listing page, by extraction mode",
+    "scraper_product_scrape_seconds": "Time to build one product record, by method",
+    "scraper_pagination_seconds": "Time to find and open the next listing page",
+    "scraper_wait_seconds": "Time spent in readiness waits, by what was awaited",
+    "scraper_record_write_seconds": "Time to append one record to a JSON Lines file",
+    "scraper_record_sync_seconds": "Time to flush and fsync a JSON Lines file",
+    "scraper_http_fetch_seconds": "Time to fetch a page over HTTP, by page type",
+    "scraper_image_download_seconds": "Time to download one product image",
+    "scraper_listing_pages_total": "Listing pages processed, by where their listings came from",
+    "scraper_listings_total": "Listings read from tiles, by result",
+    "scraper_products_total": "Product pages handled, by method, result and reason",
+    "scraper_selector_misses_total": "Selectors that matched nothing, by page type and field",
+    "scraper_http_responses_total": "HTTP responses received, by status code",
+    "scraper_wait_timeouts_total": "Readiness waits that timed out, by what was awaited",
+    "scraper_browser_events_total": "Browsers recycled, restarted or replaced, by event",
+    "scraper_images_total": "Product images requested, by whether they were downloaded, resumed, cached or failed",
+    "scraper_queue_items_total": "Shared work queue items leased, acked, retried, expired, lost or failed, by event"
+}
+
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+def configure_logging(level="INFO", log_file=None):
+    """Send log records at level and above to stderr, or to log_file"""
+    handler = logging.FileHandler(log_file, encoding='utf-8') if log_file else logging.StreamHandler(sys.stderr)
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(level.upper() if isinstance(level, str) else level)
+
+class Histogram:
+    """Counts of observations per bucket, plus their sum, as in a Prometheus histogram"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """Return (upper bound, observations at or below it) for every bucket, ending with +Inf"""
+        total = 0
+        rows = []
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            rows.append((bound, total))
+        return rows
+
+    def quantile(self, fraction):
+        """Estimate a quantile as the upper bound of the bucket it falls in"""
+        if not self.count:
+            return None
+        rank = fraction * self.count
+        for bound, total in self.cumulative():
+            if total >= rank:
+                return bound if bound != float("inf") else self.buckets[-1]
+        return self.buckets[-1]
+
+def label_key(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+def format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+def format_bound(bound):
+    return "+Inf" if bound == float("inf") else repr(float(bound))
+
+class Metrics:
+    """Counters and latency histograms keyed by metric name and labels.
+
+    Exported as Prometheus text (to_prometheus, or over HTTP with serve) or
+    as JSON (to_dict), or written to a file with write(). Recording is a dict update under a lock,
+    cheap enough for every page and record.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counters = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def incr(self, name, amount=1, **labels):
+        key = label_key(labels)
+        with self._lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def observe(self, name, seconds, **labels):
+        key = label_key(labels)
+        with self._lock:
+            series = self.histograms.setdefault(name, {})
+            if key not in series:
+                series[key] = Histogram(self.buckets)
+            series[key].observe(seconds)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Observe how long the with block takes, whether or not it raises"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def count(self, name, **labels):
+        """Return a counter's value, or a histogram's number of observations"""
+        key = label_key(labels)
+        with self._lock:
+            if name in self.histograms:
+                histogram = self.histograms[name].get(key)
+                return histogram.count if histogram else 0
+            return self.counters.get(name, {}).get(key, 0)
+
+    def reset(self):
+        with self._lock:
+            self.counters = {}
+            self.histograms = {}
+
+    def to_prometheus(self):
+        """Render every metric in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            for name, series in sorted(self.counters.items()):
+                lines.append(f"# HELP {name} {METRIC_HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} counter")
+                for key, value in sorted(series.items()):
+                    lines.append(f"{name}{format_labels(key)} {value}")
+            for name, series in sorted(self.histograms.items()):
+                lines.append(f"# HELP {name} {METRIC_HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} histogram")
+                for key, histogram in sorted(series.items()):
+                    for bound, total in histogram.cumulative():
+                        lines.append(f"{name}_bucket{format_labels(key, [('le', format_bound(bound))])} {total}")
+                    lines.append(f"{name}_sum{format_labels(key)} {histogram.sum}")
+                    lines.append(f"{name}_count{format_labels(key)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def to_dict(self):
+        """Return every metric as plain data, with p50/p95 estimates for histograms"""
+        with self._lock:
+            return {
+                "counters": {
+                    name: [dict(key, value=value) for key, value in sorted(series.items())]
+                    for name, series in sorted(self.counters.items())
+                },
+                "histograms": {
+                    name: [
+                        dict(key, count=histogram.count, sum=round(histogram.sum, 6),
+                             p50=histogram.quantile(0.5), p95=histogram.quantile(0.95))
+                        for key, histogram in sorted(series.items())
+                    ]
+                    for name, series in sorted(self.histograms.items())
+                }
+            }
+
+    def write(self, path):
+        """Write the metrics to path as JSON for a .json file, otherwise as Prometheus text, replacing it atomically.
+
+        Prometheus text suits node_exporter's textfile collector (*.prom).
+        """
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", 'w', encoding='utf-8') as f:
+            if path.endswith(".json"):
+                json.dump(self.to_dict(), f, indent=2)
+            else:
+                f.write(self.to_prometheus())
+        os.replace(path + ".tmp", path)
+
+    def summary(self):
+        """Summarise the count and p50/p95 of each timed stage"""
+        lines = ["Stage timings:"]
+        with self._lock:
+            for name, series in sorted(self.histograms.items()):
+                for key, histogram in sorted(series.items()):
+                    lines.append(f"  {name}{format_labels(key)}: {histogram.count} timed, "
+                                 f"p50 <= {histogram.quantile(0.5)}s, p95 <= {histogram.quantile(0.95)}s")
+        return "\n".join(lines)
+
+    def serve(self, port=9108, host="127.0.0.1"):
+        """Serve /metrics (Prometheus text) and /metrics.json from a background thread, returning the server"""
+        registry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path == "/metrics":
+                    body, content_type = registry.to_prometheus().encode('utf-8'), "text/plain; version=0.0.4"
+                elif self.path == "/metrics.json":
+                    body, content_type = json.dumps(registry.to_dict()).encode('utf-8'), "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True, name="metrics-server").start()
+        return server
+
+# Process-wide registry that the scraper's modules record into
+metrics = Metrics()
@@ -0,0 +1,246 @@
+import argparse
+import glob
+import json
+import logging
+import os
+import re
+import sys
+import time
+from http_extract import parse_price
+from metrics import configure_logging
+from output_writer import iter_batches, iter_jsonl
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CATALOGUE_PATH = 'scraped_data/catalogue.parquet'
+
+# Records turned into one Arrow table and one Parquet row group at a time
+NORMALISE_BATCH_SIZE = 100000
+
+# Specification labels, in spec_key form with punctuation dropped, that name the same thing
+SPEC_KEY_ALIASES = {
+    "dimension": "dimensions",
+    "measurements": "dimensions",
+    "size": "dimensions",
+    "h": "height",
+    "w": "width",
+    "d": "depth",
+    "dia": "diameter",
+    "diam": "diameter",
+    "material": "materials",
+    "materials_and_techniques": "materials",
+    "materials_techniques": "materials",
+    "colour": "color",
+    "country_of_origin": "place_of_origin",
+    "origin": "place_of_origin",
+    "production_date": "date_of_manufacture",
+    "item_location": "seller_location",
+}
+
+# Specifications given a column of their own; any others are kept together as JSON
+CANONICAL_SPEC_KEYS = ("dimensions", "height", "width", "depth", "diameter", "weight", "materials", "color", "style",
+                       "period", "date_of_manufacture", "condition", "place_of_origin", "seller_location")
+
+# Measurements read from the dimension specifications, in centimetres
+DIMENSION_NAMES = {
+    "height": "height|h",
+    "width": "width|w",
+    "depth": "depth|d",
+    "diameter": "diameter|diam|dia",
+}
+
+CENTIMETRES_PER_UNIT = {"in": 2.54, "inch": 2.54, "inches": 2.54, "cm": 1.0, "mm": 0.1}
+
+MEASUREMENT_PATTERN = r'(?P<number>\d+(?:\.\d+)?)\s*(?P<unit>inches|inch|in|cm|mm)\b'
+
+RECORD_COLUMNS = ("product_id", "retailer", "name", "description", "url", "image_url", "price")
+
+def catalogue_schema():
+    """The Parquet schema of a normalised catalogue"""
+    fields = [("source", pa.string())]
+    fields += [(column, pa.string()) for column in RECORD_COLUMNS if column != "price"]
+    fields += [
+        ("price_text", pa.string()),
+        ("price_amount", pa.float64()),
+        ("price_currency", pa.string()),
+        ("price_on_sale", pa.bool_()),
+        ("price_unit", pa.string()),
+    ]
+    fields += [(f"{name}_cm", pa.float64()) for name in DIMENSION_NAMES]
+    fields += [(f"spec_{key}", pa.string()) for key in CANONICAL_SPEC_KEYS]
+    fields.append(("specifications_other", pa.string()))
+    return pa.schema(fields)
+
+def canonical_spec_key(label):
+    """Turn a specification label or key into its canonical key, e.g. "Materials & Techniques" -> materials"""
+    key = re.sub(r'[^0-9a-z]+', '_', str(label).strip().lower()).strip('_')
+    return SPEC_KEY_ALIASES.get(key, key)
+
+def extract(values, pattern):
+    """Run a regular expression with named groups over a string array, returning a dict of one array per group"""
+    found = pc.extract_regex(values, pattern)
+    return {field.name: pc.struct_field(found, field.name) for field in found.type}
+
+def lookup(values, keys, results):
+    """Map each value found in keys to the result at the same position, and any other value to null"""
+    return pc.take(pa.array(results), pc.index_in(values, value_set=pa.array(keys)))
+
+def parse_prices(prices):
+    """Split an array of displayed prices into price_amount, price_currency, price_on_sale and price_unit arrays.
+
+    Each distinct price is parsed once by http_extract.parse_price, the
+    parser the delta index uses, and the results are spread back over the
+    rows with a dictionary take, so both always agree on a price.
+    """
+    encoded = pc.dictionary_encode(prices)
+    parsed = [parse_price(price) for price in encoded.dictionary.to_pylist()]
+    columns = {
+        "price_amount": pa.array([amount for amount, _, _, _ in parsed], pa.float64()),
+        "price_currency": pa.array([currency for _, currency, _, _ in parsed], pa.string()),
+        "price_on_sale": pa.array([on_sale for _, _, on_sale, _ in parsed], pa.bool_()),
+        "price_unit": pa.array([unit for _, _, _, unit in parsed], pa.string()),
+    }
+    result = {name: pc.take(values, encoded.indices) for name, values in columns.items()}
+    result["price_on_sale"] = pc.fill_null(result["price_on_sale"], False)
+    return result
+
+def measurement_cm(values, names=None):
+    """Read a measurement in centimetres from each string, after one of names (a regex alternation) if given"""
+    prefix = '' if names is None else rf'\b(?:{names})\b\.?\s*:?\s*'
+    found = extract(values, f'(?i){prefix}{MEASUREMENT_PATTERN}')
+    factor = lookup(pc.utf8_lower(found["unit"]), list(CENTIMETRES_PER_UNIT), list(CENTIMETRES_PER_UNIT.values()))
+    return pc.round(pc.multiply(pc.cast(found["number"], pa.float64()), factor), 2)
+
+def text_column(records, key):
+    """Collect one field of every record into a string array, null where it is missing"""
+    values = [record.get(key) for record in records]
+    try:
+        return pa.array(values, pa.string())
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # A number or other non-string value somewhere in the batch
+        return pa.array([None if value is None else str(value) for value in values], pa.string())
+
+def spec_columns(records):
+    """Spread the records' specifications dicts into one string array per canonical key.
+
+    Labels are canonicalised once per distinct label rather than once per
+    record; when two labels of a record map to the same key, the first wins.
+    Specifications outside CANONICAL_SPEC_KEYS go to specifications_other as JSON.
+    """
+    specs = [record.get("specifications") if isinstance(record.get("specifications"), dict) else {} for record in records]
+    columns = {}
+    for label in dict.fromkeys(label for spec in specs for label in spec):
+        key = canonical_spec_key(label)
+        values = text_column(specs, label)
+        columns[key] = pc.coalesce(columns[key], values) if key in columns else values
+
+    nulls = pa.nulls(len(records), pa.string())
+    result = {f"spec_{key}": columns.get(key, nulls) for key in CANONICAL_SPEC_KEYS}
+    other = {key: values.to_pylist() for key, values in columns.items() if key not in CANONICAL_SPEC_KEYS}
+    if other:
+        rows = [{key: values[i] for key, values in other.items() if values[i] is not None} for i in range(len(records))]
+        result["specifications_other"] = pa.array([json.dumps(row, ensure_ascii=False) if row else None for row in rows],
+                                                  pa.string())
+    else:
+        result["specifications_other"] = nulls
+    return result
+
+def normalise_batch(records, source=None):
+    """Normalise a list of product records into an Arrow table with the catalogue's schema"""
+    columns = {"source": pa.array([source] * len(records), pa.string())}
+    for column in RECORD_COLUMNS:
+        if column != "price":
+            columns[column] = text_column(records, column)
+    columns["price_text"] = text_column(records, "price")
+    columns.update(parse_prices(columns["price_text"]))
+
+    specs = spec_columns(records)
+    for name, names in DIMENSION_NAMES.items():
+        # A dimension given on its own beats one read out of the dimensions text
+        columns[f"{name}_cm"] = pc.coalesce(measurement_cm(specs[f"spec_{name}"]),
+                                            measurement_cm(specs["spec_dimensions"], names))
+    columns.update(specs)
+    return pa.table(columns, schema=catalogue_schema())
+
+def input_files(paths):
+    """Expand directories among paths into the .json and .jsonl files inside them"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, "*.json")) + glob.glob(os.path.join(path, "*.jsonl"))))
+        else:
+            files.append(path)
+    return files
+
+def iter_file_records(path):
+    """Yield the product records of a JSON Lines file, a JSON array file or a single-record JSON file"""
+    if path.endswith(".jsonl"):
+        yield from iter_jsonl(path)
+        return
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    yield from (data if isinstance(data, list) else [data])
+
+def normalise_files(paths, output_path=DEFAULT_CATALOGUE_PATH, batch_size=NORMALISE_BATCH_SIZE):
+    """Normalise the records of snapshot and JSON Lines files into one Parquet file, a batch at a time.
+
+    Each batch becomes a row group, so memory use is bounded by batch_size
+    rather than by the size of the catalogue. A directory of single-record
+    files, such as scraped_data/products, is read as one source per directory.
+    Returns the number of records written.
+    """
+    if pa is None:
+        raise RuntimeError("Normalising needs pyarrow: pip install pyarrow")
+    if os.path.dirname(output_path):
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    schema = catalogue_schema()
+    started = time.perf_counter()
+    written = 0
+    temp_path = output_path + ".tmp"
+    writer = pq.ParquetWriter(temp_path, schema, compression="zstd")
+    try:
+        try:
+            for path in paths:
+                files = input_files([path])
+                records = (record for file in files for record in iter_file_records(file))
+                source = os.path.basename(os.path.normpath(path))
+                for batch in iter_batches((record for record in records if isinstance(record, dict)), batch_size):
+                    table = normalise_batch(batch, source)
+                    writer.write_table(table)
+                    written += table.num_rows
+        finally:
+            writer.close()
+        os.replace(temp_path, output_path)
+    except BaseException:
+        # A half-written file is of no use to anyone
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    elapsed = time.perf_counter() - started
+    logger.info(f"Normalised {written} records into {output_path} in {elapsed:.1f}s")
+    return written
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Normalise scraped products into a typed Parquet catalogue")
+    parser.add_argument("inputs", nargs="+", help="detailed products files (.jsonl or .json) or directories of them")
+    parser.add_argument("--output", default=DEFAULT_CATALOGUE_PATH)
+    parser.add_argument("--batch-size", type=int, default=NORMALISE_BATCH_SIZE)
+    args = parser.parse_args(argv)
+    configure_logging()
+
+    if pa is None:
+        print("Normalising needs pyarrow: pip install pyarrow", file=sys.stderr)
+        return 1
+    written = normalise_files(args.inputs, args.output, args.batch_size)
+    print(f"{written} records -> {args.output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
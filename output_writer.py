@@ -0,0 +1,100 @@
+import json
+import logging
+import os
+import textwrap
+import threading
+from datetime import datetime
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+FSYNC_POLICIES = ("record", "page", "never")
+
+class JsonlWriter:
+    """Appends records to a JSON Lines file as soon as they are produced.
+
+    Each record is written as one complete line, so a crash can at most leave
+    a truncated final line, which iter_jsonl skips. fsync_policy controls
+    durability: "record" fsyncs after every record, "page" on each sync()
+    call (the scraper calls it after every listing page), "never" only
+    flushes to the OS. mode is the open() mode: "a" appends to an existing
+    file, "x" insists on a new one, so two runs can never mix their records.
+    """
+
+    def __init__(self, path, fsync_policy="page", mode="a"):
+        if fsync_policy not in FSYNC_POLICIES:
+            raise ValueError(f"fsync_policy must be one of {', '.join(FSYNC_POLICIES)}")
+        self.path = path
+        self.fsync_policy = fsync_policy
+        self.count = 0
+        self._lock = threading.Lock()
+        self._file = open(path, mode, encoding='utf-8')
+
+    def write(self, record):
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock, metrics.timer("scraper_record_write_seconds"):
+            self._file.write(line)
+            self.count += 1
+            if self.fsync_policy == "record":
+                self._sync()
+
+    def _sync(self):
+        self._file.flush()
+        if self.fsync_policy != "never":
+            os.fsync(self._file.fileno())
+
+    def sync(self):
+        """Flush buffered records to disk according to the fsync policy"""
+        with self._lock, metrics.timer("scraper_record_sync_seconds"):
+            self._sync()
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._sync()
+                self._file.close()
+
+def run_timestamp():
+    """Timestamp naming a run's output files, to the microsecond so runs started in the same second get their own"""
+    return datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+
+def iter_jsonl(path):
+    """Yield the records of a JSON Lines file, skipping a line truncated by a crash"""
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                logger.warning(f"Skipping unreadable line in {path}")
+
+def iter_batches(records, batch_size):
+    """Group an iterable of records into lists of at most batch_size"""
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def compact_jsonl(jsonl_path, json_path, indent=4):
+    """Stream a JSON Lines file into a JSON array file and atomically replace json_path.
+
+    Records are read and written one at a time, so memory use does not grow
+    with the file. The output matches json.dump(records, f, indent=indent).
+    """
+    temp_path = json_path + ".tmp"
+    with open(temp_path, 'w', encoding='utf-8') as out:
+        out.write("[")
+        empty = True
+        for record in iter_jsonl(jsonl_path):
+            out.write(",\n" if not empty else "\n")
+            out.write(textwrap.indent(json.dumps(record, ensure_ascii=False, indent=indent), " " * indent))
+            empty = False
+        out.write("]" if empty else "\n]")
+        out.flush()
+        os.fsync(out.fileno())
+    os.replace(temp_path, json_path)
@@ -0,0 +1,119 @@
+import glob
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+
+DEFAULT_INDEX_PATH = 'scraped_data/product_index.sqlite'
+
+# Timestamp embedded in product_<id>_<timestamp>Z.json file names
+PRODUCT_FILE_PATTERN = re.compile(r'product_(.+)_(\d{4}-\d{2}-\d{2}T\d{2}-\d{2}-\d{2}-\d{3})Z\.json$')
+
+def content_hash(product):
+    """Hash a product record's content, ignoring the raw_data mirror"""
+    content = {key: value for key, value in product.items() if key != "raw_data"}
+    return hashlib.sha256(json.dumps(content, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+def latest_product_files(directory):
+    """Map each product_id to the scrape time and path of its newest product file in directory"""
+    latest = {}
+    for filename in glob.glob(os.path.join(directory, 'product_*.json')):
+        match = PRODUCT_FILE_PATTERN.search(os.path.basename(filename))
+        if not match:
+            continue
+        scraped_at = datetime.strptime(match.group(2), '%Y-%m-%dT%H-%M-%S-%f').timestamp()
+        if match.group(1) not in latest or scraped_at > latest[match.group(1)][0]:
+            latest[match.group(1)] = (scraped_at, filename)
+    return latest
+
+class ProductIndex:
+    """On-disk index of scraped products and crawl checkpoints, backed by SQLite.
+
+    Products are keyed by product_id with the time they were last scraped and
+    a content hash, so reruns can skip products that are still fresh. The
+    checkpoint table records the last completed listing page of each crawl so
+    an interrupted crawl can resume where it stopped.
+    """
+
+    def __init__(self, path=DEFAULT_INDEX_PATH):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS products (
+                    product_id TEXT PRIMARY KEY,
+                    url TEXT,
+                    last_scraped REAL NOT NULL,
+                    content_hash TEXT NOT NULL
+                )
+            """)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS checkpoints (
+                    crawl_key TEXT PRIMARY KEY,
+                    last_page INTEGER NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+
+    def is_fresh(self, product_id, max_age_seconds):
+        """Check whether a product was scraped within the last max_age_seconds"""
+        with self._lock:
+            row = self._conn.execute("SELECT last_scraped FROM products WHERE product_id = ?", (product_id,)).fetchone()
+        return row is not None and time.time() - row[0] < max_age_seconds
+
+    def record(self, product, scraped_at=None):
+        """Record that a product was scraped, returning True if its content changed"""
+        new_hash = content_hash(product)
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT content_hash FROM products WHERE product_id = ?", (product["product_id"],)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO products (product_id, url, last_scraped, content_hash) VALUES (?, ?, ?, ?)",
+                (product["product_id"], product.get("url"), scraped_at or time.time(), new_hash)
+            )
+        return row is None or row[0] != new_hash
+
+    def get_checkpoint(self, crawl_key):
+        """Return the last completed page of a crawl, or 0 if it has none"""
+        with self._lock:
+            row = self._conn.execute("SELECT last_page FROM checkpoints WHERE crawl_key = ?", (crawl_key,)).fetchone()
+        return row[0] if row else 0
+
+    def set_checkpoint(self, crawl_key, page):
+        """Record that a crawl has completed the given page"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO checkpoints (crawl_key, last_page, updated_at) VALUES (?, ?, ?)",
+                (crawl_key, page, time.time())
+            )
+
+    def clear_checkpoint(self, crawl_key):
+        """Forget a crawl's progress once it has finished"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM checkpoints WHERE crawl_key = ?", (crawl_key,))
+
+    def seed_from_files(self, directory='scraped_data/products'):
+        """Index existing product files, keeping the newest file for each product_id"""
+        latest = latest_product_files(directory)
+        for scraped_at, filename in latest.values():
+            with open(filename, encoding='utf-8') as f:
+                self.record(json.load(f), scraped_at)
+        return len(latest)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+if __name__ == "__main__":
+    # Seed the index from existing product files, e.g. python product_index.py scraped_data/products
+    index = ProductIndex()
+    count = index.seed_from_files(sys.argv[1] if len(sys.argv) > 1 else 'scraped_data/products')
+    index.close()
+    print(f"Indexed {count} products in {DEFAULT_INDEX_PATH}")
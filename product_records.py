@@ -0,0 +1,118 @@
+import logging
+import re
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+logger = logging.getLogger(__name__)
+
+# Product fields mirrored into raw_data under a different key
+RAW_FIELD_NAMES = {
+    "product_id": "productId",
+    "image_url": "imageUrl"
+}
+
+# Top-level product fields mirrored into raw_data, in raw_data key order
+RAW_MIRROR_FIELDS = ["product_id", "slug", "url", "name", "price", "image_url", "description", "specifications"]
+
+# Width requested for product hero images; listing tiles are served at 240 or 768
+HERO_IMAGE_WIDTH = 1200
+
+def extract_product_id(url):
+    """Extract product ID from product URL"""
+    match = re.search(r'/id-([^/]+)/?', url)
+    if match:
+        return match.group(1)
+    return None
+
+def is_valid_listing(listing_data):
+    """Check if a listing has the required fields"""
+    required_fields = ["name", "url", "image_url", "price", "product_id"]
+    for field in required_fields:
+        if not listing_data.get(field):
+            return False
+    return True
+
+def spec_key(label):
+    """Turn a specification label into a specifications dict key"""
+    return label.strip().lower().replace(" ", "_")
+
+def image_url_with_width(image_url, width):
+    """Return an image URL asking for the given width, replacing its width query parameter or adding one"""
+    # A srcset value lists several candidates; the first is the image itself
+    image_url = image_url.split()[0].rstrip(",")
+    parts = urlsplit(image_url)
+    query = [(key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True) if key != "width"]
+    query.append(("width", str(width)))
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+def upscale_image_url(image_url, width=HERO_IMAGE_WIDTH):
+    """Request a larger version of a listing image"""
+    if not image_url or not image_url.strip():
+        return image_url
+    return image_url_with_width(image_url, width)
+
+def new_product_record(product_id, product_url, base_data, extraction_method="automated"):
+    """Build a product record seeded with the information from the listing page"""
+    return {
+        "retailer": "1stDibs",
+        "product_id": product_id,
+        "name": base_data.get("name", ""),
+        "slug": product_id,
+        "price": base_data.get("price", ""),
+        "description": "",
+        "image_url": base_data.get("image_url", ""),
+        "url": product_url,
+        "specifications": {},
+        "raw_data": {
+            "productId": product_id,
+            "slug": product_id,
+            "url": product_url,
+            "name": base_data.get("name", ""),
+            "price": base_data.get("price", ""),
+            "imageUrl": base_data.get("image_url", ""),
+            "description": "",
+            "specifications": {},
+            "jsonLd": None,
+            "extractionMethod": extraction_method
+        }
+    }
+
+def set_product_field(product_data, field, value):
+    """Set a field on a product record and its raw_data mirror"""
+    product_data[field] = value
+    product_data["raw_data"][RAW_FIELD_NAMES.get(field, field)] = value
+
+def has_required_product_fields(product_data):
+    """Check that a product record has a name and an image, reporting what is missing"""
+    if not product_data["name"]:
+        logger.debug(f"Product {product_data['product_id']} missing name - skipping")
+        return False
+
+    if not product_data["image_url"]:
+        logger.debug(f"Product {product_data['product_id']} missing image - skipping")
+        return False
+    return True
+
+def split_raw_data(product_data):
+    """Split a product record into its fields and the raw_data entries that are not plain mirrors of them"""
+    fields = {key: value for key, value in product_data.items() if key != "raw_data"}
+    raw_extra = dict(product_data.get("raw_data") or {})
+    for field in RAW_MIRROR_FIELDS:
+        raw_key = RAW_FIELD_NAMES.get(field, field)
+        if raw_key in raw_extra and field in fields and raw_extra[raw_key] == fields[field]:
+            del raw_extra[raw_key]
+    return fields, raw_extra
+
+def join_raw_data(fields, raw_extra):
+    """Rebuild a full product record, raw_data mirror included, from split_raw_data's output"""
+    raw_data = {}
+    for field in RAW_MIRROR_FIELDS:
+        raw_key = RAW_FIELD_NAMES.get(field, field)
+        if raw_key in raw_extra:
+            raw_data[raw_key] = raw_extra[raw_key]
+        elif field in fields:
+            raw_data[raw_key] = fields[field]
+    for key, value in raw_extra.items():
+        raw_data.setdefault(key, value)
+    product_data = dict(fields)
+    product_data["raw_data"] = raw_data
+    return product_data
@@ -0,0 +1,170 @@
+import asyncio
+import logging
+import queue
+import threading
+from selenium_base import CrawlCancelled, crawl_result, scrape_1stdibs
+
+logger = logging.getLogger(__name__)
+
+# Records held between the crawl and a slower consumer before the crawl waits for it
+DEFAULT_BUFFER_SIZE = 100
+
+# Seconds between checks for cancellation while the crawl waits for buffer space
+CANCEL_CHECK_SECONDS = 0.5
+
+RECORD_KINDS = ("listing", "product")
+
+_END = object()
+
+class ProductStream:
+    """The listings and products of a scrape_1stdibs crawl, yielded as (kind, record) while it runs.
+
+    The crawl runs on a background thread and hands each record over as
+    soon as it is saved, through a queue of buffer_size records. When the
+    consumer falls that far behind, the crawl waits for it. Only records of
+    the given kinds are yielded. The stream can be iterated with for or
+    async for, and used with with or async with. close() cancels the crawl:
+    it stops at its next record, closing its files and browsers, and close()
+    returns once it has. The crawl's summary is in result once it has ended;
+    a crawl that fails simply ends the stream early, with status "failed"
+    and the error in result.
+    """
+
+    def __init__(self, category_option=None, max_pages=None, buffer_size=DEFAULT_BUFFER_SIZE, kinds=RECORD_KINDS,
+                 **scrape_options):
+        self.category_option = category_option
+        self.max_pages = max_pages
+        self.kinds = kinds
+        self.scrape_options = scrape_options
+        self.result = None
+        self._queue = queue.Queue(maxsize=buffer_size)
+        self._cancelled = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._crawl, daemon=True, name="product-stream")
+            self._thread.start()
+        return self
+
+    def _put(self, item):
+        while not self._cancelled.is_set():
+            try:
+                self._queue.put(item, timeout=CANCEL_CHECK_SECONDS)
+                return
+            except queue.Full:
+                continue
+        raise CrawlCancelled("The consumer closed the stream")
+
+    def _on_record(self, kind, record):
+        self._put((kind, record))
+
+    def _crawl(self):
+        try:
+            self.result = scrape_1stdibs(self.category_option, self.max_pages, on_record=self._on_record, **self.scrape_options)
+        except Exception as e:
+            logger.error(f"Streamed crawl failed: {str(e)}")
+            self.result = crawl_result(self.category_option, None)
+            self.result.update(status="failed", error=str(e))
+        finally:
+            try:
+                self._put(_END)
+            except CrawlCancelled:
+                pass
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        item = self.next_record()
+        if item is None:
+            raise StopIteration
+        return item
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        # Waiting on the default executor keeps the event loop running
+        item = await asyncio.get_running_loop().run_in_executor(None, self.next_record)
+        if item is None:
+            raise StopAsyncIteration
+        return item
+
+    def next_record(self):
+        """Wait for the next (kind, record) of the stream's kinds, or return None once the crawl has ended"""
+        self.start()
+        while True:
+            item = self._queue.get()
+            if item is _END:
+                # Later calls find the end again rather than waiting forever
+                self._queue.put(_END)
+                self._thread.join()
+                return None
+            if item[0] in self.kinds:
+                return item
+
+    def close(self):
+        """Cancel the crawl if it is still running and wait for it to wind down.
+
+        Afterwards the queue holds only the end of the stream, so a
+        next_record call still waiting on it, e.g. in an executor thread
+        whose consumer was cancelled, returns None instead of waiting forever.
+        """
+        self._cancelled.set()
+        if self._thread is not None:
+            self._thread.join()
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                break
+        self._queue.put_nowait(_END)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    async def __aenter__(self):
+        return self.start()
+
+    async def __aexit__(self, *exc_info):
+        await asyncio.get_running_loop().run_in_executor(None, self.close)
+
+def iter_records(category_option=None, max_pages=None, kinds=RECORD_KINDS, buffer_size=DEFAULT_BUFFER_SIZE, **scrape_options):
+    """Crawl a category, yielding (kind, record) for each valid listing and detailed product as it is scraped.
+
+    Nothing runs until the first record is asked for. Closing the generator
+    (or leaving a `with contextlib.closing(...)` block) cancels the crawl.
+    Remaining keyword arguments are passed to scrape_1stdibs. To read the
+    crawl's summary afterwards, iterate a ProductStream instead and read its result.
+    """
+    with ProductStream(category_option, max_pages, buffer_size, kinds, **scrape_options) as stream:
+        yield from stream
+
+def iter_products(category_option=None, max_pages=None, buffer_size=DEFAULT_BUFFER_SIZE, **scrape_options):
+    """Crawl a category, yielding each detailed product record as soon as it is scraped (see iter_records)"""
+    records = iter_records(category_option, max_pages, ("product",), buffer_size, **scrape_options)
+    try:
+        for _, record in records:
+            yield record
+    finally:
+        records.close()
+
+async def aiter_records(category_option=None, max_pages=None, kinds=RECORD_KINDS, buffer_size=DEFAULT_BUFFER_SIZE,
+                        **scrape_options):
+    """Async version of iter_records, waiting for records on the default executor so the event loop keeps running"""
+    async with ProductStream(category_option, max_pages, buffer_size, kinds, **scrape_options) as stream:
+        async for item in stream:
+            yield item
+
+async def aiter_products(category_option=None, max_pages=None, buffer_size=DEFAULT_BUFFER_SIZE, **scrape_options):
+    """Async version of iter_products"""
+    records = aiter_records(category_option, max_pages, ("product",), buffer_size, **scrape_options)
+    try:
+        async for _, record in records:
+            yield record
+    finally:
+        await records.aclose()
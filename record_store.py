@@ -0,0 +1,172 @@
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+from product_index import latest_product_files
+from product_records import split_raw_data, join_raw_data
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STORE_PATH = 'scraped_data/products.sqlite'
+DEFAULT_PRODUCTS_DIR = 'scraped_data/products'
+
+class SqliteRecordStore:
+    """Product records in a single SQLite database keyed by product_id.
+
+    A product scraped again replaces its previous row. The raw_data mirror is
+    not stored twice: only the raw_data entries that differ from the record's
+    own fields (jsonLd, extractionMethod, ...) are kept, and get() rebuilds
+    the full record.
+    """
+
+    def __init__(self, path=DEFAULT_STORE_PATH):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS products (
+                    product_id TEXT PRIMARY KEY,
+                    scraped_at REAL NOT NULL,
+                    fields TEXT NOT NULL,
+                    raw_extra TEXT NOT NULL
+                )
+            """)
+
+    def put(self, product, scraped_at=None):
+        """Insert or replace a product record"""
+        fields, raw_extra = split_raw_data(product)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO products (product_id, scraped_at, fields, raw_extra) VALUES (?, ?, ?, ?)",
+                (product["product_id"], scraped_at or time.time(),
+                 json.dumps(fields, ensure_ascii=False), json.dumps(raw_extra, ensure_ascii=False))
+            )
+        return self.path
+
+    def put_many(self, products):
+        """Insert or replace (product, scraped_at) pairs in one transaction"""
+        rows = []
+        for product, scraped_at in products:
+            fields, raw_extra = split_raw_data(product)
+            rows.append((product["product_id"], scraped_at or time.time(),
+                         json.dumps(fields, ensure_ascii=False), json.dumps(raw_extra, ensure_ascii=False)))
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO products (product_id, scraped_at, fields, raw_extra) VALUES (?, ?, ?, ?)",
+                rows
+            )
+        return len(rows)
+
+    def get(self, product_id):
+        """Return the full product record for an ID, or None"""
+        with self._lock:
+            row = self._conn.execute("SELECT fields, raw_extra FROM products WHERE product_id = ?", (product_id,)).fetchone()
+        return join_raw_data(json.loads(row[0]), json.loads(row[1])) if row else None
+
+    def __contains__(self, product_id):
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM products WHERE product_id = ?", (product_id,)).fetchone() is not None
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM products").fetchone()[0]
+
+    def iter_records(self, batch_size=500):
+        """Yield every product record, reading batch_size rows at a time"""
+        last_id = ""
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT product_id, fields, raw_extra FROM products WHERE product_id > ? ORDER BY product_id LIMIT ?",
+                    (last_id, batch_size)
+                ).fetchall()
+            if not rows:
+                return
+            for product_id, fields, raw_extra in rows:
+                yield join_raw_data(json.loads(fields), json.loads(raw_extra))
+            last_id = rows[-1][0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+class JsonFileRecordStore:
+    """The original layout: one product_<id>_<timestamp>Z.json file per scraped product"""
+
+    def __init__(self, path=DEFAULT_PRODUCTS_DIR):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def put(self, product, scraped_at=None):
+        """Save a detailed product to its own JSON file"""
+        stamp = datetime.fromtimestamp(scraped_at) if scraped_at else datetime.now()
+        filename = os.path.join(self.path, f"product_{product['product_id']}_{stamp.strftime('%Y-%m-%dT%H-%M-%S-%f')[:-3]}Z.json")
+        with open(filename, 'w', encoding='utf-8') as f:
+            json.dump(product, f, ensure_ascii=False, indent=2)
+        logger.debug(f"Saved detailed product data to {filename}")
+        return filename
+
+    def get(self, product_id):
+        """Return the newest saved record for an ID, or None"""
+        latest = latest_product_files(self.path).get(product_id)
+        if latest is None:
+            return None
+        with open(latest[1], encoding='utf-8') as f:
+            return json.load(f)
+
+    def __contains__(self, product_id):
+        return product_id in latest_product_files(self.path)
+
+    def __len__(self):
+        return len(latest_product_files(self.path))
+
+    def iter_records(self):
+        """Yield the newest record of every product"""
+        for _, filename in latest_product_files(self.path).values():
+            with open(filename, encoding='utf-8') as f:
+                yield json.load(f)
+
+    def close(self):
+        pass
+
+RECORD_STORES = {
+    "sqlite": (SqliteRecordStore, DEFAULT_STORE_PATH),
+    "files": (JsonFileRecordStore, DEFAULT_PRODUCTS_DIR)
+}
+
+def open_record_store(backend="sqlite", path=None):
+    """Open a record store by backend name ("sqlite" or "files"), at path or the backend's default location"""
+    if backend not in RECORD_STORES:
+        raise ValueError(f"Unknown record store backend: {backend}")
+    store_class, default_path = RECORD_STORES[backend]
+    return store_class(path or default_path)
+
+def migrate_product_files(store, directory=DEFAULT_PRODUCTS_DIR, batch_size=500):
+    """Load the newest product file of every product_id in directory into store, returning the count"""
+    batch = []
+    count = 0
+    for scraped_at, filename in latest_product_files(directory).values():
+        with open(filename, encoding='utf-8') as f:
+            batch.append((json.load(f), scraped_at))
+        if len(batch) >= batch_size:
+            count += store.put_many(batch)
+            batch = []
+    if batch:
+        count += store.put_many(batch)
+    return count
+
+if __name__ == "__main__":
+    # Migrate product files into SQLite, e.g. python record_store.py scraped_data/products scraped_data/products.sqlite
+    source = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_PRODUCTS_DIR
+    record_store = SqliteRecordStore(sys.argv[2] if len(sys.argv) > 2 else DEFAULT_STORE_PATH)
+    count = migrate_product_files(record_store, source)
+    record_store.close()
+    print(f"Migrated {count} products from {source} into {record_store.path}")
@@ -0,0 +1,130 @@
+import argparse
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from html_archive import DEFAULT_ARCHIVE_PATH, PAGE_TYPES, HtmlArchive
+from html_dom import parse_page
+from http_extract import extract_listings_from_html, extract_product_from_html
+from metrics import configure_logging
+from output_writer import JsonlWriter, run_timestamp
+from product_records import extract_product_id
+from selector_registry import DEFAULT_SELECTOR_STATS_PATH, SelectorRegistry
+from selenium_base import harvest_listing_page, read_product_page
+
+logger = logging.getLogger(__name__)
+
+# Archived pages handed to a worker process at a time
+REEXTRACT_BATCH_SIZE = 64
+
+_registries = {}
+
+def worker_registry(selector_stats_path):
+    """The selector stats a worker orders its selectors by, loaded once per process and never saved"""
+    if selector_stats_path not in _registries:
+        registry = SelectorRegistry(selector_stats_path)
+        registry.path = None
+        _registries[selector_stats_path] = registry
+    return _registries[selector_stats_path]
+
+def reextract_page(entry, page_html, registry):
+    """Rebuild the records of one archived page the way the crawl that saved it did.
+
+    Rendered pages go through the same selector code as a live browser, via
+    html_dom.parse_page. Pages fetched over HTTP are read from their embedded
+    JSON like the fast path, and product pages where that fails fall back to
+    the selectors.
+    """
+    url = entry["url"]
+    if entry["page_type"] == "listing":
+        if entry["source"] == "http":
+            return extract_listings_from_html(page_html)
+        return harvest_listing_page(parse_page(page_html, url), "webdriver", registry) or []
+
+    listing = entry.get("listing") or {}
+    product_id = listing.get("product_id") or extract_product_id(url)
+    product_data = None
+    if entry["source"] == "http":
+        product_data = extract_product_from_html(page_html, url, product_id, listing)
+    if product_data is None:
+        product_data = read_product_page(parse_page(page_html, url), product_id, url, listing, registry)
+    return [product_data] if product_data else []
+
+def reextract_batch(archive_root, selector_stats_path, entries):
+    """Re-extract a batch of manifest entries in a worker process, returning (page_type, records) per entry"""
+    archive = HtmlArchive(archive_root)
+    registry = worker_registry(selector_stats_path)
+    results = []
+    for entry in entries:
+        try:
+            records = reextract_page(entry, archive.read(entry["sha256"]), registry)
+        except Exception as e:
+            logger.warning(f"Could not re-extract {entry['url']}: {str(e)}")
+            records = []
+        results.append((entry["page_type"], records))
+    return results
+
+def reextract_archive(archive_root=DEFAULT_ARCHIVE_PATH, page_types=PAGE_TYPES, output_dir='scraped_data', workers=None,
+                      batch_size=REEXTRACT_BATCH_SIZE, latest_only=True, selector_stats_path=DEFAULT_SELECTOR_STATS_PATH):
+    """Rebuild listing and product records from archived HTML across a process pool, without network or browser.
+
+    With latest_only, each URL is re-extracted from its most recent visit.
+    Records are written in archive order to reextracted_listings_<time>.jsonl
+    and reextracted_detailed_<time>.jsonl under output_dir. Returns the
+    output paths, record counts and pages per second.
+    """
+    archive = HtmlArchive(archive_root)
+    entries = [entry for page_type in page_types
+               for entry in (archive.latest_entries(page_type) if latest_only else archive.entries(page_type))]
+    batches = [entries[i:i + batch_size] for i in range(0, len(entries), batch_size)]
+
+    os.makedirs(output_dir, exist_ok=True)
+    timestamp = run_timestamp()
+    writers = {
+        "listing": JsonlWriter(os.path.join(output_dir, f"reextracted_listings_{timestamp}.jsonl"), "never", mode="x"),
+        "product": JsonlWriter(os.path.join(output_dir, f"reextracted_detailed_{timestamp}.jsonl"), "never", mode="x")
+    }
+    logger.info(f"Re-extracting {len(entries)} archived pages with {workers or os.cpu_count()} processes")
+    start = time.perf_counter()
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for results in executor.map(partial(reextract_batch, archive_root, selector_stats_path), batches):
+                for page_type, records in results:
+                    for record in records:
+                        writers[page_type].write(record)
+    finally:
+        for writer in writers.values():
+            writer.close()
+    elapsed = time.perf_counter() - start
+    return {
+        "pages": len(entries),
+        "listings": writers["listing"].count,
+        "products": writers["product"].count,
+        "listings_path": writers["listing"].path,
+        "detailed_path": writers["product"].path,
+        "pages_per_sec": round(len(entries) / elapsed, 1) if elapsed else None
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rebuild listing and product records from the HTML archive")
+    parser.add_argument("--archive", default=DEFAULT_ARCHIVE_PATH, help="archive directory")
+    parser.add_argument("--page-type", choices=PAGE_TYPES, help="only re-extract this page type")
+    parser.add_argument("--output-dir", default='scraped_data')
+    parser.add_argument("--workers", type=int, help="worker processes (default: one per CPU)")
+    parser.add_argument("--batch-size", type=int, default=REEXTRACT_BATCH_SIZE, help="pages per worker task")
+    parser.add_argument("--all-visits", action="store_true", help="re-extract every archived visit, not just each URL's latest")
+    parser.add_argument("--selector-stats", default=DEFAULT_SELECTOR_STATS_PATH, help="selector stats that order the fallbacks")
+    args = parser.parse_args(argv)
+    configure_logging()
+
+    summary = reextract_archive(args.archive, (args.page_type,) if args.page_type else PAGE_TYPES, args.output_dir,
+                                args.workers, args.batch_size, not args.all_visits, args.selector_stats)
+    print(f"Re-extracted {summary['pages']} pages at {summary['pages_per_sec']} pages/s")
+    print(f"{summary['listings']} listings written to {summary['listings_path']}")
+    print(f"{summary['products']} products written to {summary['detailed_path']}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
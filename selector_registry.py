@@ -0,0 +1,118 @@
+import json
+import os
+import sys
+import threading
+from selenium.webdriver.common.by import By
+from metrics import metrics
+
+DEFAULT_SELECTOR_STATS_PATH = 'scraped_data/selector_stats.json'
+
+def element_text(element):
+    """Read an element's visible text"""
+    return element.text.strip()
+
+class SelectorRegistry:
+    """Hit and miss counts for fallback selectors, kept per page type and field.
+
+    order() puts the selector with the best observed hit rate first, so the
+    selector that has been working all run is tried before the ones that have
+    not. Selectors without stats keep their configured order, so the fallback
+    lists still decide what is tried first on a fresh run. Stats are loaded
+    from and saved to a JSON file at path; pass path=None to keep them in
+    memory only.
+    """
+
+    def __init__(self, path=DEFAULT_SELECTOR_STATS_PATH):
+        self.path = path
+        self.stats = {}
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                self.stats = json.load(f)
+
+    def _counts(self, page_type, field, selector):
+        return self.stats.setdefault(page_type, {}).setdefault(field, {}).setdefault(selector, [0, 0])
+
+    def hit_rate(self, page_type, field, selector):
+        """Smoothed hit rate of a selector; a selector never tried scores 0.5"""
+        hits, misses = self.stats.get(page_type, {}).get(field, {}).get(selector, [0, 0])
+        return (hits + 1) / (hits + misses + 2)
+
+    def order(self, page_type, field, selectors):
+        """Return the selectors sorted by hit rate, keeping the configured order for ties"""
+        with self._lock:
+            ranked = sorted(enumerate(selectors), key=lambda item: (-self.hit_rate(page_type, field, item[1]), item[0]))
+        return [selector for _, selector in ranked]
+
+    def record(self, page_type, field, selector, hit):
+        with self._lock:
+            self._counts(page_type, field, selector)[0 if hit else 1] += 1
+
+    def record_attempts(self, page_type, field, tried_selectors, winner):
+        """Record a miss for each selector tried before the winner and a hit for the winner (None if all missed)"""
+        if winner is None:
+            metrics.incr("scraper_selector_misses_total", page_type=page_type, field=field)
+        with self._lock:
+            for selector in tried_selectors:
+                if selector == winner:
+                    self._counts(page_type, field, selector)[0] += 1
+                    break
+                self._counts(page_type, field, selector)[1] += 1
+
+    def find(self, root, page_type, field, selectors, read=element_text):
+        """Return the first non-empty value read from the best selectors under root, or ""
+
+        Uses find_elements so a selector that matches nothing costs no exception.
+        """
+        for selector in self.order(page_type, field, selectors):
+            try:
+                elements = root.find_elements(By.CSS_SELECTOR, selector)
+                value = read(elements[0]) if elements else ""
+            except Exception:
+                value = ""
+            self.record(page_type, field, selector, bool(value))
+            if value:
+                return value
+        metrics.incr("scraper_selector_misses_total", page_type=page_type, field=field)
+        return ""
+
+    def dead_selectors(self, min_hits=20):
+        """Return (page_type, field, selector) for selectors that never hit while their field hit at least min_hits times"""
+        with self._lock:
+            return [
+                (page_type, field, selector)
+                for page_type, fields in self.stats.items()
+                for field, selectors in fields.items()
+                if sum(hits for hits, _ in selectors.values()) >= min_hits
+                for selector, (hits, misses) in selectors.items()
+                if hits == 0
+            ]
+
+    def report(self, min_hits=20):
+        """Summarise each field's best selector and any dead selectors"""
+        lines = ["Selector hit rates:"]
+        with self._lock:
+            for page_type, fields in sorted(self.stats.items()):
+                for field, selectors in sorted(fields.items()):
+                    best, (hits, misses) = max(selectors.items(), key=lambda item: (item[1][0], -item[1][1]))
+                    lines.append(f"  {page_type}.{field}: {best} ({hits} hits, {misses} misses)")
+        dead = self.dead_selectors(min_hits)
+        if dead:
+            lines.append("Dead selectors:")
+            lines.extend(f"  {page_type}.{field}: {selector}" for page_type, field, selector in dead)
+        return "\n".join(lines)
+
+    def save(self):
+        """Write the stats to path, replacing the previous file atomically"""
+        if not self.path:
+            return
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self._lock:
+            with open(self.path + ".tmp", 'w', encoding='utf-8') as f:
+                json.dump(self.stats, f, indent=2)
+            os.replace(self.path + ".tmp", self.path)
+
+if __name__ == "__main__":
+    # Print the saved selector stats, e.g. python selector_registry.py scraped_data/selector_stats.json
+    print(SelectorRegistry(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_SELECTOR_STATS_PATH).report())
@@ -1,586 +1,1276 @@
 import os
-import json
+import asyncio
 import time
 import re
-from datetime import datetime
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.options import Options
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from urllib.parse import urlsplit
 from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException, NoSuchElementException, ElementClickInterceptedException, StaleElementReferenceException, InvalidSessionIdException
-from webdriver_manager.chrome import ChromeDriverManager
-
-def extract_product_id(url):
-    """Extract product ID from product URL"""
-    match = re.search(r'/id-([^/]+)/?', url)
-    if match:
-        return match.group(1)
-    return None
-
-def scrape_product_details(driver, product_url, product_id, base_data):
-    """Scrape detailed information from a product page"""
-    print(f"Visiting product page: {product_url}")
-    try:
-        driver.get(product_url)
-        time.sleep(3)  # Allow page to load
-        
-        # Skip if we don't have required fields
-        if not product_id or not product_url:
-            print("Missing product ID or URL - skipping")
-            return None
-            
-        # Initialize product data with base information from the listing page
-        product_data = {
-            "retailer": "1stDibs",
-            "product_id": product_id,
-            "name": base_data.get("name", ""),
-            "slug": product_id,
-            "price": base_data.get("price", ""),
-            "description": "",
-            "image_url": base_data.get("image_url", ""),
-            "url": product_url,
-            "specifications": {},
-            "raw_data": {
-                "productId": product_id,
-                "slug": product_id,
-                "url": product_url,
-                "name": base_data.get("name", ""),
-                "price": base_data.get("price", ""),
-                "imageUrl": base_data.get("image_url", ""),
-                "description": "",
-                "specifications": {},
-                "jsonLd": None,
-                "extractionMethod": "automated"
+from selenium.common.exceptions import InvalidSessionIdException
+from wait_policy import WaitPolicy
+from http_extract import build_page_url, create_session, fetch_listing_page, fetch_product_details, parse_pagination
+from async_crawler import AsyncCrawler
+from product_index import DEFAULT_INDEX_PATH, ProductIndex
+from html_archive import HtmlArchive
+from image_downloader import DEFAULT_IMAGE_PATH, ImageDownloader, ImageStore
+from delta import DEFAULT_DELTA_INDEX_PATH, DeltaIndex, write_deltas
+from output_writer import JsonlWriter, compact_jsonl, iter_batches, iter_jsonl, run_timestamp
+from record_store import open_record_store
+from selector_registry import DEFAULT_SELECTOR_STATS_PATH, SelectorRegistry
+from browser_profile import NetworkMeter, resolve_profile
+from driver_pool import DriverSession, SessionStats, create_driver, is_session_error, quit_driver
+from metrics import configure_logging, metrics
+from product_records import (HERO_IMAGE_WIDTH, extract_product_id, is_valid_listing, spec_key, upscale_image_url,
+                             new_product_record, set_product_field, has_required_product_fields)
+
+logger = logging.getLogger(__name__)
+
+# Categories that can be chosen by number
+CATEGORY_OPTIONS = {
+    "1": {"name": "Lighting", "url": "https://www.1stdibs.com/furniture/lighting/"},
+    "2": {"name": "Seating", "url": "https://www.1stdibs.com/furniture/seating/"},
+    "3": {"name": "Tables", "url": "https://www.1stdibs.com/furniture/tables/"},
+    "4": {"name": "Storage", "url": "https://www.1stdibs.com/furniture/storage-case-pieces/"}
+}
+
+# What to do when a listing page has no products or pagination fails:
+# "ask" prompts on the console, "skip" moves on to the next page, "stop" ends
+# the crawl normally and "fail" ends it with an error
+FAILURE_POLICIES = ("ask", "skip", "stop", "fail")
+
+# Concurrent HTTP requests used by the browser-free detail fast path
+HTTP_FETCH_THREADS = 8
+
+# Listings read back from disk per detail stage batch in harvest_first mode
+DETAIL_BATCH_SIZE = 100
+
+# Times a listing page is retried on a relaunched browser before giving up
+PAGE_SESSION_RETRIES = 2
+
+# Listing pages fetched over HTTP ahead of the one being processed
+LISTING_PREFETCH_PAGES = 4
+
+# Selector patterns for product tiles on a listing page, tried in order
+PRODUCT_TILE_SELECTORS = [
+    "div[data-tn='item-tile-wrapper']",
+    "div.item-tile-wrapper",
+    "div[data-component='ItemTile']",
+    "li.product-grid-item",
+    "div.productTile",
+    "article.productCard"
+]
+
+# Selectors for the pagination control that leads to the next listing page
+NEXT_BUTTON_SELECTORS = [
+    "button[data-tn='page-forward']",
+    "a[data-tn='page-forward']",
+    "button.pagination-next",
+    "a.pagination-next",
+    "li.pagination-next > a",
+    "button[aria-label='Next Page']"
+]
+
+# Selectors for the description on a product page, tried in order
+PRODUCT_DESCRIPTION_SELECTORS = [
+    "div[data-tn='listing-page-description']",
+    "div.product-description",
+    "div.description",
+    "#description"
+]
+
+# Selectors for the specifications section on a product page, tried in order
+PRODUCT_SPEC_SECTION_SELECTORS = [
+    "div[data-tn='listing-page-details']",
+    "div.product-details",
+    "section.specifications",
+    "table.details"
+]
+
+# Selectors for the main image on a product page, tried in order
+PRODUCT_IMAGE_SELECTORS = [
+    "img[data-tn='listing-page-hero-image']",
+    ".product-image-main img",
+    ".main-image img",
+    "div.gallery img"
+]
+
+# Fallback selectors for each listing field, tried in order within a tile
+TILE_FIELD_SELECTORS = {
+    "name": [
+        "h2",
+        "h3",
+        "a[data-tn='item-tile-title-anchor']",
+        ".title",
+        "[data-tn='product-title']"
+    ],
+    "url": [
+        "a[data-tn='item-tile-title-anchor']",
+        "a[href*='/id-']",
+        "a.product-link",
+        "a:first-child"
+    ],
+    "image_url": [
+        "img[data-tn='product-image']",
+        "img.product-image",
+        "img:first-child",
+        "[data-srcset]",
+        "[srcset]"
+    ],
+    "price": [
+        "div[data-tn='price']",
+        ".price",
+        "[data-tn='product-price']",
+        "span.money"
+    ],
+    "creator": [
+        "a[data-tn='quick-view-creator-link']",
+        ".creator",
+        ".designer",
+        "[data-tn='product-creator']"
+    ]
+}
+
+# Extracts every tile on the page in one round trip, applying the same
+# fallback order and value rules as extract_listing_data. Like WebDriver's
+# element text, text of hidden elements (e.g. the quick view panel) is empty.
+# Each row also reports which selector produced each field.
+EXTRACT_TILES_SCRIPT = """
+const tileSelectors = arguments[0];
+const fieldSelectors = arguments[1];
+
+function isVisible(el) {
+    return el.getClientRects().length > 0 && getComputedStyle(el).visibility !== 'hidden';
+}
+
+function readValue(field, el) {
+    if (field === 'url') {
+        return el.href || el.getAttribute('href') || '';
+    }
+    if (field === 'image_url') {
+        return el.src || el.getAttribute('data-src') || el.getAttribute('srcset') || '';
+    }
+    return isVisible(el) ? (el.innerText || '').trim() : '';
+}
+
+for (const tileSelector of tileSelectors) {
+    const tiles = document.querySelectorAll(tileSelector);
+    if (!tiles.length) {
+        continue;
+    }
+    const rows = [];
+    for (const tile of tiles) {
+        const row = {hits: {}};
+        for (const [field, selectors] of Object.entries(fieldSelectors)) {
+            row[field] = '';
+            row.hits[field] = null;
+            for (const selector of selectors) {
+                let el = null;
+                try {
+                    el = tile.querySelector(selector);
+                } catch (e) {
+                    continue;
+                }
+                if (!el) {
+                    continue;
+                }
+                const value = readValue(field, el);
+                if (value) {
+                    row[field] = value;
+                    row.hits[field] = selector;
+                    break;
+                }
             }
         }
-        
-        # Extract description
-        description_selectors = [
-            "div[data-tn='listing-page-description']",
-            "div.product-description",
-            "div.description",
-            "#description"
-        ]
-        
-        for selector in description_selectors:
-            try:
-                desc_element = driver.find_element(By.CSS_SELECTOR, selector)
-                description = desc_element.text
-                if description:
-                    product_data["description"] = description
-                    product_data["raw_data"]["description"] = description
-                    break
-            except:
+        rows.push(row);
+    }
+    return {selector: tileSelector, tiles: rows};
+}
+return {selector: null, tiles: []};
+"""
+
+def hero_image_url(img_element):
+    """Read a product page image URL that can be upscaled, or "" """
+    image_url = img_element.get_attribute("src")
+    return image_url if image_url and "width=" in image_url else ""
+
+def load_page(driver, url, page_type):
+    """Open a page in the browser, timing the load by page type"""
+    with metrics.timer("scraper_page_load_seconds", page_type=page_type):
+        driver.get(url)
+
+def export_metrics(metrics_path=None, metrics_server=None):
+    """Log the stage timings, write the metrics to metrics_path and stop the metrics server"""
+    logger.info(metrics.summary())
+    if metrics_path:
+        metrics.write(metrics_path)
+        logger.info(f"Metrics written to {metrics_path}")
+    if metrics_server is not None:
+        metrics_server.shutdown()
+        metrics_server.server_close()
+
+def record_product_outcome(method, started, result, reason="ok"):
+    """Count a product page by how it ended and time how long it took"""
+    metrics.observe("scraper_product_scrape_seconds", time.perf_counter() - started, method=method)
+    metrics.incr("scraper_products_total", method=method, result=result, reason=reason)
+
+class CrawlError(Exception):
+    """Raised when a failure policy of "fail" ends a crawl"""
+
+class CrawlCancelled(Exception):
+    """Raised from an on_record callback to stop a crawl, which then ends with status "cancelled" """
+
+def read_product_page(page, product_id, product_url, base_data, registry=None):
+    """Build a product record from a loaded product page, or return None if it lacks a name or an image.
+
+    page is a WebDriver on the product page or an html_dom.parse_page of its
+    saved HTML; both answer the same find_elements calls, so a page
+    re-extracted from the archive gives the same record as the live one.
+    """
+    if registry is None:
+        registry = SelectorRegistry(path=None)
+    description_selectors = registry.order("product", "description", PRODUCT_DESCRIPTION_SELECTORS)
+    
+    # Initialize product data with base information from the listing page
+    product_data = new_product_record(product_id, product_url, base_data)
+    
+    # Extract description
+    description = registry.find(page, "product", "description", description_selectors, read=lambda el: el.text)
+    if description:
+        set_product_field(product_data, "description", description)
+    
+    # Extract specifications/details
+    specs = {}
+    
+    # Try to find specification tables or lists, best selector first
+    for selector in registry.order("product", "spec_section", PRODUCT_SPEC_SECTION_SELECTORS):
+        try:
+            # Look for detail labels and values
+            spec_sections = page.find_elements(By.CSS_SELECTOR, selector)
+            if not spec_sections:
+                registry.record("product", "spec_section", selector, False)
                 continue
-        
-        # Extract specifications/details
-        specs = {}
-        
-        # Try to find specification tables or lists
-        spec_section_selectors = [
-            "div[data-tn='listing-page-details']",
-            "div.product-details",
-            "section.specifications",
-            "table.details"
-        ]
-        
-        for selector in spec_section_selectors:
+            spec_section = spec_sections[0]
+            
+            # Try to find structured specification data
             try:
-                # Look for detail labels and values
-                spec_section = driver.find_element(By.CSS_SELECTOR, selector)
+                # Look for dt/dd pairs
+                labels = spec_section.find_elements(By.CSS_SELECTOR, "dt")
+                values = spec_section.find_elements(By.CSS_SELECTOR, "dd")
                 
-                # Try to find structured specification data
+                for i in range(min(len(labels), len(values))):
+                    label = spec_key(labels[i].text)
+                    value = values[i].text.strip()
+                    if label and value:
+                        specs[label] = value
+            except:
+                # Try alternative format with div pairs or table rows
                 try:
-                    # Look for dt/dd pairs
-                    labels = spec_section.find_elements(By.CSS_SELECTOR, "dt")
-                    values = spec_section.find_elements(By.CSS_SELECTOR, "dd")
-                    
-                    for i in range(min(len(labels), len(values))):
-                        label = labels[i].text.strip().lower().replace(" ", "_")
-                        value = values[i].text.strip()
-                        if label and value:
-                            specs[label] = value
+                    rows = spec_section.find_elements(By.CSS_SELECTOR, "tr, .specification-row")
+                    for row in rows:
+                        try:
+                            label_elem = row.find_element(By.CSS_SELECTOR, "th, .label, .spec-label")
+                            value_elem = row.find_element(By.CSS_SELECTOR, "td, .value, .spec-value")
+                            
+                            label = spec_key(label_elem.text)
+                            value = value_elem.text.strip()
+                            if label and value:
+                                specs[label] = value
+                        except:
+                            continue
                 except:
-                    # Try alternative format with div pairs or table rows
-                    try:
-                        rows = spec_section.find_elements(By.CSS_SELECTOR, "tr, .specification-row")
-                        for row in rows:
-                            try:
-                                label_elem = row.find_element(By.CSS_SELECTOR, "th, .label, .spec-label")
-                                value_elem = row.find_element(By.CSS_SELECTOR, "td, .value, .spec-value")
-                                
-                                label = label_elem.text.strip().lower().replace(" ", "_")
-                                value = value_elem.text.strip()
-                                if label and value:
-                                    specs[label] = value
-                            except:
-                                continue
-                    except:
-                        pass
-                
-                # If we found at least some specifications, break
-                if specs:
-                    break
-                    
-            except:
-                continue
-        
-        # Add creator to specifications if available from listing
-        if base_data.get("creator") and base_data.get("creator") != "":
-            specs["creator"] = base_data.get("creator")
-        
-        # Update specifications in product data
-        product_data["specifications"] = specs
-        product_data["raw_data"]["specifications"] = specs
-        
-        # Get higher quality image if available
-        image_selectors = [
-            "img[data-tn='listing-page-hero-image']",
-            ".product-image-main img",
-            ".main-image img",
-            "div.gallery img"
-        ]
+                    pass
+            
+            registry.record("product", "spec_section", selector, bool(specs))
+            # If we found at least some specifications, break
+            if specs:
+                break
         
-        for selector in image_selectors:
-            try:
-                img_element = driver.find_element(By.CSS_SELECTOR, selector)
-                image_url = img_element.get_attribute("src")
-                if image_url and "width=" in image_url:
-                    # Try to increase the image size by modifying URL parameter
-                    product_data["image_url"] = image_url.replace("width=240", "width=1200")
-                    product_data["raw_data"]["imageUrl"] = image_url.replace("width=240", "width=1200")
-                    break
-            except:
-                continue
+        except:
+            continue
+    
+    # Add creator to specifications if available from listing
+    if base_data.get("creator") and base_data.get("creator") != "":
+        specs["creator"] = base_data.get("creator")
+    
+    # Update specifications in product data
+    set_product_field(product_data, "specifications", specs)
+    
+    # Get higher quality image if available
+    image_url = registry.find(page, "product", "image_url", PRODUCT_IMAGE_SELECTORS, read=hero_image_url)
+    if image_url:
+        # Try to increase the image size by modifying URL parameter
+        set_product_field(product_data, "image_url", upscale_image_url(image_url))
+    
+    # Validate that we have required fields before returning
+    if not has_required_product_fields(product_data):
+        return None
+    return product_data
+
+def scrape_product_details(driver, product_url, product_id, base_data, wait_policy=None, registry=None, archive=None):
+    """Scrape detailed information from a product page, saving its rendered HTML to archive when one is given"""
+    if wait_policy is None:
+        wait_policy = WaitPolicy()
+    if registry is None:
+        registry = SelectorRegistry(path=None)
+    logger.debug(f"Visiting product page: {product_url}")
+    started = time.perf_counter()
+    try:
+        wait_policy.pause()
+        load_page(driver, product_url, "product")
+        # Wait for the description to render rather than sleeping a fixed time
+        description_selectors = registry.order("product", "description", PRODUCT_DESCRIPTION_SELECTORS)
+        wait_policy.wait_for_element(driver, description_selectors, description="product description")
         
-        # Validate that we have required fields before returning
-        if not product_data["name"]:
-            print(f"Product {product_id} missing name - skipping")
+        # Skip if we don't have required fields
+        if not product_id or not product_url:
+            logger.debug("Missing product ID or URL - skipping")
+            record_product_outcome("browser", started, "skipped", "missing_id")
             return None
-            
-        if not product_data["image_url"]:
-            print(f"Product {product_id} missing image - skipping")
+        
+        if archive is not None:
+            archive.put(driver.page_source, product_url, "product", source="browser", listing=base_data)
+        product_data = read_product_page(driver, product_id, product_url, base_data, registry)
+        if product_data is None:
+            record_product_outcome("browser", started, "skipped", "missing_fields")
             return None
         
+        record_product_outcome("browser", started, "scraped")
         return product_data
     except Exception as e:
-        print(f"Error extracting product details: {str(e)}")
+        # A dead browser is the caller's to relaunch, not a product without details
+        if is_session_error(e):
+            record_product_outcome("browser", started, "error", "session_died")
+            raise
+        logger.warning(f"Error extracting product details: {str(e)}")
+        record_product_outcome("browser", started, "error", type(e).__name__)
         return None
 
-def is_valid_listing(listing_data):
-    """Check if a listing has the required fields"""
-    required_fields = ["name", "url", "image_url", "price", "product_id"]
-    for field in required_fields:
-        if not listing_data.get(field):
-            return False
-    return True
-
-def scrape_1stdibs(category_option=None, max_pages=None):
-    """Scrape data from 1stdibs.com"""
-    print("Starting scraper for 1stdibs products...")
-    
-    # Set up Chrome options for stability
-    chrome_options = Options()
-    
-    # Add a user agent to mimic a regular browser
-    user_agent = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/90.0.4430.212 Safari/537.36'
-    chrome_options.add_argument(f'user-agent={user_agent}')
-    
-    # Add additional arguments to enhance stability and avoid detection
-    chrome_options.add_argument('--disable-blink-features=AutomationControlled')
-    chrome_options.add_argument('--disable-extensions')
-    chrome_options.add_argument('--no-sandbox')
-    chrome_options.add_argument('--disable-infobars')
-    chrome_options.add_argument('--disable-dev-shm-usage')
-    chrome_options.add_argument('--disable-browser-side-navigation')
-    chrome_options.add_argument('--disable-gpu')
-    chrome_options.add_argument('--window-size=1920,1080')
-    chrome_options.add_experimental_option('excludeSwitches', ['enable-automation'])
-    chrome_options.add_experimental_option('useAutomationExtension', False)
-    
-    # Initialize the Chrome WebDriver
-    driver = webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=chrome_options)
-    driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
+class ProductDetailPool:
+    """Pool of Chrome instances that scrape product pages concurrently.
+
+    Each worker thread owns its own driver session, created on first use, and
+    pulls listings from the executor's work queue. WebDriver calls spend their
+    time waiting on chromedriver, so threads scale with the number of browsers.
+    With a driver_pool, workers borrow warm browsers from it instead of
+    starting their own, and hand them back on close. Each browser is recycled
+    after max_pages page loads or above max_rss_mb, and relaunched if it
+    crashes, with the product page retried on the new browser.
+    """
+
+    def __init__(self, num_workers=4, driver_factory=create_driver, wait_policy=None, registry=None, network_meter=None,
+                 driver_pool=None, max_pages=None, max_rss_mb=None, session_stats=None, archive=None):
+        self.num_workers = num_workers
+        self.driver_factory = driver_pool.acquire if driver_pool is not None else driver_factory
+        self.dispose_driver = driver_pool.discard if driver_pool is not None else quit_driver
+        self.driver_pool = driver_pool
+        self.wait_policy = wait_policy or WaitPolicy()
+        self.registry = registry or SelectorRegistry(path=None)
+        self.network_meter = network_meter
+        self.max_pages = max_pages
+        self.max_rss_mb = max_rss_mb
+        self.session_stats = session_stats or SessionStats()
+        self.archive = archive
+        self._executor = ThreadPoolExecutor(max_workers=num_workers, thread_name_prefix="product-worker")
+        self._local = threading.local()
+        self._sessions = []
+        self._lock = threading.Lock()
+
+    def _get_session(self):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = DriverSession(self.driver_factory, self.dispose_driver, self.max_pages, self.max_rss_mb, self.session_stats)
+            self._local.session = session
+            with self._lock:
+                self._sessions.append(session)
+        return session
+
+    def _scrape(self, listing):
+        session = self._get_session()
+        detailed_product = session.run(scrape_product_details, listing["url"], listing["product_id"], listing,
+                                       self.wait_policy, self.registry, self.archive)
+        if self.network_meter is not None and not session.dead:
+            self.network_meter.measure(session.driver, "product")
+        return detailed_product
+
+    def submit(self, listing):
+        """Queue a listing for detail scraping and return its future"""
+        return self._executor.submit(self._scrape, listing)
+
+    def scrape(self, listings):
+        """Scrape product pages for the listings concurrently, returning results in listing order"""
+        futures = [self.submit(listing) for listing in listings]
+        results = []
+        for listing, future in zip(listings, futures):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                logger.warning(f"Worker failed on {listing.get('url')}: {str(e)}")
+                results.append(None)
+        return results
+
+    def close(self):
+        """Stop the workers and quit their browsers, or return them to the driver pool"""
+        self._executor.shutdown(wait=True)
+        for session in self._sessions:
+            session.close(release=self.driver_pool.release if self.driver_pool is not None else None)
+        self._sessions = []
+
+def find_product_tiles(driver, registry):
+    """Find the product tiles on the current listing page"""
+    # Try several selector patterns to find product listings, best first
+    for selector in registry.order("listing", "tile", PRODUCT_TILE_SELECTORS):
+        try:
+            logger.debug(f"Trying selector: {selector}")
+            # Check if elements are present
+            elements = driver.find_elements(By.CSS_SELECTOR, selector)
+            registry.record("listing", "tile", selector, bool(elements))
+            if elements and len(elements) > 0:
+                logger.debug(f"Found {len(elements)} products with selector: {selector}")
+                return elements
+        except Exception as e:
+            logger.debug(f"Error with selector {selector}: {str(e)}")
+    return []
+
+def read_tile_field(field, element):
+    """Read a listing field's value from the element its selector matched"""
+    if field == "url":
+        return element.get_attribute("href") or ""
+    if field == "image_url":
+        return element.get_attribute("src") or element.get_attribute("data-src") or element.get_attribute("srcset") or ""
+    return element.text
+
+def extract_listing_data(tile, registry=None):
+    """Extract the listing fields from a single product tile into a plain dict"""
+    if registry is None:
+        registry = SelectorRegistry(path=None)
+    listing_data = {}
     
-    try:
-        # Define available categories
-        category_options = {
-            "1": {"name": "Lighting", "url": "https://www.1stdibs.com/furniture/lighting/"},
-            "2": {"name": "Seating", "url": "https://www.1stdibs.com/furniture/seating/"},
-            "3": {"name": "Tables", "url": "https://www.1stdibs.com/furniture/tables/"},
-            "4": {"name": "Storage", "url": "https://www.1stdibs.com/furniture/storage-case-pieces/"}
-        }
+    # Try each field's selectors, the historically best first
+    for field, selectors in TILE_FIELD_SELECTORS.items():
+        listing_data[field] = registry.find(tile, "tile", field, selectors, read=partial(read_tile_field, field))
+    
+    # Extract product_id from URL
+    listing_data['product_id'] = extract_product_id(listing_data['url'])
+    
+    return listing_data
+
+def extract_tiles_js(driver, registry):
+    """Extract the fields of every product tile with a single execute_script call"""
+    tile_selectors = registry.order("listing", "tile", PRODUCT_TILE_SELECTORS)
+    field_selectors = {field: registry.order("tile", field, selectors) for field, selectors in TILE_FIELD_SELECTORS.items()}
+    result = driver.execute_script(EXTRACT_TILES_SCRIPT, tile_selectors, field_selectors)
+    if not result or not result.get("tiles"):
+        return []
+    
+    logger.debug(f"Extracted {len(result['tiles'])} products in the browser with selector: {result['selector']}")
+    registry.record_attempts("listing", "tile", tile_selectors, result["selector"])
+    listings = []
+    for tile_data in result["tiles"]:
+        for field, selectors in field_selectors.items():
+            registry.record_attempts("tile", field, selectors, tile_data["hits"].get(field))
+        listing_data = {field: tile_data.get(field, "") for field in TILE_FIELD_SELECTORS}
+        listing_data['product_id'] = extract_product_id(listing_data['url']) if listing_data['url'] else None
+        listings.append(listing_data)
+    return listings
+
+def harvest_listing_page(driver, extraction_mode="js", registry=None):
+    """Extract every valid listing on the current page into plain dicts.
+
+    Returns None when no product tiles could be found. Nothing here navigates
+    away from the page, so tile references stay valid for the whole loop.
+    In "js" mode all tiles are read in one browser round trip; the per-element
+    "webdriver" mode is used as a fallback when that finds nothing. Selector
+    hits and misses are recorded in the registry.
+    """
+    if registry is None:
+        registry = SelectorRegistry(path=None)
+    if extraction_mode == "js":
+        try:
+            tile_listings = extract_tiles_js(driver, registry)
+        except Exception as e:
+            logger.warning(f"In-browser tile extraction failed, falling back to WebDriver lookups: {str(e)}")
+            tile_listings = []
         
-        # Use provided category or default to lighting (1)
-        if category_option is None:
-            print("Available categories:")
-            for key, value in category_options.items():
-                print(f"{key}. {value['name']}")
+        if tile_listings:
+            page_listings = []
+            for i, listing_data in enumerate(tile_listings, 1):
+                if is_valid_listing(listing_data):
+                    page_listings.append(listing_data)
+                else:
+                    logger.debug(f"Skipping listing {i} due to missing required data")
+                    metrics.incr("scraper_listings_total", result="invalid")
+            metrics.incr("scraper_listings_total", len(page_listings), result="valid")
+            return page_listings
+    
+    product_tiles = find_product_tiles(driver, registry)
+    if not product_tiles:
+        return None
+    
+    logger.debug(f"Starting to scrape {len(product_tiles)} product listings...")
+    page_listings = []
+    
+    # Iterate through each product tile
+    for i, tile in enumerate(product_tiles, 1):
+        try:
+            logger.debug(f"Scraping listing {i} of {len(product_tiles)}...")
+            listing_data = extract_listing_data(tile, registry)
             
-            category_choice = input("Enter the number of the category to scrape (1-4), or enter a full URL [default: 1]: ") or "1"
+            # Validate the listing data before processing further
+            if is_valid_listing(listing_data):
+                page_listings.append(listing_data)
+            else:
+                logger.debug(f"Skipping listing {i} due to missing required data")
+                metrics.incr("scraper_listings_total", result="invalid")
+        except Exception as e:
+            logger.warning(f"Error processing listing {i}: {str(e)}")
+            metrics.incr("scraper_listings_total", result="error")
+            continue
+    
+    metrics.incr("scraper_listings_total", len(page_listings), result="valid")
+    return page_listings
+
+def read_rendered_listing_page(driver, wait_policy, extraction_mode="js", registry=None):
+    """Wait for the loaded listing page's tiles, scroll through it to trigger lazy loading and harvest its listings"""
+    wait_policy.wait_for_tiles(driver, PRODUCT_TILE_SELECTORS)
+    
+    # Scroll down to trigger lazy loading, waiting only while requests are still finishing
+    for _ in range(4):
+        driver.execute_script("window.scrollBy(0, 800);")
+        wait_policy.wait_for_network_idle(driver)
+    
+    with metrics.timer("scraper_tile_extraction_seconds", mode=extraction_mode):
+        return harvest_listing_page(driver, extraction_mode, registry)
+
+def has_next_page_link(driver):
+    """Check the loaded listing page for a rel="next" link or an enabled next page control, without clicking"""
+    if driver.find_elements(By.CSS_SELECTOR, "link[rel='next']"):
+        return True
+    for selector in NEXT_BUTTON_SELECTORS:
+        for button in driver.find_elements(By.CSS_SELECTOR, selector):
+            if button.is_enabled() and "disabled" not in (button.get_attribute("class") or ""):
+                return True
+    return False
+
+class ListingPrefetcher:
+    """Fetches the next few listing pages over HTTP while the current one is processed.
+
+    Listings are read from each page's embedded JSON, like the product fast
+    path. take() returns None for a page that could not be fetched or had no
+    listings, so the caller can load that page in Chrome instead.
+    """
+
+    def __init__(self, http_session, category_url, last_page, wait_policy=None, lookahead=LISTING_PREFETCH_PAGES, archive=None):
+        self.http_session = http_session
+        self.category_url = category_url
+        self.last_page = last_page
+        self.wait_policy = wait_policy or WaitPolicy()
+        self.lookahead = lookahead
+        self.archive = archive
+        self._futures = {}
+        self._executor = ThreadPoolExecutor(max_workers=lookahead, thread_name_prefix="listing-fetch")
+
+    def _fetch(self, page):
+        self.wait_policy.pause()
+        try:
+            return fetch_listing_page(self.http_session, build_page_url(self.category_url, page), archive=self.archive,
+                                      page=page) or None
+        except Exception as e:
+            logger.warning(f"HTTP fetch failed for listing page {page}: {str(e)}")
+            return None
+
+    def schedule(self, current_page):
+        """Start fetching the pages after current_page that are not already in flight"""
+        for page in range(current_page + 1, min(current_page + self.lookahead, self.last_page) + 1):
+            if page not in self._futures:
+                self._futures[page] = self._executor.submit(self._fetch, page)
+
+    def take(self, page):
+        """Return the listings fetched for a page, or None"""
+        future = self._futures.pop(page, None)
+        return future.result() if future is not None else None
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+def fetch_details_over_http(http_session, listings, wait_policy=None, num_threads=HTTP_FETCH_THREADS, archive=None):
+    """Build product records from embedded JSON over HTTP, returning None where that fails"""
+    if wait_policy is None:
+        wait_policy = WaitPolicy()
+    
+    def fetch(listing):
+        wait_policy.pause()
+        return fetch_product_details(http_session, listing, archive=archive)
+    
+    with ThreadPoolExecutor(max_workers=num_threads, thread_name_prefix="http-fetch") as executor:
+        return list(executor.map(fetch, listings))
+
+def scrape_detail_stage(session, detail_pool, listings, wait_policy=None, http_session=None, on_product=None, registry=None,
+                        network_meter=None, archive=None, image_downloader=None):
+    """Scrape product pages for harvested listings and hand each valid result to on_product.
+
+    Listings are consumed in order, either by the worker pool or serially on
+    the given DriverSession, which relaunches its browser and retries the
+    page if the session dies. The listing page is never revisited from here. With an
+    http_session, pages are first fetched without a browser and only the ones
+    whose embedded JSON could not be used are rendered in Chrome. on_product
+    is called with each product, e.g. to save it to the record store, stream
+    it to disk and record it in the index. Product pages rendered on the
+    session's browser are measured by network_meter when one is given, and
+    every product page's HTML is saved to archive when one is given. With an
+    image_downloader, the page's product images are downloaded concurrently
+    before the products reach on_product, so their records carry the files.
+    """
+    results = [None] * len(listings)
+    browser_indexes = list(range(len(listings)))
+    
+    if http_session is not None:
+        browser_indexes = []
+        for i, detailed_product in enumerate(fetch_details_over_http(http_session, listings, wait_policy, archive=archive)):
+            if detailed_product:
+                results[i] = detailed_product
+            else:
+                browser_indexes.append(i)
+        logger.info(f"{len(listings) - len(browser_indexes)} of {len(listings)} product pages extracted over HTTP")
+    
+    browser_listings = [listings[i] for i in browser_indexes]
+    if browser_listings:
+        if detail_pool is not None:
+            logger.info(f"Scraping {len(browser_listings)} product pages with {detail_pool.num_workers} workers...")
+            browser_results = detail_pool.scrape(browser_listings)
         else:
-            category_choice = category_option
+            browser_results = []
+            for listing in browser_listings:
+                browser_results.append(session.run(scrape_product_details, listing["url"], listing["product_id"], listing,
+                                                   wait_policy, registry, archive))
+                if network_meter is not None and not session.dead:
+                    network_meter.measure(session.driver, "product")
+        for i, detailed_product in zip(browser_indexes, browser_results):
+            results[i] = detailed_product
+    
+    details = [detailed_product for detailed_product in results if detailed_product]
+    if image_downloader is not None:
+        image_downloader.download_products(details)
+    if on_product is not None:
+        for detailed_product in details:
+            on_product(detailed_product)
+    return details
+
+def filter_stale_listings(index, listings, max_age_hours):
+    """Drop listings whose products were scraped recently enough to skip"""
+    if index is None:
+        return listings
+    stale_listings = [listing for listing in listings if not index.is_fresh(listing["product_id"], max_age_hours * 3600)]
+    if len(stale_listings) < len(listings):
+        metrics.incr("scraper_products_total", len(listings) - len(stale_listings), method="index", result="skipped", reason="fresh")
+        logger.info(f"Skipping {len(listings) - len(stale_listings)} products scraped in the last {max_age_hours} hours")
+    return stale_listings
+
+def resolve_category(category_option=None, interactive=False):
+    """Return the URL and file name prefix for a category number, name or custom URL.
+
+    Without a category, the user is prompted when interactive and Lighting
+    is used otherwise.
+    """
+    # Use provided category or default to lighting (1)
+    if category_option is None and interactive:
+        print("Available categories:")
+        for key, value in CATEGORY_OPTIONS.items():
+            print(f"{key}. {value['name']}")
         
-        if category_choice in category_options:
-            category_url = category_options[category_choice]["url"]
-            category_name = category_options[category_choice]["name"].lower()
-        else:
-            category_url = category_choice if "://" in category_choice else "https://www.1stdibs.com/furniture/lighting/"
-            category_name = "products"
+        category_choice = input("Enter the number of the category to scrape (1-4), or enter a full URL [default: 1]: ") or "1"
+    else:
+        category_choice = category_option or "1"
+    
+    for key, value in CATEGORY_OPTIONS.items():
+        if category_choice.lower() == value["name"].lower():
+            category_choice = key
+    
+    if category_choice in CATEGORY_OPTIONS:
+        category_url = CATEGORY_OPTIONS[category_choice]["url"]
+        category_name = CATEGORY_OPTIONS[category_choice]["name"].lower()
+    elif "://" in category_choice:
+        category_url = category_choice
+        # Name custom URLs after their last path segment so several can run at once
+        segments = [segment for segment in urlsplit(category_url).path.split("/") if segment]
+        category_name = re.sub(r'[^a-z0-9]+', '-', segments[-1].lower()).strip("-") if segments else "products"
+    else:
+        raise ValueError(f"Unknown category: {category_choice}")
+    return category_url, category_name
+
+def check_policy(policy, name):
+    if policy not in FAILURE_POLICIES:
+        raise ValueError(f"{name} must be one of {', '.join(FAILURE_POLICIES)}")
+
+def browsers_needed(num_workers):
+    """Browsers a selenium-engine crawl holds at once: one for the listing pages plus one per detail worker"""
+    return num_workers + 1 if num_workers > 1 else 1
+
+def check_pool_size(driver_pool, num_workers):
+    if driver_pool.size < browsers_needed(num_workers):
+        raise ValueError(f"driver_pool holds {driver_pool.size} browsers but {num_workers} workers need "
+                         f"{browsers_needed(num_workers)} (one for the listing pages plus one per worker)")
+
+def product_sink(record_store, detailed_writer, index=None, on_record=None):
+    """Return an on_product callback that saves products, streams them to disk, indexes them and passes them to on_record"""
+    def on_product(detailed_product):
+        record_store.put(detailed_product)
+        detailed_writer.write(detailed_product)
+        if index is not None:
+            index.record(detailed_product)
+        if on_record is not None:
+            on_record("product", detailed_product)
+    return on_product
+
+def crawl_result(category_name, category_url):
+    """Return the summary a crawl reports back to its caller"""
+    return {"category": category_name, "url": category_url, "status": "running", "listings": 0, "products": 0, "error": None}
+
+def output_paths(category_name, timestamp):
+    """Return the streamed JSONL paths and the compacted _complete.json paths of a run"""
+    prefix = f'scraped_data/1stdibs_{category_name}'
+    return {
+        "listings": f'{prefix}_listings_{timestamp}.jsonl',
+        "detailed": f'{prefix}_detailed_{timestamp}.jsonl',
+        "listings_complete": f'{prefix}_listings_{timestamp}_complete.json',
+        "detailed_complete": f'{prefix}_detailed_{timestamp}_complete.json',
+        "deltas": f'{prefix}_deltas_{timestamp}.jsonl'
+    }
+
+def write_run_deltas(delta_index, category_url, paths, covered_category):
+    """Compare the run's detailed records with the category's last snapshot and write the changes to the deltas file.
+
+    Removed products are only reported when the crawl covered every listing
+    page of the category, since a partial crawl would make the rest look gone.
+    """
+    present_ids = None
+    if covered_category:
+        present_ids = {listing["product_id"] for listing in iter_jsonl(paths["listings"])}
+    return write_deltas(delta_index, category_url, iter_jsonl(paths["detailed"]), paths["deltas"], present_ids)
+
+def scrape_with_async_engine(category_url, category_name, max_pages=None, crawler=None, wait_policy=None,
+                             index=None, max_age_hours=24, fsync_policy="page", record_store=None, registry=None,
+                             browser_profile=None, driver_pool=None, archive=None, image_downloader=None, delta_index=None,
+                             on_record=None):
+    """Crawl a category with the asyncio HTTP engine, rendering only failed product pages in Chrome.
+
+    Listings and products are saved as soon as the crawler extracts them, so
+    the detailed file is in the order product pages finished.
+    """
+    result = crawl_result(category_name, category_url)
+    crawler = crawler or AsyncCrawler()
+    if archive is not None:
+        crawler.archive = archive
+    record_store = record_store or open_record_store()
+    os.makedirs('scraped_data', exist_ok=True)
+    paths = output_paths(category_name, run_timestamp())
+    listings_writer = JsonlWriter(paths["listings"], fsync_policy, mode="x")
+    detailed_writer = JsonlWriter(paths["detailed"], fsync_policy, mode="x")
+    on_product = product_sink(record_store, detailed_writer, index, on_record)
+    
+    def save_listing(listing):
+        listings_writer.write(listing)
+        if on_record is not None:
+            on_record("listing", listing)
+    
+    def save_product(detailed_product):
+        if image_downloader is not None:
+            image_downloader.download_product(detailed_product)
+        on_product(detailed_product)
+    
+    try:
+        skip_product = None
+        if index is not None:
+            skip_product = lambda listing: index.is_fresh(listing["product_id"], max_age_hours * 3600)
+        missed_pages = crawler.stats["missed_pages"]
+        _, _, failed_listings = asyncio.run(crawler.crawl_category(category_url, max_pages, skip_product, save_listing, save_product))
+        covered_category = max_pages is None and crawler.stats["missed_pages"] == missed_pages
+        
+        if failed_listings:
+            logger.info(f"Rendering {len(failed_listings)} product pages in Chrome...")
+            if driver_pool is not None:
+                session = DriverSession(driver_pool.acquire, driver_pool.discard)
+            else:
+                session = DriverSession(partial(create_driver, browser_profile))
+            try:
+                scrape_detail_stage(session, None, failed_listings, wait_policy, on_product=on_product, registry=registry,
+                                    archive=archive, image_downloader=image_downloader)
+            finally:
+                session.close(release=driver_pool.release if driver_pool is not None else None)
+    finally:
+        listings_writer.close()
+        detailed_writer.close()
+    
+    compact_jsonl(paths["listings"], paths["listings_complete"])
+    compact_jsonl(paths["detailed"], paths["detailed_complete"])
+    if delta_index is not None:
+        result["changes"] = write_run_deltas(delta_index, category_url, paths, covered_category)
+    
+    logger.info(f"Scraping complete.")
+    logger.info(f"{listings_writer.count} total valid product listings scraped.")
+    logger.info(f"{detailed_writer.count} detailed product pages scraped.")
+    logger.info(f"{crawler.stats['requests']} requests, {crawler.stats['retries']} retries, {crawler.stats['failures']} failures")
+    result.update(status="complete", listings=listings_writer.count, products=detailed_writer.count)
+    return result
+
+def scrape_1stdibs(category_option=None, max_pages=None, num_workers=1, harvest_first=False, extraction_mode="js",
+                   wait_policy=None, fast_path=True, engine="selenium", crawler=None,
+                   index_path=DEFAULT_INDEX_PATH, max_age_hours=24, resume=True, fsync_policy="page",
+                   store_backend="sqlite", store_path=None, selector_stats_path=DEFAULT_SELECTOR_STATS_PATH,
+                   browser_profile="full", driver_pool=None, recycle_pages=200, max_rss_mb=2048, session_stats=None,
+                   interactive=False, on_empty_page="stop", on_pagination_error="stop", selector_registry=None,
+                   metrics_path=None, metrics_port=None, archive_path=None, archive=None, download_images=False,
+                   image_dir=DEFAULT_IMAGE_PATH, image_widths=(HERO_IMAGE_WIDTH,), image_downloader=None, delta=False,
+                   delta_path=DEFAULT_DELTA_INDEX_PATH, delta_index=None, on_record=None):
+    """Scrape data from 1stdibs.com
+
+    Each listing page is harvested into plain dicts before any product page is
+    visited. With num_workers > 1, product pages are scraped concurrently by a
+    pool of that many additional Chrome instances. With harvest_first, all
+    listing pages are harvested before the detail stage starts.
+    extraction_mode selects how tiles are read: "js" (one execute_script call
+    per page) or "webdriver" (one find_element call per selector).
+    wait_policy sets readiness timeouts and the politeness delay; a summary of
+    time spent waiting versus working is printed at the end of the run.
+    With fast_path, product records are built from the JSON-LD and server
+    state embedded in the HTML fetched over HTTP, and Chrome renders only the
+    product pages where that fails.
+    engine="async" replaces the page-by-page browser loop with the asyncio
+    HTTP crawler (see async_crawler.AsyncCrawler for rate limit settings).
+    Scraped products are recorded in the SQLite index at index_path, and
+    products scraped within max_age_hours are skipped. With resume, a crawl
+    interrupted on an earlier run continues after its last completed page.
+    Pass index_path=None to disable the index.
+    Listings and products are appended to JSONL files as they are scraped,
+    synced to disk per fsync_policy ("record", "page" or "never"), and
+    compacted into the _complete.json files when the crawl ends.
+    Each product is also saved to the record store selected by store_backend:
+    "sqlite" (one database keyed by product_id) or "files" (one JSON file
+    per product under scraped_data/products).
+    Selector hit rates are loaded from and saved to selector_stats_path, so
+    each field's best selector is tried first; pass None to start fresh, or
+    pass a selector_registry shared with other runs.
+    browser_profile selects the Chrome settings (see browser_profile.py):
+    "full" loads every resource, "lean" runs headless and blocks trackers,
+    fonts and media, and "lean-no-images" also blocks images. Profiles with
+    network stats report requests and bytes per page at the end of the run.
+    With a driver_pool (see driver_pool.DriverPool and shared_pool), browsers
+    are borrowed from the pool and handed back when the run ends instead of
+    being started and quit, and the pool's profile is used. The pool must
+    hold num_workers + 1 browsers (one when num_workers is 1).
+    Every browser is recycled after recycle_pages page loads or once its
+    processes use more than max_rss_mb of memory. A browser whose session
+    dies is relaunched: product pages are retried on the new browser and the
+    listing page is reloaded. Recycles, restarts and retried URLs are counted
+    in session_stats (see driver_pool.SessionStats).
+    Nothing prompts on the console unless interactive is set. on_empty_page
+    and on_pagination_error choose what happens when a listing page has no
+    products or the next page cannot be reached: "ask" (prompt), "skip" (go
+    on to the next page), "stop" (finish the crawl with what was scraped) or
+    "fail" (end the crawl with an error). A summary of the crawl is returned
+    with its status ("complete", "stopped" or "failed") and record counts.
+    Page loads, tile extraction, product pages, record writes, pagination
+    and waits are timed and counted in metrics.metrics. With metrics_port the
+    metrics are served over HTTP (/metrics and /metrics.json) during the
+    crawl; with metrics_path they are written to that file when it ends (JSON
+    for a .json path, Prometheus text otherwise).
+    With archive_path, the HTML of every listing and product page is kept
+    in an html_archive.HtmlArchive there (or pass a shared archive), so
+    records can be re-extracted later with reextract.py.
+    With download_images, each product's hero image is downloaded at every
+    width in image_widths into image_dir (see image_downloader.ImageStore)
+    and its local path and content hash are added to the record; pass an
+    image_downloader to share one between runs.
+    With delta, each product record is normalised and hashed at the end of
+    the crawl and compared with the category's previous run in the
+    delta.DeltaIndex at delta_path (or a shared delta_index). Only new,
+    changed and removed products are written to the _deltas_ JSONL file,
+    price changes are appended to the index's price history, and the counts
+    are returned under "changes". Removals are only reported after a crawl
+    of every listing page from the first.
+    on_record is called with ("listing", listing) for each valid listing and
+    ("product", record) for each detailed record as soon as it is saved (see
+    product_stream.iter_products). The crawl waits while it runs, and an
+    on_record that raises CrawlCancelled ends the crawl with status
+    "cancelled", leaving the checkpoint for a later run to resume from.
+    """
+    logger.info("Starting scraper for 1stdibs products...")
+    check_policy(on_empty_page, "on_empty_page")
+    check_policy(on_pagination_error, "on_pagination_error")
+    if driver_pool is not None and engine != "async":
+        check_pool_size(driver_pool, num_workers)
+    category_url, category_name = resolve_category(category_option, interactive)
+    if wait_policy is None:
+        wait_policy = WaitPolicy()
+    metrics_server = metrics.serve(metrics_port) if metrics_port else None
+    
+    index = ProductIndex(index_path) if index_path else None
+    record_store = open_record_store(store_backend, store_path)
+    registry = selector_registry or SelectorRegistry(selector_stats_path)
+    own_archive = archive is None and archive_path is not None
+    if own_archive:
+        archive = HtmlArchive(archive_path)
+    own_image_downloader = image_downloader is None and download_images
+    if own_image_downloader:
+        image_downloader = ImageDownloader(ImageStore(image_dir), widths=image_widths)
+    own_delta_index = delta_index is None and delta
+    if own_delta_index:
+        delta_index = DeltaIndex(delta_path)
+    result = crawl_result(category_name, category_url)
+    
+    if engine == "async":
+        try:
+            return scrape_with_async_engine(category_url, category_name, max_pages, crawler, wait_policy, index, max_age_hours,
+                                            fsync_policy, record_store, registry, browser_profile, driver_pool, archive,
+                                            image_downloader, delta_index, on_record)
+        except CrawlCancelled:
+            logger.info("Crawl cancelled")
+            result["status"] = "cancelled"
+            return result
+        except Exception as e:
+            logger.error(f"An error occurred: {str(e)}")
+            result.update(status="failed", error=str(e))
+            return result
+        finally:
+            registry.save()
+            record_store.close()
+            if index is not None:
+                index.close()
+            if own_archive:
+                archive.close()
+            if own_image_downloader:
+                image_downloader.close()
+            if own_delta_index:
+                delta_index.close()
+            export_metrics(metrics_path, metrics_server)
+    
+    # Initialize the Chrome WebDriver, borrowing a warm one when there is a pool
+    profile = driver_pool.profile if driver_pool is not None else resolve_profile(browser_profile)
+    network_meter = NetworkMeter() if profile.network_stats else None
+    session_stats = session_stats or SessionStats()
+    if driver_pool is not None:
+        main_session = DriverSession(driver_pool.acquire, driver_pool.discard, recycle_pages, max_rss_mb, session_stats)
+    else:
+        main_session = DriverSession(partial(create_driver, profile), quit_driver, recycle_pages, max_rss_mb, session_stats)
+    driver = main_session.driver
+    detail_pool = None
+    if num_workers > 1:
+        detail_pool = ProductDetailPool(num_workers, partial(create_driver, profile), wait_policy, registry, network_meter,
+                                        driver_pool, recycle_pages, max_rss_mb, session_stats, archive)
+    http_session = create_session(pool_size=HTTP_FETCH_THREADS) if fast_path else None
+    prefetcher = None
+    
+    # Create a directory to store the scraped data
+    os.makedirs('scraped_data', exist_ok=True)
+    
+    # Records are appended as they are scraped, so nothing accumulates in memory
+    paths = output_paths(category_name, run_timestamp())
+    listings_writer = JsonlWriter(paths["listings"], fsync_policy, mode="x")
+    detailed_writer = JsonlWriter(paths["detailed"], fsync_policy, mode="x")
+    on_product = product_sink(record_store, detailed_writer, index, on_record)
+    
+    try:
+        # Pick up an interrupted crawl after its last completed page
+        start_page = 1
+        if index is not None and resume:
+            start_page = index.get_checkpoint(category_url) + 1
+            if start_page > 1:
+                logger.info(f"Resuming crawl of {category_url} from page {start_page}")
         
         # Navigate to the target URL
-        print(f"Navigating to {category_url}")
-        driver.get(category_url)
+        start_url = build_page_url(category_url, start_page)
+        logger.info(f"Navigating to {start_url}")
+        load_page(driver, start_url, "listing")
         
         # Handle cookie consent if it appears
         try:
-            WebDriverWait(driver, 5).until(
-                EC.presence_of_element_located((By.ID, "onetrust-accept-btn-handler"))
-            )
-            cookie_button = driver.find_element(By.ID, "onetrust-accept-btn-handler")
+            cookie_button = wait_policy.wait_for_element(driver, ["#onetrust-accept-btn-handler"], timeout=5, description="cookie consent popup")
             cookie_button.click()
-            print("Cookie consent popup handled.")
+            logger.debug("Cookie consent popup handled.")
         except:
-            print("No cookie consent popup detected or failed to handle it.")
+            logger.debug("No cookie consent popup detected or failed to handle it.")
         
-        # Create directories to store the scraped data
-        os.makedirs('scraped_data', exist_ok=True)
-        os.makedirs('scraped_data/products', exist_ok=True)
-        
-        # Generate a timestamp for the filename
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        
-        # Initialize empty list for all scraped data
-        all_product_listings = []
-        detailed_products = []
-        current_page = 1
+        current_page = start_page
         has_next_page = True
+        listings_written_page = None
+        details_done_page = None
+        restarted_page, page_restarts = None, 0
+        loaded_page = start_page
+        pending_listings = None
+        last_page = None
+        pagination_checked = False
+        next_link_found = False
         
         # Continue scraping while there are more pages and we haven't hit max_pages limit
         while has_next_page and (max_pages is None or current_page <= max_pages):
-            print(f"\n--- Processing Page {current_page} ---")
-            
-            # Add a pause to allow JavaScript to load
-            time.sleep(5)
-            
-            # Scroll down to trigger lazy loading
-            for _ in range(4):
-                driver.execute_script("window.scrollBy(0, 800);")
-                time.sleep(1)
-            
-            # Try several selector patterns to find product listings
-            selectors = [
-                "div[data-tn='item-tile-wrapper']",
-                "div.item-tile-wrapper",
-                "div[data-component='ItemTile']",
-                "li.product-grid-item",
-                "div.productTile",
-                "article.productCard"
-            ]
-            
-            products_found = False
-            product_tiles = []
-            
-            for selector in selectors:
-                try:
-                    print(f"Trying selector: {selector}")
-                    # Check if elements are present
-                    elements = driver.find_elements(By.CSS_SELECTOR, selector)
-                    if elements and len(elements) > 0:
-                        product_tiles = elements
-                        products_found = True
-                        print(f"Found {len(product_tiles)} products with selector: {selector}")
-                        break
-                except Exception as e:
-                    print(f"Error with selector {selector}: {str(e)}")
-            
-            if not products_found:
-                print("Could not find product listings with any of the tried selectors.")
-                # Save page source for debugging
-                with open(f"page_source_page{current_page}.html", "w", encoding="utf-8") as f:
-                    f.write(driver.page_source)
-                
-                # Try to find any relevant HTML structure
-                print("Scanning page for potential product elements...")
-                search_terms = ["product", "item", "tile", "card", "listing"]
-                for term in search_terms:
-                    elements = driver.find_elements(By.XPATH, f"//*[contains(@class, '{term}') or contains(@data-tn, '{term}')]")
-                    if elements and len(elements) > 0:
-                        print(f"Found {len(elements)} potential elements containing '{term}' in class or data attributes")
-                
-                # Ask the user if they want to continue scraping
-                continue_scraping = input(f"No product listings found on page {current_page}. Do you want to continue with manual analysis? (y/n): ")
-                if continue_scraping.lower() != 'y':
-                    print("Scraping terminated by user.")
-                    break
-            
-            # If we have product tiles, proceed with scraping
-            page_listings = []
-            page_details = []
+            # Swap in a fresh browser between pages once this one is worn out
+            if main_session.recycle_if_due():
+                driver = main_session.driver
+                loaded_page = None
+            if prefetcher is not None:
+                prefetcher.schedule(current_page)
             
-            if products_found:
-                print(f"Starting to scrape {len(product_tiles)} product listings...")
+            try:
+                logger.info(f"Processing page {current_page}")
                 
-                # Iterate through each product tile
-                for i, tile in enumerate(product_tiles, 1):
-                    try:
-                        print(f"Scraping listing {i} of {len(product_tiles)}...")
-                        
-                        listing_data = {}
-                        
-                        # Try different selectors for product name
-                        name_selectors = [
-                            "h2", 
-                            "h3", 
-                            "a[data-tn='item-tile-title-anchor']", 
-                            ".title", 
-                            "[data-tn='product-title']"
-                        ]
-                        
-                        product_name = ""
-                        for selector in name_selectors:
-                            try:
-                                name_element = tile.find_element(By.CSS_SELECTOR, selector)
-                                product_name = name_element.text
-                                if product_name:
-                                    break
-                            except:
-                                continue
-                        
-                        listing_data['name'] = product_name
-                        
-                        # Try different selectors for product URL
-                        url_selectors = [
-                            "a[data-tn='item-tile-title-anchor']",
-                            "a[href*='/id-']",
-                            "a.product-link",
-                            "a:first-child"
-                        ]
-                        
-                        product_link = ""
-                        for selector in url_selectors:
-                            try:
-                                link_element = tile.find_element(By.CSS_SELECTOR, selector)
-                                product_link = link_element.get_attribute("href")
-                                if product_link:
-                                    break
-                            except:
-                                continue
-                        
-                        listing_data['url'] = product_link
-                        
-                        # Try different selectors for product image URL
-                        image_selectors = [
-                            "img[data-tn='product-image']",
-                            "img.product-image",
-                            "img:first-child",
-                            "[data-srcset]",
-                            "[srcset]"
-                        ]
-                        
-                        product_image = ""
-                        for selector in image_selectors:
-                            try:
-                                img_element = tile.find_element(By.CSS_SELECTOR, selector)
-                                product_image = img_element.get_attribute("src") or img_element.get_attribute("data-src") or img_element.get_attribute("srcset")
-                                if product_image:
-                                    break
-                            except:
-                                continue
-                        
-                        listing_data['image_url'] = product_image
-                        
-                        # Try different selectors for price
-                        price_selectors = [
-                            "div[data-tn='price']",
-                            ".price",
-                            "[data-tn='product-price']",
-                            "span.money"
-                        ]
-                        
-                        price = ""
-                        for selector in price_selectors:
-                            try:
-                                price_element = tile.find_element(By.CSS_SELECTOR, selector)
-                                price = price_element.text
-                                if price:
-                                    break
-                            except:
-                                continue
-                        
-                        listing_data['price'] = price
-                        
-                        # Try different selectors for creator/brand
-                        creator_selectors = [
-                            "a[data-tn='quick-view-creator-link']",
-                            ".creator",
-                            ".designer",
-                            "[data-tn='product-creator']"
-                        ]
-                        
-                        creator = ""
-                        for selector in creator_selectors:
-                            try:
-                                creator_element = tile.find_element(By.CSS_SELECTOR, selector)
-                                creator = creator_element.text
-                                if creator:
-                                    break
-                            except:
-                                continue
-                        
-                        listing_data['creator'] = creator
+                page_listings = pending_listings
+                if page_listings:
+                    logger.info(f"Read {len(page_listings)} listings from the page's embedded JSON")
+                    metrics.incr("scraper_listing_pages_total", source="http")
+                else:
+                    # Open the page in Chrome unless the browser is already on it
+                    if loaded_page != current_page:
+                        wait_policy.pause()
+                        load_page(driver, build_page_url(category_url, current_page), "listing")
+                        loaded_page = current_page
+                    
+                    page_listings = read_rendered_listing_page(driver, wait_policy, extraction_mode, registry)
+                    if archive is not None:
+                        archive.put(driver.page_source, build_page_url(category_url, current_page), "listing", page=current_page)
+                    products_found = page_listings is not None
+                    metrics.incr("scraper_listing_pages_total", source="browser")
+                    main_session.page_done()
+                    if network_meter is not None:
+                        page_traffic = network_meter.measure(driver, "listing")
+                        if page_traffic:
+                            logger.debug(f"Listing page used {page_traffic['requests']} requests and {page_traffic['bytes'] / 1024:.1f} KB, "
+                                  f"{page_traffic['blocked']} requests blocked")
+                    
+                    if not products_found:
+                        logger.warning("Could not find product listings with any of the tried selectors.")
+                        # Save page source for debugging
+                        with open(f"page_source_page{current_page}.html", "w", encoding="utf-8") as f:
+                            f.write(driver.page_source)
                         
-                        # Extract product_id from URL
-                        product_id = extract_product_id(product_link)
-                        listing_data['product_id'] = product_id
+                        # Try to find any relevant HTML structure
+                        logger.info("Scanning page for potential product elements...")
+                        search_terms = ["product", "item", "tile", "card", "listing"]
+                        for term in search_terms:
+                            elements = driver.find_elements(By.XPATH, f"//*[contains(@class, '{term}') or contains(@data-tn, '{term}')]")
+                            if elements and len(elements) > 0:
+                                logger.info(f"Found {len(elements)} potential elements containing '{term}' in class or data attributes")
                         
-                        # Validate the listing data before processing further
-                        if is_valid_listing(listing_data):
-                            # Add valid listing to the current page data
-                            page_listings.append(listing_data)
-                            
-                            # Visit product page and get detailed information
-                            if product_link and product_id:
-                                # Instead of opening in a new tab, just navigate to the page directly
-                                # and then navigate back to the main page after scraping
-                                current_url = driver.current_url
-                                
-                                # Get detailed product data
-                                detailed_product = scrape_product_details(driver, product_link, product_id, listing_data)
-                                
-                                if detailed_product:
-                                    page_details.append(detailed_product)
-                                    
-                                    # Save individual product file with consistent format
-                                    filename = f"scraped_data/products/product_{product_id}_{datetime.now().strftime('%Y-%m-%dT%H-%M-%S-%f')[:-3]}Z.json"
-                                    with open(filename, 'w', encoding='utf-8') as f:
-                                        json.dump(detailed_product, f, ensure_ascii=False, indent=2)
-                                    print(f"Saved detailed product data to {filename}")
-                                
-                                # Go back to the main listing page
-                                driver.get(current_url)
-                                time.sleep(2)  # Wait for page to load
-                        else:
-                            print(f"Skipping listing {i} due to missing required data")
-                    except Exception as e:
-                        print(f"Error processing listing {i}: {str(e)}")
-                        continue
-            
-            # Add only valid products to all lists
-            all_product_listings.extend(page_listings)
-            detailed_products.extend(page_details)
-            
-            # Save progress after each page
-            with open(f'scraped_data/1stdibs_{category_name}_listings_{timestamp}.json', 'w', encoding='utf-8') as f:
-                json.dump(all_product_listings, f, ensure_ascii=False, indent=4)
+                        policy = on_empty_page
+                        if policy == "ask" and interactive:
+                            # Ask the user if they want to continue scraping
+                            continue_scraping = input(f"No product listings found on page {current_page}. Do you want to continue with manual analysis? (y/n): ")
+                            policy = "skip" if continue_scraping.lower() == 'y' else "stop"
+                        if policy == "fail":
+                            raise CrawlError(f"No product listings found on page {current_page}")
+                        if policy != "skip":
+                            logger.warning(f"No product listings found on page {current_page} - stopping.")
+                            result["status"] = "stopped"
+                            break
+                        page_listings = []
+                    
+                    # The result count on the first page loaded tells how many pages there are
+                    if not pagination_checked:
+                        pagination_checked = True
+                        pagination = parse_pagination(driver.page_source)
+                        if pagination:
+                            last_page = pagination["last_page"] if max_pages is None else min(pagination["last_page"], max_pages)
+                            logger.info(f"{pagination['total_results']} results on {pagination['last_page']} pages")
+                            if http_session is not None and last_page > current_page:
+                                prefetcher = ListingPrefetcher(http_session, category_url, last_page, wait_policy, archive=archive)
+                                prefetcher.schedule(current_page)
+                    
+                    # Without a result count, look for a link to the next page while the browser is still on this one
+                    if last_page is None:
+                        next_link_found = has_next_page_link(driver)
                 
-            with open(f'scraped_data/1stdibs_{category_name}_detailed_{timestamp}.json', 'w', encoding='utf-8') as f:
-                json.dump(detailed_products, f, ensure_ascii=False, indent=4)
-            
-            print(f"Page {current_page} complete. {len(all_product_listings)} total product listings scraped so far.")
-            print(f"{len(detailed_products)} detailed product pages scraped so far.")
-            
-            # If we've reached the max pages limit, stop
-            if max_pages is not None and current_page >= max_pages:
-                print(f"Reached the maximum number of pages ({max_pages}). Stopping.")
-                break
+                # A page retried after a browser crash has already written its listings
+                if listings_written_page != current_page:
+                    for listing_data in page_listings:
+                        listings_writer.write(listing_data)
+                        if on_record is not None:
+                            on_record("listing", listing_data)
+                    listings_written_page = current_page
                 
-            # Check for next page button
-            try:
-                # Scroll to the bottom of the page to make sure pagination is visible
-                driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-                time.sleep(2)
+                # In harvest_first mode product pages are visited after the last page,
+                # reading the listings back from the JSONL file
+                # A page retried after a browser crash has already had its product pages saved
+                if page_listings and not harvest_first and details_done_page != current_page:
+                    stale_listings = filter_stale_listings(index, page_listings, max_age_hours)
+                    scrape_detail_stage(main_session, detail_pool, stale_listings, wait_policy, http_session, on_product, registry,
+                                        network_meter, archive, image_downloader)
+                    details_done_page = current_page
+                    # The browser may have been relaunched or have left the listing page for product pages,
+                    # so the next listing page is always loaded afresh
+                    if main_session.dead:
+                        main_session.restart()
+                    driver = main_session.driver
+                    loaded_page = None
                 
-                next_button = None
+                # Save progress after each page
+                listings_writer.sync()
+                detailed_writer.sync()
                 
-                # Try different ways to find the next button
-                next_button_selectors = [
-                    "button[data-tn='page-forward']",
-                    "a[data-tn='page-forward']",
-                    "button.pagination-next",
-                    "a.pagination-next",
-                    "li.pagination-next > a",
-                    "button[aria-label='Next Page']"
-                ]
+                # Product pages of this page are done, so a rerun can resume after it
+                if index is not None and not harvest_first:
+                    index.set_checkpoint(category_url, current_page)
                 
-                for selector in next_button_selectors:
-                    try:
-                        next_buttons = driver.find_elements(By.CSS_SELECTOR, selector)
-                        for btn in next_buttons:
-                            if btn.is_displayed() and btn.is_enabled():
-                                next_button = btn
-                                break
-                        if next_button:
-                            break
-                    except:
-                        continue
+                logger.info(f"Page {current_page} complete. {listings_writer.count} total product listings scraped so far.")
+                logger.info(f"{detailed_writer.count} detailed product pages scraped so far.")
                 
-                if next_button and not "disabled" in next_button.get_attribute("class"):
-                    print(f"Navigating to page {current_page + 1}...")
+                # If we've reached the max pages limit, stop
+                if max_pages is not None and current_page >= max_pages:
+                    logger.info(f"Reached the maximum number of pages ({max_pages}). Stopping.")
+                    break
+                    
+                # The next page is opened by its URL, so there is nothing to scroll to or click
+                try:
+                    with metrics.timer("scraper_pagination_seconds"):
+                        if last_page is not None:
+                            has_next_page = current_page < last_page
+                        else:
+                            has_next_page = next_link_found
+                        if has_next_page:
+                            current_page += 1
+                            pending_listings = prefetcher.take(current_page) if prefetcher is not None else None
+                            if not pending_listings:
+                                logger.debug(f"Navigating to page {current_page}...")
+                                wait_policy.pause()
+                                load_page(driver, build_page_url(category_url, current_page), "listing")
+                                loaded_page = current_page
+                        else:
+                            logger.info("No more pages available.")
+                except Exception as e:
+                    if is_session_error(e):
+                        raise
+                    logger.warning(f"Error navigating to next page: {str(e)}")
+                    # Save page source for debugging
                     try:
-                        # Try to click normally first
-                        next_button.click()
-                    except (ElementClickInterceptedException, StaleElementReferenceException):
-                        # If normal click fails, try JavaScript click
-                        driver.execute_script("arguments[0].click();", next_button)
+                        with open(f"pagination_error_page{current_page}.html", "w", encoding="utf-8") as f:
+                            f.write(driver.page_source)
+                    except:
+                        logger.warning("Could not save error page source.")
                     
-                    current_page += 1
-                    time.sleep(3)  # Wait for page to load
-                else:
-                    print("No more pages available.")
-                    has_next_page = False
+                    policy = on_pagination_error
+                    if policy == "ask" and interactive:
+                        # Ask if user wants to continue or stop
+                        continue_scraping = input("Error navigating to next page. Do you want to stop scraping? (y/n): ")
+                        policy = "stop" if continue_scraping.lower() == 'y' else "skip"
+                    if policy == "fail":
+                        raise CrawlError(f"Could not navigate past page {current_page}: {str(e)}")
+                    pending_listings = None
+                    if policy == "skip":
+                        current_page += 1
+                    else:
+                        has_next_page = False
+                        result["status"] = "stopped"
+            
             except Exception as e:
-                print(f"Error navigating to next page: {str(e)}")
-                # Save page source for debugging
-                try:
-                    with open(f"pagination_error_page{current_page}.html", "w", encoding="utf-8") as f:
-                        f.write(driver.page_source)
-                except:
-                    print("Could not save error page source.")
-                
-                # Ask if user wants to continue or stop
-                continue_scraping = input("Error navigating to next page. Do you want to stop scraping? (y/n): ")
-                if continue_scraping.lower() == 'y':
-                    has_next_page = False
-                else:
-                    current_page += 1
+                # A dead browser is relaunched and the page retried; anything else is fatal
+                if restarted_page != current_page:
+                    restarted_page, page_restarts = current_page, 0
+                if not is_session_error(e) or page_restarts >= PAGE_SESSION_RETRIES:
+                    raise
+                page_restarts += 1
+                logger.warning(f"Browser session died on page {current_page} - relaunching and retrying the page")
+                main_session.restart()
+                driver = main_session.driver
+                loaded_page = None
+        
+        # Detail stage for listings harvested from every page, streamed back in batches
+        if harvest_first and listings_writer.count:
+            logger.info(f"Scraping {listings_writer.count} product pages")
+            for batch in iter_batches(iter_jsonl(paths["listings"]), DETAIL_BATCH_SIZE):
+                scrape_detail_stage(main_session, detail_pool, filter_stale_listings(index, batch, max_age_hours), wait_policy,
+                                    http_session, on_product, registry, network_meter, archive, image_downloader)
+                detailed_writer.sync()
         
         # Final save of all data
-        with open(f'scraped_data/1stdibs_{category_name}_listings_{timestamp}_complete.json', 'w', encoding='utf-8') as f:
-            json.dump(all_product_listings, f, ensure_ascii=False, indent=4)
-            
-        with open(f'scraped_data/1stdibs_{category_name}_detailed_{timestamp}_complete.json', 'w', encoding='utf-8') as f:
-            json.dump(detailed_products, f, ensure_ascii=False, indent=4)
+        listings_writer.close()
+        detailed_writer.close()
+        compact_jsonl(paths["listings"], paths["listings_complete"])
+        compact_jsonl(paths["detailed"], paths["detailed_complete"])
+        
+        # The crawl finished, so the next run starts from the first page again
+        if index is not None:
+            index.clear_checkpoint(category_url)
+        
+        # Only a crawl from the first page to the last shows which products are gone
+        if delta_index is not None:
+            covered_category = start_page == 1 and not has_next_page and result["status"] == "running"
+            result["changes"] = write_run_deltas(delta_index, category_url, paths, covered_category)
         
-        print(f"Scraping complete.")
-        print(f"{len(all_product_listings)} total valid product listings scraped.")
-        print(f"{len(detailed_products)} detailed product pages scraped.")
-        print(f"Basic listing data saved to scraped_data/1stdibs_{category_name}_listings_{timestamp}_complete.json")
-        print(f"Detailed product data saved to scraped_data/1stdibs_{category_name}_detailed_{timestamp}_complete.json")
-        print(f"Individual product files saved in scraped_data/products/ directory")
+        logger.info(f"Scraping complete.")
+        logger.info(f"{listings_writer.count} total valid product listings scraped.")
+        logger.info(f"{detailed_writer.count} detailed product pages scraped.")
+        logger.info(f"Basic listing data saved to {paths['listings_complete']}")
+        logger.info(f"Detailed product data saved to {paths['detailed_complete']}")
+        logger.info(f"Product records saved to {record_store.path}")
+        logger.info(wait_policy.summary())
+        logger.info(registry.report())
+        if network_meter is not None:
+            logger.info(network_meter.summary())
+        logger.info(session_stats.summary())
+        if result["status"] == "running":
+            result["status"] = "complete"
         
-        # Ask the user if they want to close the browser
-        close_browser = input("Do you want to close the browser? (y/n): ")
-        if close_browser.lower() == 'y':
-            driver.quit()
-            print("Browser closed.")
+        # A pooled browser is handed back for the next job instead
+        if driver_pool is not None:
+            logger.info("Browser returned to the pool.")
+        elif not interactive:
+            main_session.close()
+            logger.info("Browser closed.")
         else:
-            print("Browser left open. Remember to close it manually when you're done.")
+            # Ask the user if they want to close the browser
+            close_browser = input("Do you want to close the browser? (y/n): ")
+            if close_browser.lower() == 'y':
+                main_session.close()
+                logger.info("Browser closed.")
+            else:
+                logger.info("Browser left open. Remember to close it manually when you're done.")
     
-    except InvalidSessionIdException:
-        print("Browser session became invalid. The scraper will now exit.")
+    except CrawlCancelled:
+        logger.info(f"Crawl cancelled after {listings_writer.count} listings and {detailed_writer.count} products")
+        result["status"] = "cancelled"
+        if driver_pool is None:
+            main_session.close()
+    except InvalidSessionIdException as e:
+        logger.error("Browser session became invalid and could not be recovered. The scraper will now exit.")
+        result.update(status="failed", error=str(e))
+        if driver_pool is None:
+            main_session.close()
     except Exception as e:
-        print(f"An error occurred: {str(e)}")
+        logger.error(f"An error occurred: {str(e)}")
+        result.update(status="failed", error=str(e))
         # Save page source for debugging
         try:
             with open("error_page_source.html", "w", encoding="utf-8") as f:
-                f.write(driver.page_source)
-            driver.quit()
+                f.write(main_session.driver.page_source)
+            if driver_pool is None:
+                main_session.close()
         except:
-            print("Could not save error page or close driver.")
+            logger.warning("Could not save error page or close driver.")
+    finally:
+        if prefetcher is not None:
+            prefetcher.close()
+        if driver_pool is not None:
+            main_session.close(release=driver_pool.release)
+        listings_writer.close()
+        detailed_writer.close()
+        record_store.close()
+        registry.save()
+        if detail_pool is not None:
+            detail_pool.close()
+        if http_session is not None:
+            http_session.close()
+        if index is not None:
+            index.close()
+        if own_archive:
+            archive.close()
+        if own_image_downloader:
+            image_downloader.close()
+        if own_delta_index:
+            delta_index.close()
+        export_metrics(metrics_path, metrics_server)
+        result.update(listings=listings_writer.count, products=detailed_writer.count)
+    return result
 
 if __name__ == "__main__":
+    configure_logging()
     # Default to category 1 (Lighting) and limit to 2 pages for testing
     scrape_1stdibs(category_option="1", max_pages=2)
\ No newline at end of file
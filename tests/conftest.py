@@ -0,0 +1,14 @@
+import os
+import sys
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The scraper's modules sit at the top of the repository rather than in a package
+sys.path.insert(0, ROOT)
+
+@pytest.fixture(scope="session")
+def listing_page_html():
+    """The saved listing page, page_source.html"""
+    with open(os.path.join(ROOT, "page_source.html"), encoding="utf-8") as f:
+        return f.read()
@@ -0,0 +1,152 @@
+import asyncio
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from async_crawler import AsyncCrawler, HostLimiter, TokenBucket
+
+class StubServer(ThreadingHTTPServer):
+    """Serves scripted responses per path: a list of (status, headers) used in order, the last one repeating"""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), StubHandler)
+        self.responses = {}
+        self.delay = 0.0
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    def url(self, path):
+        return f"http://127.0.0.1:{self.server_port}{path}"
+
+class StubHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append((self.path, time.monotonic()))
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+            script = server.responses.get(self.path, [(200, {})])
+            status, headers = script.pop(0) if len(script) > 1 else script[0]
+        try:
+            time.sleep(server.delay)
+            body = f"<html>{self.path}</html>".encode()
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+@pytest.fixture
+def server():
+    stub = StubServer()
+    thread = threading.Thread(target=stub.serve_forever, daemon=True)
+    thread.start()
+    yield stub
+    stub.shutdown()
+    stub.server_close()
+
+def request_times(server, path):
+    return [at for requested, at in server.requests if requested == path]
+
+def test_fetch_retries_server_errors_with_backoff(server):
+    server.responses["/page"] = [(503, {}), (502, {}), (200, {})]
+    crawler = AsyncCrawler(requests_per_second=100, backoff_base=0.1, max_retries=4)
+    assert asyncio.run(crawler.fetch(server.url("/page"))) == "<html>/page</html>"
+    assert crawler.stats["retries"] == 2
+    assert crawler.stats["statuses"] == {503: 1, 502: 1, 200: 1}
+    first, second, third = request_times(server, "/page")
+    # 0.1s then 0.2s, each with up to 25% jitter
+    assert second - first >= 0.1
+    assert third - second >= 0.2
+
+def test_fetch_honours_retry_after(server):
+    server.responses["/throttled"] = [(429, {"Retry-After": "0.5"}), (200, {})]
+    crawler = AsyncCrawler(requests_per_second=100, backoff_base=0.01)
+    assert asyncio.run(crawler.fetch(server.url("/throttled"))) is not None
+    first, second = request_times(server, "/throttled")
+    assert second - first >= 0.5
+
+def test_throttled_host_pauses_other_requests(server):
+    server.responses["/throttled"] = [(429, {"Retry-After": "0.5"}), (200, {})]
+    crawler = AsyncCrawler(requests_per_second=100, backoff_base=0.01)
+
+    async def crawl():
+        throttled = asyncio.ensure_future(crawler.fetch(server.url("/throttled")))
+        await asyncio.sleep(0.1)
+        await crawler.fetch(server.url("/other"))
+        await throttled
+
+    asyncio.run(crawl())
+    throttled_at = request_times(server, "/throttled")[0]
+    (other_at,) = request_times(server, "/other")
+    assert other_at - throttled_at >= 0.5
+
+def test_fetch_gives_up_on_client_errors(server):
+    server.responses["/missing"] = [(404, {})]
+    crawler = AsyncCrawler(requests_per_second=100, backoff_base=0.01)
+    assert asyncio.run(crawler.fetch(server.url("/missing"))) is None
+    assert crawler.stats["requests"] == 1
+    assert crawler.stats["failures"] == 1
+
+def test_fetch_gives_up_after_max_retries(server):
+    server.responses["/down"] = [(503, {})]
+    crawler = AsyncCrawler(requests_per_second=100, backoff_base=0.01, max_retries=2)
+    assert asyncio.run(crawler.fetch(server.url("/down"))) is None
+    assert crawler.stats["requests"] == 3
+    assert crawler.stats["retries"] == 2
+
+def test_host_limiter_caps_requests_in_flight(server):
+    server.delay = 0.1
+    crawler = AsyncCrawler(max_concurrency_per_host=2, requests_per_second=100, burst=100)
+
+    async def crawl():
+        return await asyncio.gather(*(crawler.fetch(server.url(f"/page/{i}")) for i in range(8)))
+
+    assert all(asyncio.run(crawl()))
+    assert server.max_in_flight == 2
+
+def test_host_limiter_waits_out_a_pause():
+    limiter = HostLimiter(max_concurrency=1, requests_per_second=100)
+
+    async def enter():
+        limiter.pause(0.3)
+        started = time.monotonic()
+        async with limiter:
+            return time.monotonic() - started
+
+    assert asyncio.run(enter()) >= 0.3
+
+def test_token_bucket_limits_rate():
+    bucket = TokenBucket(rate=10, capacity=1)
+
+    async def take(count):
+        started = time.monotonic()
+        for _ in range(count):
+            await bucket.acquire()
+        return time.monotonic() - started
+
+    # The first token is already in the bucket; the other five take 0.1s each
+    assert asyncio.run(take(6)) >= 0.45
+
+def test_token_bucket_allows_bursts():
+    bucket = TokenBucket(rate=1, capacity=5)
+
+    async def take(count):
+        started = time.monotonic()
+        for _ in range(count):
+            await bucket.acquire()
+        return time.monotonic() - started
+
+    assert asyncio.run(take(5)) < 0.1
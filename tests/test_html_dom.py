@@ -0,0 +1,38 @@
+import pytest
+import html_dom
+from html_dom import HtmlPage, LxmlPage
+from selenium_base import harvest_listing_page
+
+# The address page_source.html was saved from
+SAVED_LISTING_URL = 'https://www.1stdibs.com/furniture/lighting/'
+
+TEXT_HTML = """<html><body><div id="tile">
+  <h2>Brass   Lamp</h2><span>CA$1,059</span> / item
+  <div data-tn="quick-view-panel"><a class="creator">Studio</a></div>
+  <p style="display: none">Hidden</p><p>Shown<br>twice</p>
+</div></body></html>"""
+
+@pytest.fixture(params=["lxml", "html.parser"])
+def page_class(request):
+    if request.param == "lxml":
+        if html_dom.lxml is None:
+            pytest.skip("lxml is not installed")
+        return LxmlPage
+    return HtmlPage
+
+def test_text_is_the_visible_text(page_class):
+    tile = page_class(TEXT_HTML).find_element("css selector", "#tile")
+    assert tile.text == "Brass Lamp\nCA$1,059 / item\nShown\ntwice"
+    assert tile.find_element("css selector", "a.creator").text == ""
+    assert not tile.find_element("css selector", "a.creator").is_displayed()
+
+def test_relative_urls_are_resolved(page_class):
+    page = page_class('<a href="/id-f_1/">Lamp</a>', "https://www.1stdibs.com/furniture/")
+    assert page.find_element("css selector", "a").get_attribute("href") == "https://www.1stdibs.com/id-f_1/"
+
+def test_backends_read_the_same_listings(listing_page_html):
+    if html_dom.lxml is None:
+        pytest.skip("lxml is not installed")
+    fallback = harvest_listing_page(HtmlPage(listing_page_html, SAVED_LISTING_URL), "webdriver")
+    assert len(fallback) == 58
+    assert harvest_listing_page(LxmlPage(listing_page_html, SAVED_LISTING_URL), "webdriver") == fallback
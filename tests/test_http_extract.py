@@ -0,0 +1,39 @@
+from html_dom import parse_page
+from http_extract import build_page_url, extract_listings_from_html, parse_pagination, parse_price
+from product_records import is_valid_listing
+from selenium_base import harvest_listing_page
+
+# The address page_source.html was saved from
+SAVED_LISTING_URL = 'https://www.1stdibs.com/furniture/lighting/'
+
+def test_listings_on_saved_page(listing_page_html):
+    listings = extract_listings_from_html(listing_page_html)
+    assert len(listings) == 58
+    assert len({listing["product_id"] for listing in listings}) == 58
+    assert all(is_valid_listing(listing) for listing in listings)
+    assert listings[0]["product_id"] == "f_44114872"
+    assert listings[0]["price"] == "CA$1,059"
+
+def test_listings_match_the_rendered_tiles(listing_page_html):
+    rendered = harvest_listing_page(parse_page(listing_page_html, SAVED_LISTING_URL), "webdriver")
+    assert extract_listings_from_html(listing_page_html) == rendered
+
+def test_pagination_on_saved_page(listing_page_html):
+    pagination = parse_pagination(listing_page_html)
+    assert pagination == {"page_size": 58, "total_results": 163933, "last_page": 50}
+
+def test_pagination_without_search_state():
+    assert parse_pagination("<html><body>No results</body></html>") is None
+
+def test_build_page_url_replaces_page():
+    assert build_page_url("https://example.com/lighting/?sort=new&page=3", 5) == "https://example.com/lighting/?sort=new&page=5"
+    assert build_page_url("https://example.com/lighting/?page=3", 1) == "https://example.com/lighting/"
+
+def test_parse_price_reads_either_decimal_separator():
+    assert parse_price("1.200,50 €") == (1200.5, "EUR", False, None)
+    assert parse_price("€1.200,50")[0] == 1200.5
+    assert parse_price("$72,001.31")[0] == 72001.31
+    assert parse_price("€12,5")[0] == 12.5
+    assert parse_price("CA$1,059 / item") == (1059.0, "CAD", False, "item")
+    assert parse_price("DKK 35.000")[0] == 35000.0
+    assert parse_price("$1,000,000")[0] == 1000000.0
@@ -0,0 +1,119 @@
+import logging
+import threading
+import time
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.common.exceptions import TimeoutException
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Returns the tile count for the first selector that matches anything
+COUNT_TILES_SCRIPT = """
+for (const selector of arguments[0]) {
+    const count = document.querySelectorAll(selector).length;
+    if (count) {
+        return count;
+    }
+}
+return 0;
+"""
+
+# Reports load state and the number of finished resource requests. The timing
+# buffer is enlarged so the count keeps growing on resource-heavy pages.
+NETWORK_ACTIVITY_SCRIPT = """
+performance.setResourceTimingBufferSize(100000);
+return [document.readyState, performance.getEntriesByType('resource').length];
+"""
+
+class WaitPolicy:
+    """Readiness waits with per-stage timeouts and wait/work time accounting.
+
+    Every wait polls a WebDriverWait condition and returns as soon as the page
+    is ready, so a fast page costs far less than a fixed sleep. Time spent in
+    waits and politeness delays is summed across all threads using the policy.
+    """
+
+    def __init__(self, listing_timeout=15, product_timeout=10, network_idle_timeout=5,
+                 poll_frequency=0.25, stable_polls=2, politeness_delay=1.0):
+        self.listing_timeout = listing_timeout
+        self.product_timeout = product_timeout
+        self.network_idle_timeout = network_idle_timeout
+        self.poll_frequency = poll_frequency
+        self.stable_polls = stable_polls
+        self.politeness_delay = politeness_delay
+        self.waiting_seconds = 0.0
+        self.politeness_seconds = 0.0
+        self.started_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _until(self, driver, timeout, condition, description):
+        start = time.monotonic()
+        try:
+            return WebDriverWait(driver, timeout, poll_frequency=self.poll_frequency).until(condition)
+        except TimeoutException:
+            logger.debug(f"Timed out after {timeout}s waiting for {description}")
+            metrics.incr("scraper_wait_timeouts_total", wait=description)
+            return False
+        finally:
+            elapsed = time.monotonic() - start
+            metrics.observe("scraper_wait_seconds", elapsed, wait=description)
+            with self._lock:
+                self.waiting_seconds += elapsed
+
+    def _stable(self, probe):
+        """Condition that is met once probe returns the same truthy value for stable_polls polls"""
+        state = {"last": None, "repeats": 0}
+
+        def condition(driver):
+            value = probe(driver)
+            if value and value == state["last"]:
+                state["repeats"] += 1
+            else:
+                state["last"] = value
+                state["repeats"] = 0
+            return value if state["repeats"] >= self.stable_polls else False
+
+        return condition
+
+    def wait_for_tiles(self, driver, tile_selectors, timeout=None):
+        """Wait until product tiles are present and their count has stopped changing"""
+        probe = lambda d: d.execute_script(COUNT_TILES_SCRIPT, tile_selectors)
+        return self._until(driver, timeout or self.listing_timeout, self._stable(probe), "product tiles")
+
+    def wait_for_network_idle(self, driver, timeout=None):
+        """Wait until the document has loaded and no new resources have finished for a few polls"""
+        def probe(d):
+            ready_state, resource_count = d.execute_script(NETWORK_ACTIVITY_SCRIPT)
+            return [ready_state, resource_count] if ready_state == "complete" else None
+
+        return self._until(driver, timeout or self.network_idle_timeout, self._stable(probe), "network idle")
+
+    def wait_for_element(self, driver, selectors, timeout=None, description="element"):
+        """Wait for the first of the CSS selectors to be present and return the element"""
+        def condition(d):
+            for selector in selectors:
+                elements = d.find_elements(By.CSS_SELECTOR, selector)
+                if elements:
+                    return elements[0]
+            return False
+
+        return self._until(driver, timeout or self.product_timeout, condition, description) or None
+
+    def pause(self):
+        """Sleep for the politeness delay between requests to the site"""
+        if self.politeness_delay > 0:
+            time.sleep(self.politeness_delay)
+            with self._lock:
+                self.politeness_seconds += self.politeness_delay
+
+    def summary(self):
+        """Describe how much of the run was spent waiting rather than working"""
+        elapsed = time.monotonic() - self.started_at
+        with self._lock:
+            waiting = self.waiting_seconds
+            politeness = self.politeness_seconds
+        working = max(elapsed - waiting - politeness, 0.0)
+        return (f"Run took {elapsed:.1f}s: {waiting:.1f}s waiting for pages, "
+                f"{politeness:.1f}s in politeness delays, {working:.1f}s working "
+                f"(waits are summed across workers)")
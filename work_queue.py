@@ -0,0 +1,297 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUEUE_PATH = 'scraped_data/work_queue.sqlite'
+
+# Seconds a leased item stays invisible to other workers unless its lease is extended
+DEFAULT_LEASE_SECONDS = 120
+
+# Leases of an item before it is given up on and marked failed
+DEFAULT_MAX_ATTEMPTS = 3
+
+# Lower numbers are leased first: listing pages fan out into product pages
+KIND_PRIORITIES = {"listing": 0, "product": 1}
+
+ITEM_STATUSES = ("pending", "leased", "done", "failed")
+
+class SqliteWorkQueue:
+    """Crawl work items shared by any number of worker processes through one SQLite database.
+
+    Each item has a unique key, so queueing the same page twice is a no-op.
+    lease() hands items to a worker for lease_seconds, during which no other
+    worker sees them; heartbeat() extends the lease while the work runs and
+    ack() or fail() ends it. An item whose lease expires, because its worker
+    died or hung, is leased again by the next worker to ask, until it has
+    been leased max_attempts times. Leases are taken in a BEGIN IMMEDIATE
+    transaction, so two processes never get the same item.
+
+    WAL needs shared memory and only works between processes on one machine.
+    For a database on a network filesystem shared by several machines, pass
+    journal_mode="DELETE".
+    """
+
+    def __init__(self, path=DEFAULT_QUEUE_PATH, max_attempts=DEFAULT_MAX_ATTEMPTS, journal_mode="WAL", busy_timeout=30):
+        self.path = path
+        self.max_attempts = max_attempts
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        # Transactions are opened explicitly, so lease() can take the write lock before reading
+        self._conn = sqlite3.connect(path, timeout=busy_timeout, isolation_level=None, check_same_thread=False)
+        self._conn.execute(f"PRAGMA journal_mode={journal_mode}")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS items (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                key TEXT NOT NULL UNIQUE,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                priority INTEGER NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                worker TEXT,
+                lease_expires REAL,
+                updated_at REAL NOT NULL,
+                error TEXT
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS items_status ON items (status, priority, id)")
+
+    @contextmanager
+    def _write(self):
+        """Hold the lock and a BEGIN IMMEDIATE transaction, which waits for other processes' writes to finish"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def put(self, kind, key, payload):
+        """Queue a work item unless one with the same key exists, returning True if it was added"""
+        return self.put_many([(kind, key, payload)]) == 1
+
+    def put_many(self, items):
+        """Queue (kind, key, payload) items in one transaction, skipping known keys; returns the number added"""
+        rows = [(key, kind, json.dumps(payload, ensure_ascii=False), KIND_PRIORITIES.get(kind, 1), time.time())
+                for kind, key, payload in items]
+        if not rows:
+            return 0
+        with self._write():
+            before = self._conn.total_changes
+            self._conn.executemany("INSERT OR IGNORE INTO items (key, kind, payload, priority, updated_at) VALUES (?, ?, ?, ?, ?)", rows)
+            return self._conn.total_changes - before
+
+    def lease(self, worker_id, limit=1, lease_seconds=DEFAULT_LEASE_SECONDS):
+        """Lease up to limit pending or expired items to worker_id, returning them as dicts"""
+        now = time.time()
+        with self._write():
+            # Items whose last lease ran out after their final attempt are given up on
+            given_up = self._conn.execute(
+                "UPDATE items SET status = 'failed', error = 'lease expired', worker = NULL, updated_at = ? "
+                "WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?", (now, now, self.max_attempts)
+            ).rowcount
+            rows = self._conn.execute(
+                "SELECT id, key, kind, payload, attempts, status FROM items "
+                "WHERE status = 'pending' OR (status = 'leased' AND lease_expires < ?) ORDER BY priority, id LIMIT ?",
+                (now, limit)
+            ).fetchall()
+            self._conn.executemany(
+                "UPDATE items SET status = 'leased', worker = ?, lease_expires = ?, attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                [(worker_id, now + lease_seconds, now, row[0]) for row in rows]
+            )
+        if given_up:
+            metrics.incr("scraper_queue_items_total", given_up, event="failed")
+        reclaimed = sum(1 for row in rows if row[5] == "leased")
+        if reclaimed:
+            logger.info(f"Reclaimed {reclaimed} items whose lease expired")
+            metrics.incr("scraper_queue_items_total", reclaimed, event="expired")
+        metrics.incr("scraper_queue_items_total", len(rows), event="leased")
+        return [{"id": item_id, "key": key, "kind": kind, "payload": json.loads(payload), "attempts": attempts + 1}
+                for item_id, key, kind, payload, attempts, _ in rows]
+
+    def heartbeat(self, item_ids, worker_id, lease_seconds=DEFAULT_LEASE_SECONDS):
+        """Extend worker_id's leases on item_ids, returning how many it still held"""
+        now = time.time()
+        with self._write():
+            cursor = self._conn.executemany(
+                "UPDATE items SET lease_expires = ?, updated_at = ? WHERE id = ? AND worker = ? AND status = 'leased'",
+                [(now + lease_seconds, now, item_id, worker_id) for item_id in item_ids]
+            )
+        return cursor.rowcount
+
+    def ack(self, item_id, worker_id):
+        """Mark a leased item done; returns False if the lease had already passed to another worker"""
+        now = time.time()
+        with self._write():
+            cursor = self._conn.execute(
+                "UPDATE items SET status = 'done', lease_expires = NULL, updated_at = ? WHERE id = ? AND worker = ? AND status = 'leased'",
+                (now, item_id, worker_id)
+            )
+        acked = cursor.rowcount == 1
+        metrics.incr("scraper_queue_items_total", event="acked" if acked else "lost")
+        return acked
+
+    def fail(self, item_id, worker_id, error=None):
+        """Give a leased item back for another attempt, or mark it failed once it has used max_attempts"""
+        now = time.time()
+        with self._write():
+            row = self._conn.execute("SELECT attempts FROM items WHERE id = ? AND worker = ? AND status = 'leased'",
+                                     (item_id, worker_id)).fetchone()
+            if row is None:
+                return
+            status = "failed" if row[0] >= self.max_attempts else "pending"
+            self._conn.execute("UPDATE items SET status = ?, worker = NULL, lease_expires = NULL, error = ?, updated_at = ? WHERE id = ?",
+                               (status, error, now, item_id))
+        metrics.incr("scraper_queue_items_total", event="failed" if status == "failed" else "retried")
+
+    def retry_failed(self):
+        """Put every failed item back in the queue with a fresh set of attempts, returning how many"""
+        with self._write():
+            cursor = self._conn.execute(
+                "UPDATE items SET status = 'pending', attempts = 0, error = NULL, updated_at = ? WHERE status = 'failed'",
+                (time.time(),)
+            )
+        return cursor.rowcount
+
+    def counts(self):
+        """Count items per kind and status"""
+        with self._lock:
+            rows = self._conn.execute("SELECT kind, status, COUNT(*) FROM items GROUP BY kind, status").fetchall()
+        counts = {}
+        for kind, status, count in rows:
+            counts.setdefault(kind, dict.fromkeys(ITEM_STATUSES, 0))[status] = count
+        return counts
+
+    def is_drained(self):
+        """Check that nothing is pending or leased, so no worker can add more work"""
+        with self._lock:
+            row = self._conn.execute("SELECT 1 FROM items WHERE status IN ('pending', 'leased') LIMIT 1").fetchone()
+        return row is None
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+class MemoryWorkQueue:
+    """The SqliteWorkQueue interface in memory, for worker threads in one process and for trying out workers locally"""
+
+    def __init__(self, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        self.path = None
+        self.max_attempts = max_attempts
+        self._items = {}
+        self._keys = set()
+        self._next_id = 1
+        self._lock = threading.Lock()
+
+    def put(self, kind, key, payload):
+        return self.put_many([(kind, key, payload)]) == 1
+
+    def put_many(self, items):
+        added = 0
+        with self._lock:
+            for kind, key, payload in items:
+                if key in self._keys:
+                    continue
+                self._keys.add(key)
+                self._items[self._next_id] = {
+                    "id": self._next_id, "key": key, "kind": kind, "payload": json.loads(json.dumps(payload)),
+                    "priority": KIND_PRIORITIES.get(kind, 1), "status": "pending", "attempts": 0, "worker": None,
+                    "lease_expires": None, "error": None
+                }
+                self._next_id += 1
+                added += 1
+        return added
+
+    def lease(self, worker_id, limit=1, lease_seconds=DEFAULT_LEASE_SECONDS):
+        now = time.time()
+        leased = []
+        with self._lock:
+            expired = [item for item in self._items.values() if item["status"] == "leased" and item["lease_expires"] < now]
+            for item in expired:
+                if item["attempts"] >= self.max_attempts:
+                    item.update(status="failed", error="lease expired", worker=None)
+                    metrics.incr("scraper_queue_items_total", event="failed")
+                else:
+                    metrics.incr("scraper_queue_items_total", event="expired")
+            available = [item for item in self._items.values()
+                         if item["status"] == "pending" or (item["status"] == "leased" and item["lease_expires"] < now)]
+            for item in sorted(available, key=lambda item: (item["priority"], item["id"]))[:limit]:
+                item.update(status="leased", worker=worker_id, lease_expires=now + lease_seconds, attempts=item["attempts"] + 1)
+                leased.append({key: item[key] for key in ("id", "key", "kind", "payload", "attempts")})
+        metrics.incr("scraper_queue_items_total", len(leased), event="leased")
+        return leased
+
+    def _held(self, item_id, worker_id):
+        item = self._items.get(item_id)
+        return item if item and item["status"] == "leased" and item["worker"] == worker_id else None
+
+    def heartbeat(self, item_ids, worker_id, lease_seconds=DEFAULT_LEASE_SECONDS):
+        held = 0
+        with self._lock:
+            for item_id in item_ids:
+                item = self._held(item_id, worker_id)
+                if item is not None:
+                    item["lease_expires"] = time.time() + lease_seconds
+                    held += 1
+        return held
+
+    def ack(self, item_id, worker_id):
+        with self._lock:
+            item = self._held(item_id, worker_id)
+            if item is not None:
+                item.update(status="done", lease_expires=None)
+        metrics.incr("scraper_queue_items_total", event="acked" if item is not None else "lost")
+        return item is not None
+
+    def fail(self, item_id, worker_id, error=None):
+        with self._lock:
+            item = self._held(item_id, worker_id)
+            if item is None:
+                return
+            item.update(status="failed" if item["attempts"] >= self.max_attempts else "pending", worker=None,
+                        lease_expires=None, error=error)
+        metrics.incr("scraper_queue_items_total", event="failed" if item["status"] == "failed" else "retried")
+
+    def retry_failed(self):
+        with self._lock:
+            failed = [item for item in self._items.values() if item["status"] == "failed"]
+            for item in failed:
+                item.update(status="pending", attempts=0, error=None)
+        return len(failed)
+
+    def counts(self):
+        counts = {}
+        with self._lock:
+            for item in self._items.values():
+                counts.setdefault(item["kind"], dict.fromkeys(ITEM_STATUSES, 0))[item["status"]] += 1
+        return counts
+
+    def is_drained(self):
+        with self._lock:
+            return not any(item["status"] in ("pending", "leased") for item in self._items.values())
+
+    def close(self):
+        pass
+
+WORK_QUEUES = {
+    "sqlite": SqliteWorkQueue,
+    "memory": MemoryWorkQueue
+}
+
+def open_work_queue(backend="sqlite", path=None, **options):
+    """Open a work queue by backend name ("sqlite" or "memory"); path is the sqlite backend's database"""
+    if backend not in WORK_QUEUES:
+        raise ValueError(f"Unknown work queue backend: {backend}")
+    if backend == "sqlite":
+        return SqliteWorkQueue(path or DEFAULT_QUEUE_PATH, **options)
+    return WORK_QUEUES[backend](**options)